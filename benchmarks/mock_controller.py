@@ -0,0 +1,759 @@
+#!/usr/bin/env python
+
+"""
+Local stand-in for the Prisma SASE controller, used to benchmark manage_sase_connection.py
+without a live tenant. Serves a synthetic tenant of configurable size over plain HTTP,
+with injectable latency, throttling (429) and server errors (503).
+
+Run standalone:
+    ./mock_controller.py --port 8080 --sites 500
+and point the script at it with:
+    export PRISMASASE_CONTROLLER=http://127.0.0.1:8080
+    export PRISMASASE_AUTH_URL=http://127.0.0.1:8080/auth/v1/oauth2/access_token
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+##############################################################################
+# Global dicts & variables
+##############################################################################
+TENANT_ID = "1000000000000000001"
+TSG_ID = "1000000001"
+TOKEN_EXPIRES_IN = 900
+
+# Synthetic tenant defaults
+SITES = 100
+ELEMENTS = 2
+INTERFACES = 8
+CIRCUITS = 2
+LOCATIONS = 40
+LOCATIONS_PER_REGION = 4
+WANNETWORKS = 20
+ZONES = 5
+QOS_PROFILES = 3
+PADDING = 256
+# Seconds until the tunnels of a new or updated SASE Connection come up (0.5x to 1.5x per tunnel)
+PROVISION_TIME = 2.0
+
+# Object ID prefixes, so every synthetic ID is unique and encodes its parent indexes
+SITE_ID = "11"
+ELEMENT_ID = "12"
+INTERFACE_ID = "13"
+SWI_ID = "14"
+WANNETWORK_ID = "15"
+ZONE_ID = "16"
+OBJECT_ID = "17"
+
+SDWAN_PATH = re.compile(r"^/sdwan/v[0-9.]+/api(/.*)?$")
+TENANCY_PATH = re.compile(r"^/tenancy/v1/tenant_service_groups/([0-9]+)/operations/list_children$")
+
+
+##############################################################################
+# Synthetic Tenant
+# Sites are generated up front. Elements, interfaces and WAN interfaces are
+# derived from the site and element indexes encoded in their IDs, so large
+# tenants cost little memory. Objects created through the API are kept in
+# dicts so GETs reflect them.
+##############################################################################
+def make_id(prefix, *indexes):
+    return prefix + "".join(["{:06d}".format(index) for index in indexes])
+
+
+def parse_id(prefix, object_id, count):
+    """
+    Indexes encoded in a synthetic ID, or None if it is not one of ours
+    """
+    if object_id is None or not object_id.startswith(prefix) or len(object_id) != len(prefix) + 6 * count:
+        return None
+    body = object_id[len(prefix):]
+    if not body.isdigit():
+        return None
+    return [int(body[position:position + 6]) for position in range(0, len(body), 6)]
+
+
+def coordinates(count):
+    """
+    Deterministic (latitude, longitude) spread over the globe
+    """
+    return (count * 37) % 120 - 60 + 0.5, (count * 73) % 360 - 180 + 0.5
+
+
+class MockTenant(object):
+    def __init__(self, sites=SITES, elements=ELEMENTS, interfaces=INTERFACES, circuits=CIRCUITS,
+                 locations=LOCATIONS, wannetworks=WANNETWORKS, zones=ZONES, padding=PADDING,
+                 provision_time=PROVISION_TIME):
+        self.site_count = sites
+        self.provision_time = provision_time
+        self.element_count = elements
+        self.interface_count = interfaces
+        self.circuit_count = circuits
+        self.padding = "x" * padding
+        self.lock = threading.Lock()
+        # Generated objects were last updated when the tenant was created, unless changed by touch()
+        self.created_at = int(time.time() * 1e6)
+        self.changes = {}
+        # Generated objects deleted by remove_circuits()
+        self.removed = set()
+
+        self.locations = []
+        for count in range(locations):
+            latitude, longitude = coordinates(count)
+            self.locations.append({
+                "value": "loc-{}".format(count),
+                "display": "Location {}".format(count),
+                "aggregate_region": "region-{}".format(count // LOCATIONS_PER_REGION),
+                "continent": "Continent {}".format(count // (LOCATIONS_PER_REGION * 4)),
+                "latitude": latitude,
+                "longitude": longitude,
+                "region": "region-{}".format(count // LOCATIONS_PER_REGION)
+            })
+
+        self.bandwidth_allocations = []
+        for region in dict.fromkeys([location["aggregate_region"] for location in self.locations]):
+            self.bandwidth_allocations.append({
+                "name": region,
+                "allocated_bandwidth": 1000,
+                "spn_name_list": ["{}-spn-1".format(region), "{}-spn-2".format(region)],
+                "qos": {"enabled": False}
+            })
+
+        self.qos_profiles = []
+        for count in range(QOS_PROFILES):
+            self.qos_profiles.append({
+                "id": str(uuid.UUID(int=count + 1)),
+                "name": "default" if count == 0 else "qos-profile-{}".format(count),
+                "snippet": "default" if count == 0 else "Remote Networks",
+                "folder": "Remote Networks"
+            })
+
+        self.sites = [self.site(count) for count in range(sites)]
+        self.wannetworks = [{
+            "id": make_id(WANNETWORK_ID, count),
+            "name": "WAN Network {}".format(count),
+            "type": "publicwan",
+            "description": self.padding
+        } for count in range(wannetworks)]
+        self.zones = [{"id": make_id(ZONE_ID, count), "name": "Zone {}".format(count),
+                       "_updated_on_utc": self.created_at} for count in range(zones)]
+
+        # Objects created through the API: ID -> object
+        self.connections = {}
+        self.elementsecurityzones = {}
+        self.object_count = 0
+
+    def updated(self, item):
+        """
+        Generated object with the changes made to it by touch()
+        """
+        return dict(item, **self.changes.get(item["id"], {"_updated_on_utc": self.created_at}))
+
+    def touch(self, count):
+        """
+        Change the first count sites with their elements, interfaces and circuits, as an admin would
+        """
+        for site in self.sites[:count]:
+            for item in [site] + self.elements(site["id"]) + (self.waninterfaces(site["id"]) or []) + \
+                    [intf for elem in self.elements(site["id"]) for intf in self.interfaces(site["id"], elem["id"])]:
+                with self.lock:
+                    self.changes[item["id"]] = {"description": "changed", "_updated_on_utc": int(time.time() * 1e6)}
+            site.update(self.changes[site["id"]])
+
+    def add_sites(self, count):
+        """
+        Create count new sites with their elements, interfaces and circuits, as an admin onboarding branches would
+        """
+        with self.lock:
+            for number in range(self.site_count, self.site_count + count):
+                site = self.site(number)
+                site["_updated_on_utc"] = int(time.time() * 1e6)
+                self.sites.append(site)
+            self.site_count += count
+
+    def remove_circuits(self, count):
+        """
+        Delete the last circuit of the first count sites, as an admin would
+        """
+        with self.lock:
+            for site in self.sites[:count]:
+                indexes = parse_id(SITE_ID, site["id"], 1)
+                self.removed.add(make_id(SWI_ID, indexes[0], self.circuit_count - 1))
+
+    def site(self, count):
+        latitude, longitude = coordinates(count + 1000)
+        return {
+            "id": make_id(SITE_ID, count),
+            "name": "Site {}".format(count),
+            "element_cluster_role": "SPOKE",
+            "admin_state": "active",
+            "address": {"city": "City {}".format(count), "country": "Country"},
+            "location": {"description": None, "latitude": latitude, "longitude": longitude},
+            "description": self.padding,
+            "tags": [],
+            "_updated_on_utc": self.created_at
+        }
+
+    def elements(self, site_id):
+        indexes = parse_id(SITE_ID, site_id, 1)
+        if indexes is None or indexes[0] >= self.site_count:
+            return []
+        return [self.updated({
+            "id": make_id(ELEMENT_ID, indexes[0], count),
+            "name": "Site {} Element {}".format(indexes[0], count),
+            "site_id": site_id,
+            "role": "SPOKE",
+            "model_name": "ion 3200",
+            "description": self.padding
+        }) for count in range(self.element_count)]
+
+    def waninterfaces(self, site_id):
+        indexes = parse_id(SITE_ID, site_id, 1)
+        if indexes is None or indexes[0] >= self.site_count:
+            return None
+        swis = []
+        for count in range(self.circuit_count):
+            if make_id(SWI_ID, indexes[0], count) in self.removed:
+                continue
+            swis.append(self.updated({
+                "id": make_id(SWI_ID, indexes[0], count),
+                # Every other circuit is unnamed and shown by its WAN network name
+                "name": "Circuit {}".format(count) if count % 2 == 0 else None,
+                "type": "publicwan",
+                "network_id": self.wannetworks[count % len(self.wannetworks)]["id"],
+                "site_id": site_id,
+                "link_bw_down": 50 * (1 + (indexes[0] + count) % 4),
+                "link_bw_up": 25 * (1 + (indexes[0] + count) % 4),
+                "description": self.padding
+            }))
+        return swis
+
+    def interfaces(self, site_id, element_id):
+        indexes = parse_id(ELEMENT_ID, element_id, 2)
+        if indexes is None or make_id(SITE_ID, indexes[0]) != site_id or indexes[0] >= self.site_count \
+                or indexes[1] >= self.element_count:
+            return None
+        interfaces = []
+        for count in range(self.interface_count):
+            interfaces.append(self.updated({
+                "id": make_id(INTERFACE_ID, indexes[0], indexes[1], count),
+                "name": str(count + 1),
+                "type": "port",
+                "site_id": site_id,
+                "element_id": element_id,
+                "tags": [],
+                # The first ports carry the site circuits
+                "site_wan_interface_ids": [make_id(SWI_ID, indexes[0], count)] if count < self.circuit_count else None,
+                "description": self.padding
+            }))
+        interfaces.append(self.updated({
+            "id": make_id(INTERFACE_ID, indexes[0], indexes[1], self.interface_count),
+            "name": "servicelink-1",
+            "type": "service_link",
+            "site_id": site_id,
+            "element_id": element_id,
+            "tags": ["AUTO_PA_SDWAN_MANAGED"],
+            "site_wan_interface_ids": None,
+            "description": self.padding
+        }))
+        return interfaces
+
+    def connection_status(self, connection_id):
+        """
+        Tunnels come up a while after the connection was last written
+        """
+        connection = self.connections.get(connection_id, None)
+        if connection is None:
+            return None
+        elapsed = time.time() - connection["_updated_on_utc"] / 1e6
+        rns = []
+        for rn in connection.get("remote_network_groups", None) or []:
+            tunnels = []
+            for tunnel in rn.get("ipsec_tunnels", None) or []:
+                delay = self.provision_time * (0.5 + (zlib.crc32(tunnel["wan_interface_id"].encode("utf-8")) % 100) / 100.0)
+                tunnels.append({"name": tunnel["name"], "wan_interface_id": tunnel["wan_interface_id"],
+                                "status": "up" if elapsed >= delay else "down"})
+            rns.append({"name": rn["name"], "ipsec_tunnels": tunnels})
+        up = all(tunnel["status"] == "up" for rn in rns for tunnel in rn["ipsec_tunnels"])
+        # Removing the last tunnels also takes a while
+        if not any(rn["ipsec_tunnels"] for rn in rns) and elapsed < self.provision_time:
+            up = False
+        return {"id": connection_id, "site_id": connection["site_id"], "state": "active" if up else "provisioning",
+                "remote_network_groups": rns}
+
+    def create(self, store, item):
+        with self.lock:
+            self.object_count += 1
+            item = dict(item, id=make_id(OBJECT_ID, self.object_count),
+                        _etag=1, _created_on_utc=int(time.time() * 1e6), _updated_on_utc=int(time.time() * 1e6))
+            store[item["id"]] = item
+        return item
+
+    def update(self, store, object_id, item):
+        with self.lock:
+            current = store.get(object_id, None)
+            if current is None:
+                return None
+            item = dict(item, id=object_id, _etag=current.get("_etag", 0) + 1,
+                        _created_on_utc=current.get("_created_on_utc"), _updated_on_utc=int(time.time() * 1e6))
+            store[object_id] = item
+        return item
+
+    def delete(self, store, object_id):
+        with self.lock:
+            return store.pop(object_id, None)
+
+
+def filter_items(items, query_params):
+    """
+    Apply {"field": {"in": [...]}} / {"field": {"eq": value}} / {"field": {"gt": value}} query filters
+    """
+    for field, condition in (query_params or {}).items():
+        if isinstance(condition, dict) and "in" in condition:
+            values = set(condition["in"])
+            items = [item for item in items if item.get(field, None) in values]
+        elif isinstance(condition, dict) and "eq" in condition:
+            items = [item for item in items if item.get(field, None) == condition["eq"]]
+        elif isinstance(condition, dict) and "gt" in condition:
+            items = [item for item in items if item.get(field, None) is not None and item[field] > condition["gt"]]
+    return items
+
+
+##############################################################################
+# HTTP Server
+##############################################################################
+class MockController(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, tenant, latency=0.0, jitter=0.0, error_rate=0.0, throttle_rate=0.0, seed=0,
+                 children=0, child_factory=MockTenant):
+        ThreadingHTTPServer.__init__(self, address, MockRequestHandler)
+        self.tenant = tenant
+        # Child TSGs of TSG_ID, each with its own tenant created on first use
+        self.child_tsg_ids = [str(int(TSG_ID) + 100 + count) for count in range(children)]
+        self.child_factory = child_factory
+        self.child_tenants = {}
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def url(self):
+        return "http://{}:{}".format(*self.server_address[:2])
+
+    def reset_stats(self):
+        with self.lock:
+            self.calls = {}
+            self.injected = 0
+
+    def stats(self):
+        with self.lock:
+            endpoints = [{"method": method, "endpoint": endpoint, "count": count}
+                         for (method, endpoint), count in sorted(self.calls.items())]
+            return {
+                "calls": sum(self.calls.values()),
+                "injected_errors": self.injected,
+                "endpoints": endpoints
+            }
+
+    def tenant_for(self, tsg_id):
+        """
+        Tenant of a TSG, or None if the TSG does not exist
+        """
+        if tsg_id == TSG_ID:
+            return self.tenant
+        if tsg_id not in self.child_tsg_ids:
+            return None
+        with self.lock:
+            if tsg_id not in self.child_tenants:
+                self.child_tenants[tsg_id] = self.child_factory()
+            return self.child_tenants[tsg_id]
+
+    def record(self, method, endpoint):
+        with self.lock:
+            self.calls[(method, endpoint)] = self.calls.get((method, endpoint), 0) + 1
+
+    def inject(self):
+        """
+        Status code of an injected failure for this request, or None
+        """
+        with self.lock:
+            roll = self.random.random()
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            status = None
+            if roll < self.throttle_rate:
+                status = 429
+            elif roll < self.throttle_rate + self.error_rate:
+                status = 503
+            if status is not None:
+                self.injected += 1
+
+        if delay > 0:
+            time.sleep(delay)
+        return status
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        return
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_PUT(self):
+        self.handle_request("PUT")
+
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+
+    def send_json(self, status, document, headers=None):
+        body = json.dumps(document).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, message, headers=None):
+        self.send_json(status, {"_error": [{"code": "MOCK_{}".format(status), "message": message}]}, headers)
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length", 0) or 0)
+        if length == 0:
+            return None
+        body = self.rfile.read(length)
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            return json.loads(body.decode("utf-8"))
+        return parse_qs(body.decode("utf-8"))
+
+    def handle_request(self, method):
+        url = urlsplit(self.path)
+        body = self.read_body()
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        route = self.route(method, url.path)
+        if route is None:
+            self.server.record(method, url.path)
+            self.send_error_json(404, "No such endpoint: {} {}".format(method, url.path))
+            return
+
+        endpoint, handler, args = route
+        self.server.record(method, endpoint)
+
+        status = self.server.inject()
+        if status == 429:
+            self.send_error_json(429, "Too many requests", headers={"Retry-After": "1"})
+            return
+        if status is not None:
+            self.send_error_json(status, "Service unavailable")
+            return
+
+        if endpoint == "/auth/v1/oauth2/access_token":
+            tenant = self.server.tenant
+        else:
+            # Access tokens are "mock-<tsg_id>-<random>"
+            token = self.headers.get("Authorization", "")
+            if not token.startswith("Bearer mock-"):
+                self.send_error_json(401, "Invalid or missing access token")
+                return
+            tenant = self.server.tenant_for(token[len("Bearer mock-"):].split("-", 1)[0])
+            if tenant is None:
+                self.send_error_json(403, "Access denied for this TSG")
+                return
+
+        if endpoint.startswith("/tenancy/"):
+            args = [self.server.child_tsg_ids if args[0] == TSG_ID else []]
+
+        result = handler(tenant, body, params, *args)
+        if result is None:
+            self.send_error_json(404, "Not found")
+            return
+
+        self.send_json(200, result)
+
+    def route(self, method, path):
+        """
+        (endpoint template, handler, path arguments) for a request, or None
+        """
+        if path in SSE_ROUTES.get(method, {}):
+            return path, SSE_ROUTES[method][path], []
+
+        match = TENANCY_PATH.match(path)
+        if match is not None and method == "GET":
+            return "/tenancy/v1/tenant_service_groups/{id}/operations/list_children", list_children, [match.group(1)]
+
+        match = SDWAN_PATH.match(path)
+        if match is None:
+            return None
+
+        resource = match.group(1) or ""
+        for pattern, handler in SDWAN_ROUTES.get(method, []):
+            resource_match = re.match("^{}$".format(pattern), resource)
+            if resource_match is not None:
+                endpoint = "/sdwan/api" + re.sub(r"\([^)]*\)", "{id}", pattern)
+                return endpoint, handler, list(resource_match.groups())
+
+        return None
+
+
+##############################################################################
+# Endpoint Handlers
+# handler(tenant, body, query string params, *path arguments) -> JSON document
+# or None for 404
+##############################################################################
+def page_offset(items, params):
+    """
+    SSE config list paging (offset/limit)
+    """
+    offset = int(params.get("offset", 0))
+    limit = int(params.get("limit", 200))
+    return {"data": items[offset:offset + limit], "offset": offset, "limit": limit, "total": len(items)}
+
+
+def page_query(items, body):
+    """
+    SD-WAN query paging (dest_page/limit)
+    """
+    body = body or {}
+    items = filter_items(items, body.get("query_params", None))
+    limit = int(body.get("limit", 0) or len(items) or 1)
+    dest_page = int(body.get("dest_page", 1) or 1)
+    start = (dest_page - 1) * limit
+    return {"items": items[start:start + limit], "total_count": len(items), "count": len(items[start:start + limit])}
+
+
+def access_token(tenant, body, params):
+    scope = (body or {}).get("scope", ["tsg_id:{}".format(TSG_ID)])[-1]
+    tsg_id = scope.split("tsg_id:", 1)[-1].split()[0]
+    return {"access_token": "mock-{}-{}".format(tsg_id, uuid.uuid4().hex), "token_type": "Bearer",
+            "expires_in": TOKEN_EXPIRES_IN, "scope": "tsg_id:{} email profile".format(tsg_id)}
+
+
+def list_children(tenant, body, params, child_tsg_ids):
+    return {"count": len(child_tsg_ids),
+            "items": [{"id": tsg_id, "display_name": "Child Tenant {}".format(tsg_id), "parent_id": TSG_ID}
+                      for tsg_id in child_tsg_ids]}
+
+
+def profile(tenant, body, params):
+    return {"id": "1000000000000000002", "tenant_id": TENANT_ID, "email": "bench@example.com",
+            "roles": [{"name": "super"}], "token_session": False}
+
+
+def tenants(tenant, body, params):
+    return {"id": TENANT_ID, "name": "Benchmark Tenant", "telemetry_region": "americas", "is_esp": False,
+            "address": None}
+
+
+def locations(tenant, body, params):
+    return tenant.locations
+
+
+def sites_query(tenant, body, params):
+    return page_query(tenant.sites, body)
+
+
+def elements_query(tenant, body, params):
+    query_params = (body or {}).get("query_params", {}) or {}
+    site_ids = query_params.get("site_id", {}).get("in", None)
+    if site_ids is None:
+        site_ids = [site["id"] for site in tenant.sites]
+    return page_query([elem for sid in site_ids for elem in tenant.elements(sid)], body)
+
+
+def interfaces_query(tenant, body, params):
+    query_params = (body or {}).get("query_params", {}) or {}
+    element_ids = query_params.get("element_id", {}).get("in", None)
+    if element_ids is None:
+        element_ids = [elem["id"] for site in tenant.sites for elem in tenant.elements(site["id"])]
+    items = []
+    for element_id in element_ids:
+        indexes = parse_id(ELEMENT_ID, element_id, 2)
+        if indexes is not None:
+            items.extend(tenant.interfaces(make_id(SITE_ID, indexes[0]), element_id) or [])
+    return page_query(items, body)
+
+
+def waninterfaces_query(tenant, body, params):
+    query_params = (body or {}).get("query_params", {}) or {}
+    swi_ids = query_params.get("id", {}).get("in", None)
+    if swi_ids is None:
+        site_ids = [site["id"] for site in tenant.sites]
+    else:
+        site_ids = [make_id(SITE_ID, indexes[0]) for indexes in
+                    [parse_id(SWI_ID, swi_id, 2) for swi_id in swi_ids] if indexes is not None]
+    items = [swi for site_id in dict.fromkeys(site_ids) for swi in tenant.waninterfaces(site_id) or []]
+    return page_query(items, body)
+
+
+def interfaces(tenant, body, params, site_id, element_id):
+    items = tenant.interfaces(site_id, element_id)
+    return None if items is None else {"items": items}
+
+
+def waninterfaces(tenant, body, params, site_id):
+    items = tenant.waninterfaces(site_id)
+    return None if items is None else {"items": items}
+
+
+def connections(tenant, site_id):
+    return [item for item in tenant.connections.values() if item["site_id"] == site_id]
+
+
+def create_connection(tenant, body, params, site_id):
+    return tenant.create(tenant.connections, dict(body or {}, site_id=site_id))
+
+
+def update_connection(tenant, body, params, site_id, connection_id):
+    return tenant.update(tenant.connections, connection_id, dict(body or {}, site_id=site_id))
+
+
+def element_zones(tenant, site_id, element_id):
+    return [item for item in tenant.elementsecurityzones.values()
+            if item["site_id"] == site_id and item["element_id"] == element_id]
+
+
+def create_element_zone(tenant, body, params, site_id, element_id):
+    return tenant.create(tenant.elementsecurityzones, dict(body or {}, site_id=site_id, element_id=element_id))
+
+
+def update_element_zone(tenant, body, params, site_id, element_id, zone_binding_id):
+    return tenant.update(tenant.elementsecurityzones, zone_binding_id,
+                         dict(body or {}, site_id=site_id, element_id=element_id))
+
+
+SSE_ROUTES = {
+    "GET": {
+        "/sse/config/v1/locations": locations,
+        "/sse/config/v1/bandwidth-allocations": lambda tenant, body, params: page_offset(tenant.bandwidth_allocations, params),
+        "/sse/config/v1/qos-profiles": lambda tenant, body, params: page_offset(tenant.qos_profiles, params)
+    },
+    "POST": {
+        "/auth/v1/oauth2/access_token": access_token
+    }
+}
+
+# SD-WAN resource path (after /sdwan/<version>/api) patterns per method
+SDWAN_ROUTES = {
+    "GET": [
+        ("", tenants),
+        ("/profile", profile),
+        ("/sites", lambda tenant, body, params: {"items": tenant.sites}),
+        ("/securityzones", lambda tenant, body, params: {"items": tenant.zones}),
+        ("/wannetworks", lambda tenant, body, params: {"items": tenant.wannetworks}),
+        ("/sites/([0-9]+)/waninterfaces", waninterfaces),
+        ("/sites/([0-9]+)/elements/([0-9]+)/interfaces", interfaces),
+        ("/sites/([0-9]+)/elements/([0-9]+)/securityzones",
+         lambda tenant, body, params, sid, eid: {"items": element_zones(tenant, sid, eid)}),
+        ("/sites/([0-9]+)/prismasase_connections",
+         lambda tenant, body, params, sid: {"items": connections(tenant, sid)}),
+        ("/sites/([0-9]+)/prismasase_connections/([0-9]+)",
+         lambda tenant, body, params, sid, cid: tenant.connections.get(cid, None)),
+        ("/sites/([0-9]+)/prismasase_connections/([0-9]+)/status",
+         lambda tenant, body, params, sid, cid: tenant.connection_status(cid))
+    ],
+    "POST": [
+        ("/sites/query", sites_query),
+        ("/elements/query", elements_query),
+        ("/interfaces/query", interfaces_query),
+        ("/waninterfaces/query", waninterfaces_query),
+        ("/prismasase_connections/query",
+         lambda tenant, body, params: page_query(list(tenant.connections.values()), body)),
+        ("/wannetworks/query", lambda tenant, body, params: page_query(tenant.wannetworks, body)),
+        ("/securityzones/query", lambda tenant, body, params: page_query(tenant.zones, body)),
+        ("/elementsecurityzones/query",
+         lambda tenant, body, params: page_query(list(tenant.elementsecurityzones.values()), body)),
+        ("/sites/([0-9]+)/elements/([0-9]+)/securityzones", create_element_zone),
+        ("/sites/([0-9]+)/prismasase_connections", create_connection)
+    ],
+    "PUT": [
+        ("/sites/([0-9]+)/elements/([0-9]+)/securityzones/([0-9]+)", update_element_zone),
+        ("/sites/([0-9]+)/prismasase_connections/([0-9]+)", update_connection)
+    ],
+    "DELETE": [
+        ("/sites/([0-9]+)/elements/([0-9]+)/securityzones/([0-9]+)",
+         lambda tenant, body, params, sid, eid, zbid: tenant.delete(tenant.elementsecurityzones, zbid)),
+        ("/sites/([0-9]+)/prismasase_connections/([0-9]+)",
+         lambda tenant, body, params, sid, cid: tenant.delete(tenant.connections, cid))
+    ]
+}
+
+
+def add_tenant_arguments(parser):
+    group = parser.add_argument_group('Tenant', 'Size of the synthetic tenant')
+    group.add_argument("--sites", help="Number of sites. Default: {}".format(SITES), type=int, default=SITES)
+    group.add_argument("--elements", help="Elements per site. Default: {}".format(ELEMENTS), type=int, default=ELEMENTS)
+    group.add_argument("--interfaces", help="Interfaces per element. Default: {}".format(INTERFACES), type=int, default=INTERFACES)
+    group.add_argument("--circuits", help="Circuits (Site WAN Interfaces) per site. Default: {}".format(CIRCUITS), type=int, default=CIRCUITS)
+    group.add_argument("--locations", help="PA Locations. Default: {}".format(LOCATIONS), type=int, default=LOCATIONS)
+    group.add_argument("--wannetworks", help="WAN networks. Default: {}".format(WANNETWORKS), type=int, default=WANNETWORKS)
+    group.add_argument("--padding", help="Filler bytes per object, to approximate real payload sizes. Default: {}".format(PADDING), type=int, default=PADDING)
+    group.add_argument("--provision_time", help="Seconds for SASE Connection tunnels to come up. Default: {}".format(PROVISION_TIME), type=float, default=PROVISION_TIME)
+    group.add_argument("--children", help="Child TSGs of the tenant (MSP), each a copy of it. Default: 0", type=int, default=0)
+
+    group = parser.add_argument_group('Faults', 'Latency and failures injected into every request')
+    group.add_argument("--latency", help="Latency added to every request, in ms. Default: 0", type=float, default=0.0)
+    group.add_argument("--jitter", help="Random extra latency of up to this many ms. Default: 0", type=float, default=0.0)
+    group.add_argument("--error_rate", help="Fraction of requests failing with 503. Default: 0", type=float, default=0.0)
+    group.add_argument("--throttle_rate", help="Fraction of requests throttled with 429. Default: 0", type=float, default=0.0)
+    group.add_argument("--seed", help="Seed for injected faults. Default: 0", type=int, default=0)
+    return parser
+
+
+def create_tenant(args):
+    return MockTenant(sites=args["sites"], elements=args["elements"], interfaces=args["interfaces"],
+                      circuits=max(1, args["circuits"]), locations=max(1, args["locations"]),
+                      wannetworks=max(1, args["wannetworks"]), padding=max(0, args["padding"]),
+                      provision_time=max(0.0, args["provision_time"]))
+
+
+def create_controller(args, host="127.0.0.1", port=0):
+    return MockController((host, port), create_tenant(args), latency=args["latency"] / 1000.0,
+                          jitter=args["jitter"] / 1000.0, error_rate=args["error_rate"],
+                          throttle_rate=args["throttle_rate"], seed=args["seed"],
+                          children=max(0, args["children"]), child_factory=lambda: create_tenant(args))
+
+
+def go():
+    parser = argparse.ArgumentParser(description="Mock Prisma SASE controller for benchmarks.")
+    parser.add_argument("--host", help="Listen address. Default: 127.0.0.1", default="127.0.0.1")
+    parser.add_argument("--port", "-P", help="Listen port. Default: 8080", type=int, default=8080)
+    add_tenant_arguments(parser)
+    args = vars(parser.parse_args())
+
+    controller = create_controller(args, host=args["host"], port=args["port"])
+    print("INFO: Mock controller listening on {}".format(controller.url))
+    print("export PRISMASASE_CONTROLLER={}".format(controller.url))
+    print("export PRISMASASE_AUTH_URL={}/auth/v1/oauth2/access_token".format(controller.url))
+    sys.stdout.flush()
+    try:
+        controller.serve_forever()
+    except KeyboardInterrupt:
+        print("\nAPI calls: {}".format(json.dumps(controller.stats(), indent=2)))
+
+
+if __name__ == "__main__":
+    go()
@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+
+"""
+Benchmark manage_sase_connection.py against the local mock controller.
+Each scenario runs the script in a subprocess with an empty home directory
+(cold cache) and reports wall time, API calls and peak RSS.
+
+    ./run_benchmarks.py --sites 500 --latency 50 --repeat 3 --output results.json
+    ./run_benchmarks.py --baseline results.json    # exit 1 on regression
+    ./run_benchmarks.py --warm --age 1000 --changed_sites 5 --scenarios inventory_all_spokes    # incremental sync
+"""
+import argparse
+import csv
+import json
+import os
+import shlex
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import mock_controller
+
+##############################################################################
+# Global dicts & variables
+##############################################################################
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "manage_sase_connection.py")
+REPEAT = 1
+BATCH_SITES = 20
+# Allowed wall time increase over the baseline before a scenario counts as a regression
+TOLERANCE = 0.25
+
+SETTINGS = '''PRISMASASE_CLIENT_ID="bench@1000000001.iam.panserviceaccount.com"
+PRISMASASE_CLIENT_SECRET="bench-secret"
+PRISMASASE_TSG_ID="{}"
+'''.format(mock_controller.TSG_ID)
+
+
+def scenarios(tenant, batch_sites):
+    """
+    Scenario name -> script arguments
+    """
+    site = tenant.sites[0]["name"]
+    location = tenant.locations[0]["value"]
+    zone = tenant.zones[0]["name"]
+    return {
+        "list_palocations": ["-A", "list_palocations"],
+        "config_saseconn": ["-A", "config_saseconn", "-S", site, "-PL", location],
+        "bind_zone": ["-A", "bind_zone", "-S", site, "-Z", zone],
+        "bind_zone_all_spokes": ["-A", "bind_zone", "-S", "ALL_SPOKES", "-Z", zone, "-W", "8"],
+        "config_saseconn_batch": ["-A", "config_saseconn", "-M", "{manifest}", "-W", "8"],
+        "config_saseconn_wait": ["-A", "config_saseconn", "-S", site, "-PL", location, "--wait"],
+        "inventory_all_spokes": ["-A", "inventory", "-S", "ALL_SPOKES", "-W", "8"],
+    }
+
+
+def write_manifest(filename, tenant, batch_sites):
+    with open(filename, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["site", "circuits", "pa_location"])
+        for count, site in enumerate(tenant.sites[:batch_sites]):
+            writer.writerow([site["name"], "ALL", tenant.locations[count % len(tenant.locations)]["value"]])
+
+
+def age_cache(home, seconds):
+    """
+    Move the translation cache of a warm run seconds into the past, as if the run had been that long ago
+    """
+    connection = sqlite3.connect(os.path.join(home, ".manage_sase_connection", "cache.db"))
+    try:
+        with connection:
+            connection.execute("UPDATE cache_resources SET fetched_at=fetched_at-?", (seconds,))
+            connection.execute("UPDATE cache_sync SET started_at=started_at-?", (seconds,))
+    finally:
+        connection.close()
+
+
+def run_script(workdir, home, controller, args):
+    """
+    Run the script once. Returns wall time, peak RSS (MB), exit status and output.
+    """
+    env = dict(os.environ,
+               HOME=home,
+               PRISMASASE_CONTROLLER=controller.url,
+               PRISMASASE_AUTH_URL="{}/auth/v1/oauth2/access_token".format(controller.url),
+               PYTHONDONTWRITEBYTECODE="1")
+
+    with tempfile.TemporaryFile() as output:
+        start = time.time()
+        proc = subprocess.Popen([sys.executable, os.path.join(workdir, "manage_sase_connection.py")] + args,
+                                cwd=workdir, env=env, stdout=output, stderr=subprocess.STDOUT)
+        # wait4() gives the resource usage of this child alone
+        pid, status, rusage = os.wait4(proc.pid, 0)
+        wall = time.time() - start
+        proc.returncode = os.waitstatus_to_exitcode(status) if hasattr(os, "waitstatus_to_exitcode") else status >> 8
+
+        output.seek(0)
+        text = output.read().decode("utf-8", "replace")
+
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    peak_rss = rusage.ru_maxrss / (1024.0 * 1024.0 if sys.platform == "darwin" else 1024.0)
+    ok = proc.returncode == 0 and "ERR:" not in text and "Traceback" not in text
+    return wall, peak_rss, ok, text
+
+
+def run_scenario(name, args, repeat, warm, workdir, controller, tenant_args, age=0, changed_sites=0, removed_circuits=0):
+    runs = []
+    for count in range(repeat):
+        # Fresh tenant state and an empty cache for every run
+        controller.tenant = mock_controller.create_tenant(tenant_args)
+        home = tempfile.mkdtemp(prefix="bench_home_", dir=workdir)
+        if warm:
+            run_script(workdir, home, controller, args)
+            if age > 0:
+                # Same tenant, changed by an admin since the warm run
+                age_cache(home, age)
+                controller.tenant.touch(changed_sites)
+                controller.tenant.remove_circuits(removed_circuits)
+            else:
+                controller.tenant = mock_controller.create_tenant(tenant_args)
+
+        controller.reset_stats()
+        wall, peak_rss, ok, text = run_script(workdir, home, controller, args)
+        stats = controller.stats()
+        runs.append({"wall": wall, "peak_rss_mb": peak_rss, "ok": ok, "api_calls": stats["calls"],
+                     "injected_errors": stats["injected_errors"], "endpoints": stats["endpoints"]})
+        shutil.rmtree(home, ignore_errors=True)
+
+        if not ok:
+            log = os.path.join(tempfile.gettempdir(), "bench_{}_{}.log".format(name, count))
+            with open(log, "w") as f:
+                f.write(text)
+            print("WARN: {} run {} failed. Output written to {}".format(name, count + 1, log))
+
+    walls = sorted(run["wall"] for run in runs)
+    return {
+        "scenario": name,
+        "args": args,
+        "runs": len(runs),
+        "ok": sum(1 for run in runs if run["ok"]),
+        "wall_median": walls[len(walls) // 2],
+        "wall_min": walls[0],
+        "api_calls": max(run["api_calls"] for run in runs),
+        "injected_errors": sum(run["injected_errors"] for run in runs),
+        "peak_rss_mb": max(run["peak_rss_mb"] for run in runs),
+        "endpoints": runs[-1]["endpoints"]
+    }
+
+
+def print_results(results):
+    print("\n{:<24}{:>6}{:>6}{:>12}{:>12}{:>11}{:>10}{:>10}".format("Scenario", "Runs", "OK", "Median(s)", "Min(s)",
+                                                                  "API Calls", "Injected", "RSS(MB)"))
+    for result in results:
+        print("{:<24}{:>6}{:>6}{:>12.2f}{:>12.2f}{:>11}{:>10}{:>10.1f}".format(result["scenario"], result["runs"],
+                                                                           result["ok"], result["wall_median"],
+                                                                           result["wall_min"], result["api_calls"],
+                                                                           result["injected_errors"],
+                                                                           result["peak_rss_mb"]))
+
+
+def compare_baseline(results, filename, tolerance):
+    """
+    Returns a list of regressions against a previous --output file
+    """
+    with open(filename, "r") as f:
+        baseline = {result["scenario"]: result for result in json.load(f)["results"]}
+
+    regressions = []
+    for result in results:
+        previous = baseline.get(result["scenario"], None)
+        if previous is None:
+            continue
+
+        if result["ok"] < result["runs"]:
+            regressions.append("{}: {} of {} runs failed".format(result["scenario"], result["runs"] - result["ok"],
+                                                                 result["runs"]))
+        if result["api_calls"] > previous["api_calls"]:
+            regressions.append("{}: API calls {} -> {}".format(result["scenario"], previous["api_calls"],
+                                                               result["api_calls"]))
+        if result["wall_median"] > previous["wall_median"] * (1 + tolerance):
+            regressions.append("{}: median wall time {:.2f}s -> {:.2f}s".format(result["scenario"],
+                                                                                previous["wall_median"],
+                                                                                result["wall_median"]))
+    return regressions
+
+
+def go():
+    parser = argparse.ArgumentParser(description="Benchmark manage_sase_connection.py against a mock controller.")
+    bench_group = parser.add_argument_group('Benchmark', 'Scenarios and reporting')
+    bench_group.add_argument("--scenarios", help="Comma separated scenarios to run. Default: all", default=None)
+    bench_group.add_argument("--repeat", "-R", help="Runs per scenario. Default: {}".format(REPEAT), type=int, default=REPEAT)
+    bench_group.add_argument("--warm", help="Measure with a warm translation cache (one unmeasured run first)", action="store_true", default=False)
+    bench_group.add_argument("--age", help="With --warm, age the cache by this many seconds before the measured run. Default: 0", type=int, default=0)
+    bench_group.add_argument("--changed_sites", help="With --age, sites changed (with their elements, interfaces and circuits) after the warm run. Default: 0", type=int, default=0)
+    bench_group.add_argument("--removed_circuits", help="With --age, sites whose last circuit is deleted after the warm run. Default: 0", type=int, default=0)
+    bench_group.add_argument("--batch_sites", help="Sites in the batch scenario manifest. Default: {}".format(BATCH_SITES), type=int, default=BATCH_SITES)
+    bench_group.add_argument("--script", help="Script to benchmark. Default: {}".format(SCRIPT), default=SCRIPT)
+    bench_group.add_argument("--extra_args", help="Extra arguments passed to the script, e.g. \"--rate_limit 0\"", default="")
+    bench_group.add_argument("--output", "-O", help="Write results to this JSON file", default=None)
+    bench_group.add_argument("--baseline", "-B", help="Compare with a previous --output file and exit 1 on regression", default=None)
+    bench_group.add_argument("--tolerance", help="Allowed wall time increase over the baseline. Default: {}".format(TOLERANCE), type=float, default=TOLERANCE)
+    mock_controller.add_tenant_arguments(parser)
+    args = vars(parser.parse_args())
+
+    if args["repeat"] < 1:
+        print("ERR: Repeat must be 1 or more.\nExiting..")
+        sys.exit(2)
+
+    controller = mock_controller.create_controller(args)
+    controller.start()
+    tenant = controller.tenant
+    batch_sites = max(1, min(args["batch_sites"], len(tenant.sites)))
+
+    all_scenarios = scenarios(tenant, batch_sites)
+    names = list(all_scenarios.keys())
+    if args["scenarios"] is not None:
+        names = [name.strip() for name in args["scenarios"].split(",")]
+        for name in names:
+            if name not in all_scenarios:
+                print("ERR: Invalid scenario: {}. Please choose from: {}\nExiting..".format(name, ", ".join(all_scenarios)))
+                sys.exit(2)
+
+    workdir = tempfile.mkdtemp(prefix="bench_")
+    try:
+        shutil.copy(args["script"], os.path.join(workdir, "manage_sase_connection.py"))
+        with open(os.path.join(workdir, "prismasase_settings.py"), "w") as f:
+            f.write(SETTINGS)
+        manifest = os.path.join(workdir, "manifest.csv")
+        write_manifest(manifest, tenant, batch_sites)
+
+        print("INFO: Mock controller on {}: {} sites, {} elements/site, {} interfaces/element, {} circuits/site".format(
+            controller.url, args["sites"], args["elements"], args["interfaces"], args["circuits"]))
+
+        results = []
+        for name in names:
+            script_args = [manifest if arg == "{manifest}" else arg for arg in all_scenarios[name]]
+            script_args += shlex.split(args["extra_args"])
+            print("INFO: Running {}..".format(name))
+            results.append(run_scenario(name, script_args, args["repeat"], args["warm"], workdir, controller, args,
+                                        age=args["age"], changed_sites=args["changed_sites"],
+                                        removed_circuits=args["removed_circuits"]))
+
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        controller.shutdown()
+
+    print_results(results)
+
+    if args["output"] is not None:
+        config = {key: args[key] for key in ["sites", "elements", "interfaces", "circuits", "locations", "wannetworks",
+                                             "padding", "provision_time", "latency", "jitter", "error_rate", "throttle_rate", "seed",
+                                             "repeat", "warm", "age", "changed_sites", "removed_circuits", "batch_sites", "extra_args"]}
+        with open(args["output"], "w") as f:
+            json.dump({"config": config, "results": results}, f, indent=2)
+        print("INFO: Results written to {}".format(args["output"]))
+
+    if args["baseline"] is not None:
+        regressions = compare_baseline(results, args["baseline"], args["tolerance"])
+        if len(regressions) > 0:
+            print("\nRegressions against {}:".format(args["baseline"]))
+            for regression in regressions:
+                print("\t{}".format(regression))
+            sys.exit(1)
+
+        print("INFO: No regressions against {}".format(args["baseline"]))
+
+    if any(result["ok"] < result["runs"] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    go()
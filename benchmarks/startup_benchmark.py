@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+"""
+Startup time of manage_sase_connection.py for the paths that should not load
+the SDK: --help, argument errors and list_palocations served from a warm cache.
+Fails (exit 1) if any of them imports a heavy module or, for the cached run,
+sends an API request.
+
+    ./startup_benchmark.py --repeat 10
+    ./startup_benchmark.py --max_startup 0.3    # also fail if a case is slower
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import mock_controller
+import run_benchmarks
+
+##############################################################################
+# Global dicts & variables
+##############################################################################
+REPEAT = 5
+# Modules that must not be imported on the fast paths
+HEAVY_MODULES = ["prisma_sase", "yaml", "requests", "http.server"]
+
+CASES = {
+    "help": ["-h"],
+    "invalid_action": ["-A", "invalid"],
+    "list_palocations_cached": ["-A", "list_palocations"]
+}
+
+
+def run(workdir, env, args, importtime=False):
+    """
+    Returns wall time, exit status, output and the imported module names (with importtime)
+    """
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + \
+        [os.path.join(workdir, "manage_sase_connection.py")] + args
+    start = time.time()
+    proc = subprocess.run(command, cwd=workdir, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    wall = time.time() - start
+
+    modules = set()
+    stderr = proc.stderr.decode("utf-8", "replace")
+    if importtime:
+        for line in stderr.splitlines():
+            if line.startswith("import time:") and line.count("|") == 2:
+                modules.add(line.rsplit("|", 1)[1].strip())
+    return wall, proc.returncode, proc.stdout.decode("utf-8", "replace") + stderr, modules
+
+
+def run_bare():
+    start = time.time()
+    subprocess.run([sys.executable, "-c", "pass"])
+    return time.time() - start
+
+
+def go():
+    parser = argparse.ArgumentParser(description="Startup time of manage_sase_connection.py fast paths.")
+    parser.add_argument("--repeat", "-R", help="Runs per case. Default: {}".format(REPEAT), type=int, default=REPEAT)
+    parser.add_argument("--script", help="Script to benchmark. Default: {}".format(run_benchmarks.SCRIPT), default=run_benchmarks.SCRIPT)
+    parser.add_argument("--max_startup", help="Fail if a case's median wall time exceeds this many seconds", type=float, default=None)
+    args = vars(parser.parse_args())
+
+    if args["repeat"] < 1:
+        print("ERR: Repeat must be 1 or more.\nExiting..")
+        sys.exit(2)
+
+    controller = mock_controller.MockController(("127.0.0.1", 0), mock_controller.MockTenant())
+    controller.start()
+    workdir = tempfile.mkdtemp(prefix="bench_startup_")
+    failures = []
+    try:
+        shutil.copy(args["script"], os.path.join(workdir, "manage_sase_connection.py"))
+        with open(os.path.join(workdir, "prismasase_settings.py"), "w") as f:
+            f.write(run_benchmarks.SETTINGS)
+        env = dict(os.environ,
+                   HOME=os.path.join(workdir, "home"),
+                   PRISMASASE_CONTROLLER=controller.url,
+                   PRISMASASE_AUTH_URL="{}/auth/v1/oauth2/access_token".format(controller.url),
+                   PYTHONDONTWRITEBYTECODE="1")
+
+        # Interpreter startup alone, for reference
+        baseline = sorted(run_bare() for count in range(args["repeat"]))[args["repeat"] // 2]
+
+        # Fill the cache for the cached case
+        wall, status, text, modules = run(workdir, env, CASES["list_palocations_cached"])
+        if status != 0 or "ERR:" in text:
+            print("ERR: Could not warm the cache:\n{}\nExiting..".format(text))
+            sys.exit(1)
+
+        print("\n{:<28}{:>12}{:>12}{:>11}  {}".format("Case", "Median(s)", "Over(s)", "API Calls", "Heavy imports"))
+        print("{:<28}{:>12.3f}{:>12}{:>11}  {}".format("python -c pass", baseline, "-", "-", "-"))
+        for name, case_args in CASES.items():
+            controller.reset_stats()
+            walls = sorted(run(workdir, env, case_args)[0] for count in range(args["repeat"]))
+            api_calls = controller.stats()["calls"]
+            heavy = sorted(set(HEAVY_MODULES) & run(workdir, env, case_args, importtime=True)[3])
+            median = walls[len(walls) // 2]
+            print("{:<28}{:>12.3f}{:>12.3f}{:>11}  {}".format(name, median, median - baseline, api_calls,
+                                                            ", ".join(heavy) or "none"))
+
+            if heavy:
+                failures.append("{}: imports {}".format(name, ", ".join(heavy)))
+            if api_calls > 0:
+                failures.append("{}: {} API calls".format(name, api_calls))
+            if args["max_startup"] is not None and median > args["max_startup"]:
+                failures.append("{}: median {:.3f}s over {:.3f}s".format(name, median, args["max_startup"]))
+
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        controller.shutdown()
+
+    if len(failures) > 0:
+        print("\nStartup regressions:")
+        for failure in failures:
+            print("\t{}".format(failure))
+        sys.exit(1)
+
+    print("\nINFO: No startup regressions")
+
+
+if __name__ == "__main__":
+    go()
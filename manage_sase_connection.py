@@ -3,15 +3,55 @@
 """
 Script to manage Prisma SASE Connections (Easy Onboarding)
 Author: tkamath@paloaltonetworks.com
-Version: 1.0.0b4
+Version: 1.0.0b5
 """
-import prisma_sase
 import argparse
 import os
 import time
-import yaml
 import sys
 import datetime
+import csv
+import concurrent.futures
+import json
+import sqlite3
+import threading
+import base64
+import hashlib
+import uuid
+import tempfile
+import atexit
+import random
+import re
+import fnmatch
+import math
+import importlib.util
+import subprocess
+import ipaddress
+import hmac
+import fcntl
+
+##############################################################################
+# Lazy Imports
+# The SDK, yaml and the modules used only by serve mode or retries are
+# imported on first use, so --help, invalid arguments and reads served from
+# the cache do not pay for loading them
+##############################################################################
+class LazyModule(object):
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+prisma_sase = LazyModule("prisma_sase")
+yaml = LazyModule("yaml")
+email_utils = LazyModule("email.utils")
+http_server = LazyModule("http.server")
+socketserver = LazyModule("socketserver")
 
 ##############################################################################
 # Service Account Details -
@@ -34,295 +74,1083 @@ LIST = "list_palocations"
 DELETE = "delete_saseconn"
 CONFIG = "config_saseconn"
 BIND = "bind_zone"
-ACTION = [LIST, DELETE, CONFIG, BIND]
-
-site_id_name = {}
-site_name_id = {}
-spokesitenames = []
-zone_id_name = {}
-zone_name_id = {}
-wannw_id_name = {}
-wannw_name_id = {}
-siteid_swinamelist = {}
-siteid_swiidlist = {}
-siteid_swiidname = {}
-siteid_swinameid = {}
-siteid_activeswiidlist = []
-swis_inactive = []
-
-siteid_elemidlist = {}
-elemid_servicelinkidlist = {}
-elem_id_name = {}
-servicelink_id_name = {}
-
-rnqosprofile_id_name = {}
-rnqosprofile_name_id = {}
-palocations_displayname_value = {}
-palocations_value_displayname = {}
-palocations_value_data = {}
-palocations_value_aggregion = {}
-palocations_aggregion_valuelist = {}
-
-palocations_bwalloc = []
-palocations_aggregion = []
-palocation_value_spnnamelist = {}
-palocation_value_bw = {}
-
-
-def create_dicts(sase_session, action, sitename):
-    global default_qos_profile_id
-    default_qos_profile_id = None
-
-    if action in [LIST, CONFIG]:
+CAPACITY = "plan_capacity"
+INVENTORY = "inventory"
+ACTION = [LIST, DELETE, CONFIG, BIND, CAPACITY, INVENTORY]
+# Journal name for --apply runs
+APPLY = "apply"
+# Serve mode builds the tenant level indexes of every action it exposes
+SERVE = "serve"
+# bind_zone site selector for every spoke site
+ALL_SPOKES = "ALL_SPOKES"
+BATCH_ACTIONS = [CONFIG]
+PLAN_ACTIONS = [CONFIG, BIND, DELETE]
+# Requests a plan may hold: SDK method and resource
+PLAN_METHODS = ["post", "put", "delete"]
+PLAN_RESOURCES = ["prismasase_connections", "elementsecurityzones"]
+BATCH_WORKERS = 8
+API_CONCURRENCY = 8
+
+api_concurrency = API_CONCURRENCY
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".manage_sase_connection")
+CACHE_FILE = os.path.join(CACHE_DIR, "cache.db")
+# Seconds before a cached resource is fetched again
+CACHE_TTL = {
+    "locations": 86400,
+    "bandwidth_allocations": 3600,
+    "sites": 3600,
+    "wannetworks": 3600,
+    "securityzones": 3600,
+    "qos_profiles": 3600,
+    "elements": 900,
+    "interfaces": 900,
+    "waninterfaces": 900
+}
+SITE_RESOURCES = ["elements", "interfaces", "waninterfaces"]
+# Incremental sync: query API, the fields an item's cache key is made of, and the age (seconds)
+# after which the resource is fetched in full again. Deletions are found by comparing the number
+# of objects on the controller with the synced entries (filtered on the last key field), and
+# the stored items no longer listed are then dropped.
+SYNC_QUERIES = {
+    "sites": ("site_query", [], 86400),
+    "securityzones": ("securityzones_query", [], 86400),
+    "elements": ("element_query", ["site_id"], 3600),
+    "interfaces": ("interfaces_query", ["site_id", "element_id"], 3600),
+    "waninterfaces": ("tenant_waninterfaces_query", ["site_id"], 3600)
+}
+# Tenant level resources fetched for each action
+ACTION_RESOURCES = {
+    LIST: ["locations", "bandwidth_allocations"],
+    CONFIG: ["locations", "bandwidth_allocations", "sites", "qos_profiles"],
+    DELETE: ["sites"],
+    BIND: ["sites", "securityzones"],
+    CAPACITY: ["locations", "bandwidth_allocations", "sites"],
+    INVENTORY: ["sites", "securityzones"],
+    SERVE: ["locations", "bandwidth_allocations", "sites", "securityzones", "qos_profiles"]
+}
+
+TOKEN_FILE = os.path.join(CACHE_DIR, "tokens.json")
+# Per-site progress of batch runs, for --resume
+JOURNAL_FILE = os.path.join(CACHE_DIR, "journal.db")
+# Stored tokens expiring within this many seconds are replaced with a fresh login
+TOKEN_REFRESH_MARGIN = 300
+
+# Page sizes for SSE config list endpoints (offset/limit) and SD-WAN queries (dest_page/limit)
+SSE_PAGE_LIMIT = 200
+QUERY_PAGE_LIMIT = 500
+
+# Retry on throttled or unavailable responses, with exponential backoff (seconds)
+RETRY_STATUS = [429, 500, 502, 503, 504]
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+# API requests per second, shared by all threads. 0 disables the limit.
+RATE_LIMIT = 20
+
+# Controller and OAuth token URL overrides, e.g. for a local mock controller.
+# The SDK defaults are used when unset.
+CONTROLLER_URL = os.environ.get("PRISMASASE_CONTROLLER", None)
+AUTH_URL = os.environ.get("PRISMASASE_AUTH_URL", None)
+
+# --wait: connection status polling (seconds). The interval grows while nothing changes.
+WAIT_TIMEOUT = 1800
+WAIT_POLL_MIN = 5.0
+WAIT_POLL_MAX = 60.0
+WAIT_POLL_BACKOFF = 1.5
+# A connection status has the connection "state" and the "status" of each tunnel under
+# remote_network_groups[].ipsec_tunnels[]. Tunnel status values that count as up
+TUNNEL_UP_STATES = ["up"]
+CONNECTION_FAILED_STATES = ["failed", "error"]
+
+# delete_saseconn: seconds to wait for the tunnels of unbound connections to be removed, the status
+# polling interval (grows while nothing changes) and the connection states that mean not done yet
+UNBIND_TIMEOUT = 600
+UNBIND_POLL_MIN = 2.0
+UNBIND_POLL_MAX = 30.0
+UNBIND_PENDING_STATES = ["provisioning", "deleting", "pending", "in_progress"]
+
+# --output formats. list_palocations supports all, inventory json and ndjson (default)
+OUTPUT_TEXT = "text"
+OUTPUT_JSON = "json"
+OUTPUT_NDJSON = "ndjson"
+OUTPUT_FORMATS = [OUTPUT_TEXT, OUTPUT_JSON, OUTPUT_NDJSON]
+
+# Serve mode: default listen address and seconds between background index refreshes
+SERVE_HOST = "127.0.0.1"
+SERVE_PORT = 8765
+SERVE_REFRESH = 60
+# Shared secret that clients must send as "Authorization: Bearer <token>".
+# Required to listen on anything but a loopback address.
+SERVE_TOKEN_ENV = "SASE_SERVE_TOKEN"
+# Largest request body (bytes) accepted by serve mode
+SERVE_MAX_BODY = 1024 * 1024
+
+# plan_capacity: percentage of each aggregate region's allocated BW kept free
+CAPACITY_HEADROOM = 0.0
+EARTH_RADIUS_KM = 6371.0
+
+# Multi-tenant runs (--tsg_ids): every child TSG of PRISMASASE_TSG_ID, the actions supported,
+# the options and flags not passed on to the per-tenant runs and the lines of their output that are reported.
+# Per-tenant API profiles are written to temporary files and aggregated by the parent.
+ALL_CHILDREN = "ALL_CHILDREN"
+TENANT_ACTIONS = [LIST, CONFIG, BIND]
+TENANT_WORKERS = 4
+TENANT_RUN_OPTIONS = ["--tsg_ids", "--tsg_workers", "--profile_output", "--profile_format"]
+TENANT_RUN_FLAGS = ["--profile"]
+TENANT_REPORT = re.compile(r"^(ERR:|WARN:|INFO: (SASE Connection|Zone|Circuits)|\w+ Summary:)")
+
+max_retries = MAX_RETRIES
+rate_limiter = None
+api_profiler = None
+connection_tracker = None
+record_writer = None
+
+cache_file = None
+cache_tsg_id = None
+cache_refresh = False
+cache_run_start = time.time()
+cache_lock = threading.Lock()
+cache_syncer = None
+
+
+##############################################################################
+# Tenant Inventory
+# Compact records holding only the fields the actions use, with one
+# bidirectional (ID <-> name) index per entity type
+##############################################################################
+class Record(object):
+    __slots__ = ("id", "name")
+
+    def __init__(self, id, name, **fields):
+        self.id = id
+        self.name = name
+        if type(self) is not Record:
+            for field in self.__slots__:
+                setattr(self, field, fields.get(field, None))
+
+
+class Location(Record):
+    """
+    PA Location: id is the location value, name the display name
+    """
+    __slots__ = ("aggregate_region", "spn_name_list", "bandwidth", "latitude", "longitude")
+
+
+class Site(Record):
+    __slots__ = ("role", "latitude", "longitude")
+
+
+class Element(Record):
+    __slots__ = ("site_id", "servicelink_ids")
+
+
+class ServiceLink(Record):
+    __slots__ = ("element_id",)
+
+
+class Circuit(Record):
+    """
+    Site WAN Interface. Names are only unique within a site.
+    bandwidth is the larger of the configured upload and download BW (Mbps).
+    """
+    __slots__ = ("site_id", "type", "active", "bandwidth")
+
+
+class QoSProfile(Record):
+    __slots__ = ("default",)
+
+
+class Index(object):
+    __slots__ = ("by_id", "by_name")
+
+    def __init__(self):
+        self.by_id = {}
+        self.by_name = {}
+
+    def add(self, record):
+        self.by_id[record.id] = record
+        self.by_name[record.name] = record
+        return record
+
+    def get(self, id):
+        return self.by_id.get(id, None)
+
+    def find(self, name):
+        return self.by_name.get(name, None)
+
+    def name(self, id):
+        return self.by_id[id].name
+
+    def id(self, name):
+        return self.by_name[name].id
+
+    def names(self):
+        return list(self.by_name.keys())
+
+    def __contains__(self, id):
+        return id in self.by_id
+
+    def __iter__(self):
+        return iter(list(self.by_id.values()))
+
+    def __len__(self):
+        return len(self.by_id)
+
+
+class TenantInventory(object):
+    """
+    Translation indexes for one tenant, filled by create_dicts().
+    Site level entries are added per site, so one inventory can serve a whole batch.
+    """
+    __slots__ = ("locations", "aggregate_regions", "allocated_regions", "sites", "wannetworks", "zones",
+                 "qos_profiles", "default_qos_profile_id", "elements", "servicelinks", "circuits",
+                 "site_element_ids", "site_circuit_ids")
+
+    def __init__(self):
+        self.locations = Index()
+        # Aggregate region -> PA Location values, in API order
+        self.aggregate_regions = {}
+        # Aggregate regions with BW allocated, in API order
+        self.allocated_regions = []
+        self.sites = Index()
+        self.wannetworks = Index()
+        self.zones = Index()
+        self.qos_profiles = Index()
+        self.default_qos_profile_id = None
+        self.elements = Index()
+        self.servicelinks = Index()
+        self.circuits = Index()
+        self.site_element_ids = {}
+        self.site_circuit_ids = {}
+
+    def spoke(self, sitename):
+        site = self.sites.find(sitename)
+        if site is None or site.role != "SPOKE":
+            return None
+        return site
+
+    def spoke_names(self):
+        return [site.name for site in self.sites if site.role == "SPOKE"]
+
+    def allocated_locations(self):
+        """
+        PA Location values with BW allocated
+        """
+        return [value for region in self.allocated_regions for value in self.aggregate_regions[region]]
+
+    def site_elements(self, sid):
+        return [self.elements.get(eid) for eid in self.site_element_ids.get(sid, [])]
+
+    def site_circuits(self, sid, active=None, circuit_type=None):
+        circuits = [self.circuits.get(swi_id) for swi_id in self.site_circuit_ids.get(sid, [])]
+        return [circuit for circuit in circuits
+                if (active is None or circuit.active == active) and (circuit_type is None or circuit.type == circuit_type)]
+
+    def site_circuit(self, sid, name):
+        """
+        Active circuit at the site with the given name
+        """
+        for circuit in self.site_circuits(sid, active=True):
+            if circuit.name == name:
+                return circuit
+        return None
+
+
+##############################################################################
+# On-disk Translation Cache
+# Raw API items are stored in SQLite one row per item, keyed by TSG ID,
+# resource and an optional scope key (site ID or site ID/element ID for site
+# level resources). Pages are written through to the store as they arrive and
+# the indexes are built by streaming the rows back, so memory use does not
+# grow with the size of the tenant. With --no_cache the store is a temporary
+# file that is removed on exit.
+##############################################################################
+class APIError(Exception):
+    def __init__(self, resp):
+        Exception.__init__(self, "API request failed")
+        self.resp = resp
+
+
+def cache_connect():
+    connection = sqlite3.connect(cache_file, timeout=30)
+    connection.execute("CREATE TABLE IF NOT EXISTS cache_resources ("
+                       "tsg_id TEXT, resource TEXT, key TEXT, fetched_at REAL, "
+                       "PRIMARY KEY (tsg_id, resource, key))")
+    connection.execute("CREATE TABLE IF NOT EXISTS cache_items ("
+                       "tsg_id TEXT, resource TEXT, key TEXT, seq INTEGER, body TEXT, item_id TEXT)")
+    connection.execute("CREATE TABLE IF NOT EXISTS cache_sync ("
+                       "tsg_id TEXT, resource TEXT, watermark INTEGER, started_at REAL, "
+                       "PRIMARY KEY (tsg_id, resource))")
+    if "item_id" not in [row[1] for row in connection.execute("PRAGMA table_info(cache_items)")]:
+        # Stores written before incremental sync
+        try:
+            connection.execute("ALTER TABLE cache_items ADD COLUMN item_id TEXT")
+        except sqlite3.OperationalError:
+            pass
+    connection.execute("CREATE INDEX IF NOT EXISTS cache_items_idx ON cache_items (tsg_id, resource, key, seq)")
+    connection.execute("CREATE INDEX IF NOT EXISTS cache_items_item_idx ON cache_items (tsg_id, resource, item_id)")
+    return connection
+
+
+def cache_fresh(resource, key=""):
+    """
+    True if resource is in the store and within its TTL. With --refresh only entries
+    fetched during this run count as fresh.
+    """
+    if cache_file is None:
+        return False
+
+    try:
+        connection = cache_connect()
+        try:
+            row = connection.execute("SELECT fetched_at FROM cache_resources WHERE tsg_id=? AND resource=? AND key=?",
+                                     (cache_tsg_id, resource, key)).fetchone()
+        finally:
+            connection.close()
+
+    except sqlite3.Error as e:
+        print("WARN: Could not read cache {}: {}".format(cache_file, e))
+        return False
+
+    if row is None or time.time() - row[0] > CACHE_TTL.get(resource, 0):
+        return False
+
+    if cache_refresh and row[0] < cache_run_start:
+        return False
+
+    return True
+
+
+def cache_items(resource, key=""):
+    """
+    Generator over the stored items of resource, in API order.
+    """
+    connection = cache_connect()
+    try:
+        cursor = connection.execute("SELECT body FROM cache_items WHERE tsg_id=? AND resource=? AND key=? "
+                                    "ORDER BY seq", (cache_tsg_id, resource, key))
+        for (body,) in cursor:
+            yield json.loads(body)
+    finally:
+        connection.close()
+
+
+def cache_store(resource, pages, key=""):
+    """
+    Write pages of items to the store under a staging key and swap them in once the last
+    page has arrived, so a failed or interrupted fetch never leaves a partial entry behind.
+    The first entry of a resource that can be synced starts its sync chain.
+    APIError from the page iterator is passed on to the caller.
+    """
+    staging_key = "{}#{}".format(key, uuid.uuid4().hex)
+    seq = 0
+    watermark = None
+    connection = cache_connect()
+    try:
+        try:
+            for items in pages:
+                with cache_lock, connection:
+                    connection.executemany("INSERT INTO cache_items (tsg_id, resource, key, seq, body, item_id) "
+                                           "VALUES (?, ?, ?, ?, ?, ?)",
+                                           [(cache_tsg_id, resource, staging_key, seq + count, json.dumps(item),
+                                             item.get("id", None) if isinstance(item, dict) else None)
+                                            for count, item in enumerate(items)])
+                seq += len(items)
+                watermark = max([watermark] + [updated_on(item) for item in items], key=lambda value: value or 0)
+
+        except BaseException:
+            with cache_lock, connection:
+                connection.execute("DELETE FROM cache_items WHERE tsg_id=? AND resource=? AND key=?",
+                                   (cache_tsg_id, resource, staging_key))
+            raise
+
+        with cache_lock, connection:
+            connection.execute("DELETE FROM cache_items WHERE tsg_id=? AND resource=? AND key=?",
+                               (cache_tsg_id, resource, key))
+            connection.execute("UPDATE cache_items SET key=? WHERE tsg_id=? AND resource=? AND key=?",
+                               (key, cache_tsg_id, resource, staging_key))
+            fetched_at = time.time()
+            connection.execute("INSERT OR REPLACE INTO cache_resources VALUES (?, ?, ?, ?)",
+                               (cache_tsg_id, resource, key, fetched_at))
+            if watermark is not None and sync_key(resource, key):
+                connection.execute("INSERT OR IGNORE INTO cache_sync VALUES (?, ?, ?, ?)",
+                                   (cache_tsg_id, resource, watermark, fetched_at))
+    finally:
+        connection.close()
+
+
+def updated_on(item):
+    return item.get("_updated_on_utc", None) if isinstance(item, dict) else None
+
+
+def cache_invalidate_site(sid):
+    """
+    Drop the cached site level resources (elements, interfaces, WAN interfaces) for a site.
+    Used after a change is pushed to the site so the next run picks up the new state.
+    """
+    if cache_file is None:
+        return
+
+    try:
+        with cache_lock:
+            connection = cache_connect()
+            try:
+                with connection:
+                    for table in ["cache_resources", "cache_items"]:
+                        connection.execute("DELETE FROM {} WHERE tsg_id=? AND resource IN ({}) "
+                                           "AND (key=? OR key LIKE ?)".format(table, ",".join("?" * len(SITE_RESOURCES))),
+                                           [cache_tsg_id] + SITE_RESOURCES + [sid, "{}/%".format(sid)])
+            finally:
+                connection.close()
+
+    except sqlite3.Error as e:
+        print("WARN: Could not update cache {}: {}".format(cache_file, e))
+
+
+def cache_expire(resources):
+    """
+    Mark the cached resources as stale so the next fetch goes to the controller
+    """
+    if cache_file is None:
+        return
+
+    try:
+        with cache_lock:
+            connection = cache_connect()
+            try:
+                with connection:
+                    connection.execute("DELETE FROM cache_resources WHERE tsg_id=? AND resource IN ({})".format(
+                        ",".join("?" * len(resources))), [cache_tsg_id] + list(resources))
+            finally:
+                connection.close()
+
+    except sqlite3.Error as e:
+        print("WARN: Could not update cache {}: {}".format(cache_file, e))
+
+
+##############################################################################
+# Incremental Sync
+# A stale entry of a resource in SYNC_QUERIES is brought up to date together
+# with every other entry of the resource stored since its sync chain started:
+# one query for the objects changed since the watermark (the newest
+# _updated_on_utc seen), patched into the store. The chain restarts with full
+# fetches once it is older than the resource's maximum age.
+##############################################################################
+def sync_key(resource, key):
+    """
+    True if entries stored under key can be patched by a sync: the full list for resources
+    stored under one key, per site (element) entries otherwise
+    """
+    if resource not in SYNC_QUERIES:
+        return False
+    if len(SYNC_QUERIES[resource][1]) == 0:
+        return key == ""
+    return key != "" and not key.startswith("query:")
+
+
+class CacheSync(object):
+    def __init__(self, sase_session):
+        self.sase_session = sase_session
+        self.locks = {resource: threading.Lock() for resource in SYNC_QUERIES}
+        self.synced_at = {}
+
+    def sync(self, resource, key=""):
+        """
+        True if the stale entry of resource under key was brought up to date
+        """
+        if cache_refresh or not sync_key(resource, key):
+            return False
+
+        with self.locks[resource]:
+            # One sync covers every entry of the resource, so it runs at most once per TTL
+            if time.time() - self.synced_at.get(resource, 0) > CACHE_TTL[resource]:
+                try:
+                    if self.run(resource, key):
+                        self.synced_at[resource] = time.time()
+
+                except APIError as e:
+                    print("WARN: Could not sync {}. Retrieving them in full..".format(resource))
+                    prisma_sase.jd_detailed(e.resp)
+                    self.synced_at[resource] = time.time()
+
+                except sqlite3.Error as e:
+                    print("WARN: Could not sync cache {}: {}".format(cache_file, e))
+                    self.synced_at[resource] = time.time()
+
+        return cache_fresh(resource, key)
+
+    def run(self, resource, key):
+        """
+        Sync resource if key is part of its chain. Returns False if there was nothing to sync.
+        """
+        method, fields, max_age = SYNC_QUERIES[resource]
+        query = getattr(self.sase_session.post, method, None)
+        if query is None:
+            return False
+
+        connection = cache_connect()
+        try:
+            chain = connection.execute("SELECT watermark, started_at FROM cache_sync WHERE tsg_id=? AND resource=?",
+                                       (cache_tsg_id, resource)).fetchone()
+            if chain is None:
+                return False
+
+            watermark, started_at = chain
+            if time.time() - started_at > max_age:
+                with cache_lock, connection:
+                    connection.execute("DELETE FROM cache_sync WHERE tsg_id=? AND resource=?", (cache_tsg_id, resource))
+                return False
+
+            keys = set([row[0] for row in connection.execute("SELECT key FROM cache_resources WHERE tsg_id=? AND resource=? "
+                                                             "AND fetched_at>=?", (cache_tsg_id, resource, started_at))
+                        if sync_key(resource, row[0])])
+            if key not in keys:
+                return False
+
+            data = {
+                "query_params": {
+                    "_updated_on_utc": {"gt": watermark}
+                }
+            }
+            changed = [item for items in query_pages(query, data) for item in items]
+            # The query API does not guarantee any order
+            newest = max([watermark] + [updated_on(item) for item in changed if updated_on(item) is not None])
+
+            count_params = {}
+            if len(fields) > 0:
+                count_params = {fields[-1]: {"in": sorted(set([item_key.split("/")[-1] for item_key in keys]))}}
+            resp = query(data={"query_params": count_params, "limit": 1, "dest_page": 1})
+            if not resp.cgx_status:
+                raise APIError(resp)
+            total = resp.cgx_content.get("total_count", None)
+
+            fetched_at = time.time()
+            with cache_lock, connection:
+                for item in changed:
+                    cache_patch(connection, resource, keys, "/".join([str(item.get(field, None)) for field in fields]), item)
+
+                counts = dict(connection.execute("SELECT key, COUNT(*) FROM cache_items WHERE tsg_id=? AND resource=? "
+                                                 "GROUP BY key", (cache_tsg_id, resource)).fetchall())
+                deleted = total is not None and total != sum(counts.get(item_key, 0) for item_key in keys)
+                if not deleted:
+                    cache_synced(connection, resource, keys, fetched_at, newest)
+
+            if deleted:
+                # Objects were deleted: drop the stored items that are no longer on the controller
+                present = set([item["id"] for items in query_pages(query, {"query_params": count_params}) for item in items])
+                with cache_lock, connection:
+                    rows = connection.execute("SELECT rowid, key, item_id FROM cache_items WHERE tsg_id=? AND resource=?",
+                                              (cache_tsg_id, resource)).fetchall()
+                    connection.executemany("DELETE FROM cache_items WHERE rowid=?",
+                                           [(rowid,) for rowid, item_key, item_id in rows
+                                            if item_key in keys and item_id not in present])
+                    cache_synced(connection, resource, keys, fetched_at, newest)
+            return True
+
+        finally:
+            connection.close()
+
+
+def cache_synced(connection, resource, keys, fetched_at, watermark):
+    connection.executemany("UPDATE cache_resources SET fetched_at=? WHERE tsg_id=? AND resource=? AND key=?",
+                           [(fetched_at, cache_tsg_id, resource, item_key) for item_key in keys])
+    connection.execute("UPDATE cache_sync SET watermark=? WHERE tsg_id=? AND resource=?",
+                       (watermark, cache_tsg_id, resource))
+
+
+def cache_patch(connection, resource, keys, key, item):
+    """
+    Replace the stored copy of a changed item, moving it if its key changed, or add it to
+    its entry if it is new. Entries not in keys are left alone.
+    """
+    updated = False
+    rows = connection.execute("SELECT rowid, key FROM cache_items WHERE tsg_id=? AND resource=? AND item_id=?",
+                              (cache_tsg_id, resource, item.get("id", None))).fetchall()
+    for rowid, item_key in rows:
+        if item_key not in keys:
+            continue
+        if item_key == key and not updated:
+            connection.execute("UPDATE cache_items SET body=? WHERE rowid=?", (json.dumps(item), rowid))
+            updated = True
+        else:
+            connection.execute("DELETE FROM cache_items WHERE rowid=?", (rowid,))
+
+    if not updated and key in keys:
+        seq = connection.execute("SELECT COALESCE(MAX(seq), -1) + 1 FROM cache_items WHERE tsg_id=? AND resource=? "
+                                 "AND key=?", (cache_tsg_id, resource, key)).fetchone()[0]
+        connection.execute("INSERT INTO cache_items (tsg_id, resource, key, seq, body, item_id) VALUES (?, ?, ?, ?, ?, ?)",
+                           (cache_tsg_id, resource, key, seq, json.dumps(item), item.get("id", None)))
+
+
+##############################################################################
+# Paginated List Retrieval
+# Each pager returns an iterator over pages (lists of items) and raises
+# APIError with the failed response if a page request fails
+##############################################################################
+def single_page(request, content_key="items"):
+    resp = request()
+    if not resp.cgx_status:
+        raise APIError(resp)
+
+    if content_key is None:
+        yield resp.cgx_content
+    else:
+        yield resp.cgx_content.get(content_key, None) or []
+
+
+def sse_pages(sase_session, url, content_key="data"):
+    """
+    SSE config list endpoints, paged with offset/limit
+    """
+    offset = 0
+    while True:
+        separator = "&" if "?" in url else "?"
+        resp = sase_session.rest_call("{}{}offset={}&limit={}".format(url, separator, offset, SSE_PAGE_LIMIT), method="GET")
+        if not resp.cgx_status:
+            raise APIError(resp)
+
+        items = resp.cgx_content.get(content_key, None) or []
+        yield items
+
+        offset += len(items)
+        total = resp.cgx_content.get("total", None)
+        if len(items) == 0 or (total is not None and offset >= total) or (total is None and len(items) < SSE_PAGE_LIMIT):
+            return
+
+
+def query_pages(query, data, content_key="items"):
+    """
+    SD-WAN query endpoints, paged with dest_page/limit in the query body
+    """
+    dest_page = 1
+    retrieved = 0
+    while True:
+        page_data = dict(data, limit=QUERY_PAGE_LIMIT, dest_page=dest_page)
+        resp = query(data=page_data)
+        if not resp.cgx_status:
+            raise APIError(resp)
+
+        items = resp.cgx_content.get(content_key, None) or []
+        yield items
+
+        retrieved += len(items)
+        total = resp.cgx_content.get("total_count", None)
+        if len(items) < QUERY_PAGE_LIMIT or (total is not None and retrieved >= total):
+            return
+
+        dest_page += 1
+
+
+def fetch_items(resource, pager, key=""):
+    """
+    Return (items, resp) for a list resource. items iterates over the resource, streamed from the
+    store, which is filled from the API first unless it holds a fresh copy. On an API failure
+    items is None and resp holds the failed response.
+    pager is a function returning the page iterator, so the fetch can be repeated without the store.
+    """
+    try:
+        if cache_file is not None:
+            try:
+                if not cache_fresh(resource, key) and not (cache_syncer is not None and cache_syncer.sync(resource, key)):
+                    cache_store(resource, pager(), key)
+                return cache_items(resource, key), None
+
+            except sqlite3.Error as e:
+                print("WARN: Could not use cache {}: {}".format(cache_file, e))
+
+        return [item for items in pager() for item in items], None
+
+    except APIError as e:
+        return None, e.resp
+
+
+def create_dicts(sase_session, inventory, action, sitename):
+    create_tenant_dicts(sase_session=sase_session, inventory=inventory, action=action, sitenames=[sitename])
+
+    if action in [CONFIG, DELETE, BIND]:
+        create_site_dicts(sase_session=sase_session, inventory=inventory, action=action, sitename=sitename)
+
+    return
+
+
+def query_key(values):
+    """
+    Cache key for a filtered query over a set of names or IDs
+    """
+    return "query:{}".format(hashlib.sha1(json.dumps(sorted(values)).encode("utf-8")).hexdigest())
+
+
+def fetch_sites(sase_session, sitenames):
+    """
+    Retrieve only the named sites via the site query API. A fresh cached copy of the full
+    site list is used if present, and the full list is fetched if the query is not available.
+    """
+    if cache_fresh("sites") or (cache_syncer is not None and cache_syncer.sync("sites")):
+        return cache_items("sites"), None
+
+    site_query = getattr(sase_session.post, "site_query", None)
+    if sitenames and site_query is not None:
+        data = {
+            "query_params": {
+                "name": {"in": sitenames}
+            }
+        }
+        itemlist, resp = fetch_items("sites", lambda: query_pages(site_query, data), key=query_key(sitenames))
+        if itemlist is not None:
+            return itemlist, resp
+
+        print("WARN: Site query failed. Retrieving all sites..")
+
+    return fetch_items("sites", lambda: single_page(sase_session.get.sites))
+
+
+def site_record(item):
+    latitude, longitude = coordinates(item.get("location", None) or {})
+    return Site(item["id"], item["name"], role=item["element_cluster_role"], latitude=latitude, longitude=longitude)
+
+
+def lookup_new_sites(sase_session, inventory, sitenames):
+    """
+    Look up the named sites that are not in the inventory on the controller, in case they were
+    created after the cached site list was fetched. Sites found are added to the inventory and
+    the cached site list is marked stale.
+    """
+    missing = [name for name in dict.fromkeys(sitenames) if inventory.sites.find(name) is None]
+    site_query = getattr(sase_session.post, "site_query", None) if sase_session is not None else None
+    if len(missing) == 0 or site_query is None:
+        return
+
+    data = {
+        "query_params": {
+            "name": {"in": missing}
+        }
+    }
+    try:
+        items = [item for items in query_pages(site_query, data) for item in items]
+    except APIError:
+        return
+
+    for item in items:
+        inventory.sites.add(site_record(item))
+    if len(items) > 0:
+        cache_expire(["sites"])
+
+
+def fetch_wannetworks(sase_session, inventory, network_ids):
+    """
+    Resolve names for the WAN networks referenced by a site's unnamed circuits, skipping
+    networks already known. Falls back to the full WAN network list if the query fails.
+    """
+    network_ids = [nid for nid in dict.fromkeys(network_ids) if nid not in inventory.wannetworks]
+    if len(network_ids) == 0:
+        return
+
+    def index_wannetworks(wannetworks):
+        for wannw in wannetworks:
+            inventory.wannetworks.add(Record(wannw["id"], wannw["name"]))
+
+    if cache_fresh("wannetworks"):
+        index_wannetworks(cache_items("wannetworks"))
+        return
+
+    wannetworks_query = getattr(sase_session.post, "wannetworks_query", None)
+    if wannetworks_query is not None:
+        data = {
+            "query_params": {
+                "id": {"in": network_ids}
+            }
+        }
+        wannetworks, resp = fetch_items("wannetworks", lambda: query_pages(wannetworks_query, data), key=query_key(network_ids))
+        if wannetworks is not None:
+            index_wannetworks(wannetworks)
+
+    if any(nid not in inventory.wannetworks for nid in network_ids):
+        wannetworks, resp = fetch_items("wannetworks", lambda: single_page(sase_session.get.wannetworks))
+        if wannetworks is not None:
+            index_wannetworks(wannetworks)
+        else:
+            print("ERR: Could not retrieve WAN Networks.\nExiting..")
+            prisma_sase.jd_detailed(resp)
+            sys.exit()
+
+    return
+
+
+def tenant_fetchers(sase_session, sitenames):
+    """
+    Tenant level resources: resource name -> function returning (items, resp).
+    The session is only used when a resource is not served from the cache.
+    """
+    def sse_url(path):
+        return "{}/sse/config/v1/{}".format(sase_session.controller, path)
+
+    return {
+        "locations": lambda: fetch_items("locations",
+                                         lambda: single_page(lambda: sase_session.rest_call(sse_url("locations"), method="GET"),
+                                                             content_key=None)),
+        "bandwidth_allocations": lambda: fetch_items("bandwidth_allocations",
+                                                     lambda: sse_pages(sase_session, sse_url("bandwidth-allocations"))),
+        "sites": lambda: fetch_sites(sase_session, sitenames),
+        "securityzones": lambda: fetch_items("securityzones", lambda: single_page(sase_session.get.securityzones)),
+        "qos_profiles": lambda: fetch_items("qos_profiles",
+                                            lambda: sse_pages(sase_session, sse_url("qos-profiles?folder=Remote Networks"))),
+    }
+
+
+def fetch_tenant_resources(sase_session, action, sitenames):
+    """
+    None of the tenant level resources depend on each other, so everything the action
+    needs is requested at once. Returns resource name -> (itemlist, resp).
+    """
+    fetchers = tenant_fetchers(sase_session, sitenames)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=api_concurrency) as executor:
+        futures = {resource: executor.submit(fetchers[resource]) for resource in ACTION_RESOURCES[action]}
+
+        return {resource: future.result() for resource, future in futures.items()}
+
+
+def create_tenant_dicts(sase_session, inventory, action, sitenames=None):
+    results = fetch_tenant_resources(sase_session=sase_session, action=action, sitenames=sitenames)
+
+    if action in [LIST, CONFIG, CAPACITY, SERVE]:
         #
         # PA Locations
         #
         print("\tPA Locations")
-        resp = sase_session.rest_call("https://api.sase.paloaltonetworks.com/sse/config/v1/locations", method="GET")
-        if resp.cgx_status:
-            itemlist = resp.cgx_content
+        itemlist, resp = results["locations"]
+        if itemlist is not None:
             for item in itemlist:
-                palocations_displayname_value[item["display"]] = item["value"]
-                palocations_value_displayname[item["value"]] = item["display"]
-                palocations_value_aggregion[item["value"]] = item["aggregate_region"]
-                if item["aggregate_region"] in palocations_aggregion_valuelist.keys():
-                    value_list = palocations_aggregion_valuelist[item["aggregate_region"]]
-                    value_list.append(item["value"])
-                    palocations_aggregion_valuelist[item["aggregate_region"]] = value_list
-                else:
-                    palocations_aggregion_valuelist[item["aggregate_region"]] = [item["value"]]
-
-                palocations_value_data[item["value"]] = item
+                latitude, longitude = coordinates(item)
+                inventory.locations.add(Location(item["value"], item["display"],
+                                                 aggregate_region=item["aggregate_region"],
+                                                 latitude=latitude, longitude=longitude))
+                inventory.aggregate_regions.setdefault(item["aggregate_region"], []).append(item["value"])
         else:
-            print("ERR: Could not retrieve PA Locations")
+            print("ERR: Could not retrieve PA Locations.\nExiting..")
             prisma_sase.jd_detailed(resp)
+            sys.exit()
 
         #
         # BW Allocations
         #
         print("\tBW Allocation")
-        resp = sase_session.rest_call("https://api.sase.paloaltonetworks.com/sse/config/v1/bandwidth-allocations",
-                                      method="GET")
-        if resp.cgx_status:
-            itemlist = resp.cgx_content.get("data", None)
+        itemlist, resp = results["bandwidth_allocations"]
+        if itemlist is not None:
             for item in itemlist:
-                palocations_aggregion.append(item["name"])
-                palocs = palocations_aggregion_valuelist[item["name"]]
-                for paloc in palocs:
-                    palocations_bwalloc.append(paloc)
-                    palocation_value_spnnamelist[paloc] = item["spn_name_list"]
-                    palocation_value_bw[paloc] = item["allocated_bandwidth"]
+                inventory.allocated_regions.append(item["name"])
+                for paloc in inventory.aggregate_regions[item["name"]]:
+                    location = inventory.locations.get(paloc)
+                    location.spn_name_list = item["spn_name_list"]
+                    location.bandwidth = item["allocated_bandwidth"]
         else:
-            print("ERR: Could not retrieve BW Allocation")
+            print("ERR: Could not retrieve BW Allocation.\nExiting..")
             prisma_sase.jd_detailed(resp)
+            sys.exit()
 
-        if len(palocations_bwalloc) == 0:
+        if len(inventory.allocated_locations()) == 0:
             print("ERR: BW not allocated to any PA Location. "
                   "Please allocate BW via Workflows -> Prisma Access Setup -> Remote Networks -> Bandwidth Management."
                   "\nExiting..")
             sys.exit()
 
-    if action in [CONFIG, DELETE, BIND]:
+    if action in [CONFIG, DELETE, BIND, CAPACITY, INVENTORY, SERVE]:
         #
         # Sites
         #
         print("\tSites")
-        resp = sase_session.get.sites()
-        if resp.cgx_status:
-            itemlist = resp.cgx_content.get("items", None)
+        itemlist, resp = results["sites"]
+        if itemlist is not None:
+            for item in itemlist:
+                inventory.sites.add(site_record(item))
+        else:
+            print("ERR: Could not retrieve Sites.\nExiting..")
+            prisma_sase.jd_detailed(resp)
+            sys.exit()
+
+    if action in [BIND, INVENTORY, SERVE]:
+        #
+        # Security Zones
+        #
+        print("\tSecurity Zones")
+        itemlist, resp = results["securityzones"]
+        if itemlist is not None:
             for item in itemlist:
-                site_id_name[item["id"]] = item["name"]
-                site_name_id[item["name"]] = item["id"]
+                inventory.zones.add(Record(item["id"], item["name"]))
 
-                if item["element_cluster_role"] == "SPOKE":
-                    spokesitenames.append(item["name"])
         else:
-            print("ERR: Could not retrieve Sites")
+            print("ERR: Could not retrieve Security Zones.\nExiting..")
             prisma_sase.jd_detailed(resp)
+            sys.exit()
 
+    if action in [CONFIG, SERVE]:
         #
-        # Validate Site Name Exists
+        # RN QoS Profiles
         #
-        if sitename not in spokesitenames:
-            print("ERR: Invalid Site Name: {}. Please select a valid site name.\nExiting..".format(sitename))
-            sys.exit()
-
-        sid = site_name_id[sitename]
-
-        if action in [CONFIG, BIND]:
-            #
-            # WAN Networks
-            #
-            print("\tWAN Networks")
-            resp = sase_session.get.wannetworks()
-            if resp.cgx_status:
-                wannetworks = resp.cgx_content.get("items", None)
-                for wannw in wannetworks:
-                    wannw_id_name[wannw["id"]] = wannw["name"]
-                    wannw_name_id[wannw["name"]] = wannw["id"]
-            else:
-                print("ERR: Could not retrieve Sites")
-                prisma_sase.jd_detailed(resp)
+        print("\tRN QoS Profiles")
+        qosprofiles, resp = results["qos_profiles"]
+        if qosprofiles is not None:
+            for profile in qosprofiles:
+                inventory.qos_profiles.add(QoSProfile(profile["id"], profile["name"],
+                                                      default=profile["snippet"] == "default"))
+                if profile["snippet"] == "default":
+                    inventory.default_qos_profile_id = profile["id"]
+
+            if inventory.default_qos_profile_id is None:
+                print("ERR: No default QoS profile found for RN.\nExiting..")
+                sys.exit()
+
+        else:
+            print("ERR: Could not retrieve QoS Profiles for Remote Networks.\nExiting..")
+            prisma_sase.jd_detailed(resp)
+            sys.exit()
+
+    return
+
+
+def create_site_dicts(sase_session, inventory, action, sitename):
+    #
+    # Validate Site Name Exists
+    #
+    site = inventory.spoke(sitename)
+    if site is None:
+        lookup_new_sites(sase_session, inventory, [sitename])
+        site = inventory.spoke(sitename)
+    if site is None:
+        print("ERR: Invalid Site Name: {}. Please select a valid site name.\nExiting..".format(sitename))
+        sys.exit()
 
-            #
-            # Active SWI IDs
-            #
-            print("\tElements Query")
-            active_swis = []
+    sid = site.id
+
+    if action in [CONFIG, BIND, CAPACITY, INVENTORY]:
+        #
+        # Active SWI IDs
+        # Interfaces for every element and the site WAN interfaces are independent
+        # of each other, so they are fetched concurrently and merged in element order
+        #
+        with concurrent.futures.ThreadPoolExecutor(max_workers=api_concurrency) as executor:
+            print("\tSite WAN Interfaces: {}".format(sitename))
+            swi_future = executor.submit(fetch_items, "waninterfaces",
+                                         lambda: single_page(lambda: sase_session.get.waninterfaces(site_id=sid)), key=sid)
+
+            print("\tElements Query: {}".format(sitename))
+            active_swis = set()
             data = {
                 "query_params": {
                     "site_id": {"in": [sid]}
                 }
             }
-            resp = sase_session.post.element_query(data=data)
-            if resp.cgx_status:
-                elements = resp.cgx_content.get("items", None)
+            elements, resp = fetch_items("elements", lambda: query_pages(sase_session.post.element_query, data), key=sid)
+            if elements is not None:
+                elements = list(elements)
+                intf_futures = []
+                for elem in elements:
+                    intf_futures.append(executor.submit(fetch_items, "interfaces",
+                                                        lambda eid=elem["id"]: single_page(lambda: sase_session.get.interfaces(site_id=sid, element_id=eid)),
+                                                        key="{}/{}".format(sid, elem["id"])))
 
                 eids = []
-                for elem in elements:
+                for elem, intf_future in zip(elements, intf_futures):
                     eids.append(elem["id"])
-                    elem_id_name[elem["id"]] = elem["name"]
-                    resp = sase_session.get.interfaces(site_id=sid, element_id=elem["id"])
-                    if resp.cgx_status:
-                        interfaces = resp.cgx_content.get("items", None)
-
-                        servicelinkids = []
+                    element = inventory.elements.add(Element(elem["id"], elem["name"], site_id=sid, servicelink_ids=[]))
+                    interfaces, resp = intf_future.result()
+                    if interfaces is not None:
                         for intf in interfaces:
                             if intf["type"] == "service_link" and "AUTO_PA_SDWAN_MANAGED" in intf["tags"]:
-                                servicelink_id_name[intf["id"]] = intf["name"]
-                                servicelinkids.append(intf["id"])
+                                inventory.servicelinks.add(ServiceLink(intf["id"], intf["name"], element_id=elem["id"]))
+                                element.servicelink_ids.append(intf["id"])
 
                             swis = intf.get("site_wan_interface_ids", None)
                             if swis is not None:
                                 if len(swis) > 0:
-                                    if swis[0] not in active_swis:
-                                        active_swis.append(swis[0])
+                                    active_swis.add(swis[0])
 
-                        elemid_servicelinkidlist[elem["id"]] = servicelinkids
+                    else:
+                        print("ERR: Could not retrieve Interfaces for {}:{}.\nExiting..".format(sitename, elem["name"]))
+                        prisma_sase.jd_detailed(resp)
+                        sys.exit()
 
-                siteid_elemidlist[sid] = eids
+                inventory.site_element_ids[sid] = eids
 
             else:
                 print("ERR: Could not retrieve Elements.\nExiting..")
                 prisma_sase.jd_detailed(resp)
                 sys.exit()
 
-            #
-            # WAN Interfaces
-            #
-            print("\tSite WAN Interfaces")
-            resp = sase_session.get.waninterfaces(site_id=sid)
-            if resp.cgx_status:
-                swis = resp.cgx_content.get("items", None)
-
-                swinames = []
-                swiids = []
-                swi_id_name = {}
-                swi_name_id = {}
-                for swi in swis:
-                    if swi.get("name", None) is None:
-                        swiname = "Circuit to {}".format(wannw_id_name[swi["network_id"]])
-                    else:
-                        swiname = swi["name"]
-
-                    if swi["id"] not in active_swis:
-                        swis_inactive.append(swiname)
-                        continue
-
-                    swi_id_name[swi["id"]] = swiname
-                    swi_name_id[swiname] = swi["id"]
-                    if swi["type"] == "publicwan":
-                        swinames.append(swiname)
-                        swiids.append(swi["id"])
-
-                siteid_swiidname[sid] = swi_id_name
-                siteid_swinameid[sid] = swi_name_id
-                siteid_swiidlist[sid] = swiids
-                siteid_swinamelist[sid] = swinames
-
-            else:
-                print("ERR: Could not retrieve WAN Interfaces")
-                prisma_sase.jd_detailed(resp)
+            swis, resp = swi_future.result()
+            if swis is not None:
+                swis = list(swis)
 
-            if action in [BIND]:
-                #
-                # Security Zones
-                #
-                print("\tSecurity Zones")
-                resp = sase_session.get.securityzones()
-                if resp.cgx_status:
-                    itemlist = resp.cgx_content.get("items", None)
-                    for item in itemlist:
-                        zone_id_name[item["id"]] = item["name"]
-                        zone_name_id[item["name"]] = item["id"]
+        #
+        # WAN Interfaces
+        #
+        if swis is not None:
+            fetch_wannetworks(sase_session, inventory, [swi["network_id"] for swi in swis if swi.get("name", None) is None])
 
+            swiids = []
+            for swi in swis:
+                if swi.get("name", None) is None:
+                    swiname = "Circuit to {}".format(inventory.wannetworks.name(swi["network_id"]))
                 else:
-                    print("ERR: Could not retrieve Security Zones")
-                    prisma_sase.jd_detailed(resp)
+                    swiname = swi["name"]
 
-            if action in [CONFIG]:
-                #
-                # RN QoS Profiles
-                #
-                print("\tRN QoS Profiles")
-                resp = sase_session.rest_call(
-                    "https://api.sase.paloaltonetworks.com/sse/config/v1/qos-profiles?folder=Remote Networks",
-                    method="GET")
-                if resp.cgx_status:
-                    qosprofiles = resp.cgx_content.get("data", None)
-                    for profile in qosprofiles:
-                        rnqosprofile_id_name[profile["id"]] = profile["name"]
-                        rnqosprofile_name_id[profile["name"]] = profile["id"]
-                        if profile["snippet"] == "default":
-                            default_qos_profile_id = profile["id"]
-
-                    if default_qos_profile_id is None:
-                        print("ERR: No default QoS profile found for RN.\nExiting..")
-                        sys.exit()
+                inventory.circuits.add(Circuit(swi["id"], swiname, site_id=sid, type=swi["type"],
+                                               active=swi["id"] in active_swis, bandwidth=circuit_bandwidth(swi)))
+                swiids.append(swi["id"])
 
-                else:
-                    print("ERR: Could not retrieve QoS Profiles for Remote Networks")
-                    prisma_sase.jd_detailed(resp)
+            inventory.site_circuit_ids[sid] = swiids
+
+        else:
+            print("ERR: Could not retrieve WAN Interfaces.\nExiting..")
+            prisma_sase.jd_detailed(resp)
+            sys.exit()
 
     return
 
 
+def list_palocations(inventory):
+    if record_writer is not None:
+        emit(*palocation_records(inventory))
+        return
 
-def list_palocations():
     print("Here are the PA Locations with allocated BW:")
-    for aggregion in palocations_aggregion:
+    for aggregion in inventory.allocated_regions:
         print("{}".format(aggregion))
 
-        palocations = palocations_aggregion_valuelist[aggregion]
+        palocations = inventory.aggregate_regions[aggregion]
         for item in palocations:
-            print("\t{} [{}]: {} Mbps".format(palocations_value_displayname[item], item, palocation_value_bw[item]))
+            location = inventory.locations.get(item)
+            print("\t{} [{}]: {} Mbps".format(location.name, item, location.bandwidth))
 
     return
 
 
-def config_saseconnection(sase_session, sitename, circuit_names_list, palocation):
-    spnname = palocation_value_spnnamelist[palocation]
-    siteid = site_name_id[sitename]
+def plan_saseconnection(sase_session, inventory, sitename, circuit_names_list, palocation):
+    """
+    Operations (POST or PUT) needed to bring the site's SASE Connection to the PA Location in line
+    with the request. Empty if it is up to date, None if the existing connections could not be read.
+    """
+    location = inventory.locations.get(palocation)
+    spnname = location.spn_name_list
+    siteid = inventory.sites.id(sitename)
     swiids = []
 
     if "ALL" in circuit_names_list:
-        swiids = siteid_swiidlist[siteid]
+        swiids = [circuit.id for circuit in inventory.site_circuits(siteid, active=True, circuit_type="publicwan")]
 
     else:
-        swi_name_id = siteid_swinameid[siteid]
         for item in circuit_names_list:
-            swiids.append(swi_name_id[item])
+            swiids.append(inventory.site_circuit(siteid, item).id)
 
     updated_sitename = sitename.replace(" ","")
     rng_name = "{}_{}".format(updated_sitename, spnname[0])
     ipsec_tunnels = []
 
-    swi_id_name = siteid_swiidname[siteid]
     tunnel_count = 1
     for item in swiids:
-        swiname = swi_id_name[item]
+        swiname = inventory.circuits.name(item)
         updated_swiname = swiname.replace(" ","")
-        display_palocation = palocations_value_displayname[palocation]
+        display_palocation = location.name
         updated_display_palocation = display_palocation.replace(" ","")
         name = "{}_{}_{}_tunnel_{}".format(updated_sitename,updated_swiname,updated_display_palocation,tunnel_count)
         tunnelconf = {
@@ -343,7 +1171,7 @@ def config_saseconnection(sase_session, sitename, circuit_names_list, palocation
         "is_active": True,
         "prismaaccess_edge_location": [palocation],
         "prismaaccess_qos_cir_mbps": 1,
-        "prismaaccess_qos_profile_id": default_qos_profile_id,
+        "prismaaccess_qos_profile_id": inventory.default_qos_profile_id,
         "remote_network_groups": [
             {
                 "ipsec_tunnels": ipsec_tunnels,
@@ -359,70 +1187,161 @@ def config_saseconnection(sase_session, sitename, circuit_names_list, palocation
         }
     }
 
-    resp = sase_session.post.prismasase_connections(site_id=siteid, data=data)
-    if resp.cgx_status:
-        print("INFO: SASE Connection request sent to Prisma SASE Controller.\nConnection Details:")
-        print("\tSite Name: {}".format(sitename))
-        print("\tPA Location: {} [{}]. Allocated BW: {} Mbps".format(palocation, spnname[0], palocation_value_bw[palocation]))
-    else:
-        print("ERR: Could not establish SASE Connection")
+    #
+    # Compare with the site's existing connection to the PA Location
+    #
+    resp = sase_session.get.prismasase_connections(site_id=siteid)
+    if not resp.cgx_status:
+        print("ERR: Could not retrieve SASE Connections at Site {}".format(sitename))
         prisma_sase.jd_detailed(resp)
+        return None
 
-    return
-
-def delete_saseconnection(sase_session, sitename):
-    siteid = site_name_id[sitename]
-    resp = sase_session.get.prismasase_connections(site_id=siteid)
-    if resp.cgx_status:
-        saseconnections = resp.cgx_content.get("items", None)
-        if len(saseconnections) == 0:
-            print("WARN: No SASE Connections found at Site {}".format(sitename))
-            return
+    current = None
+    for saseconnection in resp.cgx_content.get("items", None) or []:
+        if palocation in (saseconnection.get("prismaaccess_edge_location", None) or []):
+            current = saseconnection
+            break
 
-        for saseconnection in saseconnections:
-            remote_network_groups = saseconnection.get("remote_network_groups", None)
-            updated_rns = []
-            for rn in remote_network_groups:
-                rn["ipsec_tunnels"] = []
-                updated_rns.append(rn)
-
-            saseconnection["remote_network_groups"] = updated_rns
-            saseconnection["enabled_wan_interface_ids"] = []
-            resp = sase_session.put.prismasase_connections(site_id=siteid,
-                                                  prismasase_connection_id=saseconnection["id"],
-                                                  data=saseconnection)
-            if resp.cgx_status:
-                print("INFO: Circuits unbound from SASE Connection.")
-                print("INFO: SASE Connection cleanup request sent to Prisma SASE Controller.")
-
-                # resp = sase_session.delete.prismasase_connections(site_id=siteid,
-                #                                          prismasase_connection_id=saseconnection["id"])
-                # if resp.cgx_status:
-                #     print("INFO: SASE Connection at Site {} deleted".format(sitename))
-                # else:
-                #     print("ERR: Could not delete SASE Connection")
-                #     prisma_sase.jd_detailed(resp)
+    operation = {
+        "site": sitename,
+        "site_id": siteid,
+        "resource": "prismasase_connections",
+        "summary": "SASE Connection to {} [{}]".format(palocation, spnname[0]),
+        "details": ["Site Name: {}".format(sitename),
+                    "PA Location: {} [{}]. Allocated BW: {} Mbps".format(palocation, spnname[0], location.bandwidth)]
+    }
+    if current is None:
+        operation.update({"method": "post", "args": {"site_id": siteid}, "changes": [], "data": data})
 
-            else:
-                print("ERR: Could not edit SASE Connection")
-                prisma_sase.jd_detailed(resp)
     else:
-        print("ERR: Could not retrieve SASE Connections")
-        prisma_sase.jd_detailed(resp)
+        changes = connection_changes(current, data)
+        if len(changes) == 0:
+            print("INFO: SASE Connection at Site {} to {} is up to date. No changes made.".format(sitename, palocation))
+            return []
 
+        operation.update({"method": "put", "args": {"site_id": siteid, "prismasase_connection_id": current["id"]},
+                          "changes": changes, "data": merge_connection(current, data)})
 
-def bind_zones(sase_session, sitename, zone):
+    return [operation]
 
-    siteid = site_name_id[sitename]
-    zid = zone_name_id[zone]
-    elemids = siteid_elemidlist[siteid]
 
-    for elemid in elemids:
-        servicelinks = elemid_servicelinkidlist[elemid]
-        if len(servicelinks) == 0:
-            print("ERR: No SASE tunnels found on {}:{}".format(sitename, elem_id_name[elemid]))
+def config_saseconnection(sase_session, inventory, sitename, circuit_names_list, palocation):
+    operations = plan_saseconnection(sase_session=sase_session, inventory=inventory, sitename=sitename,
+                                     circuit_names_list=circuit_names_list, palocation=palocation)
+    if operations is None:
+        return False
 
-        else:
+    for operation in operations:
+        resp = apply_operation(sase_session, operation)
+        if resp.cgx_status:
+            if operation["method"] == "post":
+                print("INFO: SASE Connection request sent to Prisma SASE Controller.\nConnection Details:")
+            else:
+                print("INFO: SASE Connection update sent to Prisma SASE Controller. Updated: {}\n"
+                      "Connection Details:".format(", ".join(operation["changes"])))
+            for detail in operation["details"]:
+                print("\t{}".format(detail))
+        else:
+            print("ERR: Could not establish SASE Connection")
+            prisma_sase.jd_detailed(resp)
+            return False
+
+    return True
+
+
+def tunnel_wan_interfaces(rn):
+    return sorted([tunnel.get("wan_interface_id", None) for tunnel in rn.get("ipsec_tunnels", None) or []])
+
+
+def rn_tunnels(rns):
+    return [(sorted(rn.get("spn_name", None) or []), tunnel_wan_interfaces(rn)) for rn in rns or []]
+
+
+def connection_changes(current, desired):
+    """
+    Fields managed by the script that differ between the current and the desired connection:
+    the enabled WAN interfaces, the edge location and, per remote network, the SPN and the WAN
+    interfaces with a tunnel. Everything else (routing, QoS, IPsec settings, names) may have been
+    customised and is not compared.
+    """
+    changes = []
+    for key in ["enabled_wan_interface_ids", "prismaaccess_edge_location"]:
+        if sorted(desired[key]) != sorted(current.get(key, None) or []):
+            changes.append(key)
+
+    if rn_tunnels(desired["remote_network_groups"]) != rn_tunnels(current.get("remote_network_groups", None)):
+        changes.append("remote_network_groups")
+
+    return changes
+
+
+def merge_connection(current, desired):
+    """
+    PUT payload: the current connection with only the managed fields set to the desired values.
+    Existing remote networks keep their name and settings, and existing tunnels for WAN
+    interfaces that stay on the connection are kept as they are. New WAN interfaces get the
+    desired tunnel.
+    """
+    data = dict(current)
+    data["enabled_wan_interface_ids"] = desired["enabled_wan_interface_ids"]
+    data["prismaaccess_edge_location"] = desired["prismaaccess_edge_location"]
+
+    current_rns = current.get("remote_network_groups", None) or []
+    rns = []
+    for count, rn in enumerate(desired["remote_network_groups"]):
+        base = None
+        for current_rn in current_rns:
+            if current_rn.get("name", None) == rn["name"]:
+                base = current_rn
+                break
+        else:
+            if count < len(current_rns):
+                base = current_rns[count]
+
+        if base is None:
+            rns.append(rn)
+            continue
+
+        tunnels = {tunnel.get("wan_interface_id", None): tunnel for tunnel in base.get("ipsec_tunnels", None) or []}
+        updated_rn = dict(base, spn_name=rn["spn_name"])
+        updated_rn["ipsec_tunnels"] = [tunnels.get(tunnel["wan_interface_id"], tunnel) for tunnel in rn["ipsec_tunnels"]]
+        rns.append(updated_rn)
+
+    data["remote_network_groups"] = rns
+    return data
+
+
+def plan_bind_zones(inventory, sitename, zone, bindings=None):
+    """
+    Zone binding for every element at the site with SASE tunnels: a POST, a PUT adding the
+    tunnels to the element's existing binding of the zone, or nothing if they are already bound.
+    bindings maps element ID -> existing zone bindings, if known.
+    """
+    siteid = inventory.sites.id(sitename)
+    zid = inventory.zones.id(zone)
+
+    operations = []
+    for element in inventory.site_elements(siteid):
+        elemid = element.id
+        servicelinks = element.servicelink_ids
+        if len(servicelinks) == 0:
+            print("ERR: No SASE tunnels found on {}:{}".format(sitename, element.name))
+            continue
+
+        current = None
+        for binding in (bindings or {}).get(elemid, []):
+            if binding.get("zone_id", None) == zid:
+                current = binding
+                break
+
+        operation = {
+            "site": sitename,
+            "site_id": siteid,
+            "resource": "elementsecurityzones",
+            "summary": "Zone {} binding on {}".format(zone, element.name),
+            "details": [inventory.servicelinks.name(slid) for slid in servicelinks]
+        }
+        if current is None:
             data = {
                 "zone_id":zid,
                 "lannetwork_ids":[],
@@ -430,25 +1349,2259 @@ def bind_zones(sase_session, sitename, zone):
                 "wanoverlay_ids":[],
                 "waninterface_ids":[]
             }
+            operation.update({"method": "post", "args": {"site_id": siteid, "element_id": elemid},
+                              "changes": [], "data": data})
+
+        else:
+            interface_ids = current.get("interface_ids", None) or []
+            missing = [slid for slid in servicelinks if slid not in interface_ids]
+            if len(missing) == 0:
+                print("INFO: Zone {} already bound to {}:{}. No changes made.".format(zone, sitename, element.name))
+                continue
+
+            operation.update({"method": "put",
+                              "args": {"site_id": siteid, "element_id": elemid, "securityzone_id": current["id"]},
+                              "changes": ["interface_ids"], "data": dict(current, interface_ids=interface_ids + missing)})
+
+        operations.append(operation)
+
+    return operations
+
+
+def bind_zones(sase_session, inventory, sitename, zone):
+
+    siteid = inventory.sites.id(sitename)
+    bindings = fetch_zone_bindings(sase_session, inventory, [siteid])
+    for operation in plan_bind_zones(inventory=inventory, sitename=sitename, zone=zone, bindings=bindings):
+        element_name = inventory.elements.name(operation["args"]["element_id"])
+        resp = apply_operation(sase_session, operation)
+        if resp.cgx_status:
+            print("INFO: Zone {} bound to {}:{} on:".format(zone, sitename, element_name))
+            for slname in operation["details"]:
+                print("\t{}".format(slname))
+        else:
+            print("ERR: Could not bind Zone {} to {}:{}".format(zone, sitename, element_name))
+            prisma_sase.jd_detailed(resp)
+
+    return
+
+
+def fetch_zone_bindings(sase_session, inventory, sids):
+    """
+    Element ID -> existing zone bindings for the elements at the sites, from one query.
+    Falls back to one request per element, and returns None if the bindings cannot be read.
+    """
+    eids = [eid for sid in sids for eid in inventory.site_element_ids.get(sid, [])]
+    bindings = {eid: [] for eid in eids}
+
+    data = {
+        "query_params": {
+            "site_id": {"in": sids}
+        }
+    }
+    try:
+        items = [item for items in query_pages(sase_session.post.elementsecurityzones_query, data) for item in items]
+        if all(item.get("element_id", None) is not None for item in items):
+            for item in items:
+                if item["element_id"] in bindings:
+                    bindings[item["element_id"]].append(item)
+            return bindings
+
+    except APIError:
+        pass
+
+    def element_bindings(eid):
+        resp = sase_session.get.elementsecurityzones(site_id=inventory.elements.get(eid).site_id, element_id=eid)
+        if not resp.cgx_status:
+            return None
+        return resp.cgx_content.get("items", None) or []
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=api_concurrency) as executor:
+        for eid, items in zip(eids, executor.map(element_bindings, eids)):
+            if items is None:
+                print("WARN: Could not retrieve existing zone bindings. Existing bindings will not be checked.")
+                return None
+            bindings[eid] = items
+
+    return bindings
+
+
+##############################################################################
+# Multi-site Zone Binding
+# Elements and service links for every target site are discovered with
+# tenant wide queries instead of a per-site walk
+##############################################################################
+def site_selector(sitename):
+    """
+    True if the site name selects many sites: ALL_SPOKES, a comma separated list or a glob pattern
+    """
+    return sitename == ALL_SPOKES or "," in sitename or any(char in sitename for char in "*?[")
+
+
+def split_sitenames(sitename):
+    """
+    Site names in a comma separated list selector, or None for ALL_SPOKES and glob patterns
+    """
+    if sitename == ALL_SPOKES or "," not in sitename:
+        return None
+
+    return list(dict.fromkeys([name.strip() for name in sitename.split(",") if name.strip()]))
+
+
+def selector_sitenames(sitename):
+    """
+    Site names to look up for a selector, or None if every site is needed.
+    A list also looks up the whole string, in case it is the name of one site.
+    """
+    names = split_sitenames(sitename)
+    if names is None:
+        return None
+
+    return names + [sitename]
+
+
+def select_spokes(inventory, sitename, sase_session=None):
+    """
+    Spoke site names for a selector. A spoke whose name is exactly the selector is taken
+    as is, so names with commas or glob characters (e.g. "Store [West]") still work.
+    Names not in the inventory are looked up on the controller before they are rejected;
+    glob patterns and ALL_SPOKES only match the sites already in the inventory.
+    """
+    names = split_sitenames(sitename)
+    if inventory.spoke(sitename) is None and (names is not None or not site_selector(sitename)):
+        lookup_new_sites(sase_session, inventory, (names or []) + [sitename])
+
+    if inventory.spoke(sitename) is not None:
+        return [sitename]
+
+    if names is not None:
+        invalid = [name for name in names if inventory.spoke(name) is None]
+        if len(invalid) > 0:
+            print("ERR: Invalid Site Name(s): {}. Please select valid spoke site names.\nExiting..".format(", ".join(invalid)))
+            sys.exit()
+        return names
+
+    spokes = inventory.spoke_names()
+    if sitename == ALL_SPOKES:
+        return spokes
+
+    return [name for name in spokes if fnmatch.fnmatchcase(name, sitename)]
+
+
+def resolve_target_sites(sase_session, inventory, action, sitename):
+    """
+    Build the tenant dicts for the sites a selector needs and return the selected spoke names.
+    Exits if none match.
+    """
+    print("INFO: Building Tenant Translation Dicts..")
+    create_tenant_dicts(sase_session=sase_session, inventory=inventory, action=action,
+                        sitenames=selector_sitenames(sitename) if site_selector(sitename) else [sitename])
+    sitenames = select_spokes(inventory, sitename, sase_session=sase_session)
+    if len(sitenames) == 0:
+        print("ERR: No spoke sites match {}.\nExiting..".format(sitename))
+        sys.exit()
+
+    return sitenames
+
+
+def discover_servicelinks(sase_session, inventory, sids):
+    """
+    Elements of all sites with one element query, and their Prisma Access managed service links
+    with one interface query. Falls back to the cached per-element interface requests if the
+    interface query is not usable.
+    """
+    data = {
+        "query_params": {
+            "site_id": {"in": sids}
+        }
+    }
+    try:
+        elements = [item for items in query_pages(sase_session.post.element_query, data) for item in items]
+    except APIError as e:
+        print("ERR: Could not retrieve Elements.\nExiting..")
+        prisma_sase.jd_detailed(e.resp)
+        sys.exit()
+
+    for sid in sids:
+        inventory.site_element_ids[sid] = []
+    for elem in elements:
+        if elem["site_id"] in inventory.site_element_ids:
+            inventory.elements.add(Element(elem["id"], elem["name"], site_id=elem["site_id"], servicelink_ids=[]))
+            inventory.site_element_ids[elem["site_id"]].append(elem["id"])
+
+    eids = [eid for sid in sids for eid in inventory.site_element_ids[sid]]
+    if len(eids) == 0:
+        return
+
+    interfaces = None
+    data = {
+        "query_params": {
+            "element_id": {"in": eids},
+            "type": {"eq": "service_link"}
+        }
+    }
+    try:
+        interfaces = [item for items in query_pages(sase_session.post.interfaces_query, data) for item in items]
+        if any(intf.get("element_id", None) is None for intf in interfaces):
+            interfaces = None
+    except APIError:
+        pass
+
+    if interfaces is None:
+        print("WARN: Interface query not available. Retrieving interfaces per element..")
+
+        def element_interfaces(eid):
+            sid = inventory.elements.get(eid).site_id
+            items, resp = fetch_items("interfaces",
+                                      lambda: single_page(lambda: sase_session.get.interfaces(site_id=sid, element_id=eid)),
+                                      key="{}/{}".format(sid, eid))
+            if items is None:
+                print("ERR: Could not retrieve Interfaces for {}.\nExiting..".format(inventory.elements.name(eid)))
+                prisma_sase.jd_detailed(resp)
+                return None
+            return [dict(intf, element_id=eid) for intf in items]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=api_concurrency) as executor:
+            interfaces = []
+            for items in executor.map(element_interfaces, eids):
+                if items is None:
+                    sys.exit()
+                interfaces.extend(items)
+
+    for intf in interfaces:
+        element = inventory.elements.get(intf["element_id"])
+        if element is not None and intf["type"] == "service_link" and "AUTO_PA_SDWAN_MANAGED" in (intf.get("tags", None) or []):
+            inventory.servicelinks.add(ServiceLink(intf["id"], intf["name"], element_id=element.id))
+            element.servicelink_ids.append(intf["id"])
+
+    return
+
+
+def plan_bind_zones_sites(sase_session, inventory, sitenames, zone):
+    sids = [inventory.sites.id(sitename) for sitename in sitenames]
+    print("\tElements Query: {} sites".format(len(sids)))
+    discover_servicelinks(sase_session, inventory, sids)
+
+    print("\tZone Bindings Query: {} sites".format(len(sids)))
+    bindings = fetch_zone_bindings(sase_session, inventory, sids)
+
+    operations = []
+    for sitename in sitenames:
+        operations.extend(plan_bind_zones(inventory=inventory, sitename=sitename, zone=zone, bindings=bindings))
+
+    return operations
+
+
+##############################################################################
+# Capacity Planning
+# Places a batch of sites on PA Locations without oversubscribing the BW
+# allocated to any aggregate region. Demand is the BW of the circuits each
+# site would connect; existing usage comes from the tenant's SASE Connections.
+##############################################################################
+def coordinates(item):
+    """
+    (latitude, longitude) of a site location or PA Location. (None, None) if unset or 0,0.
+    """
+    try:
+        latitude = float(item.get("latitude", None))
+        longitude = float(item.get("longitude", None))
+    except (TypeError, ValueError):
+        return None, None
+
+    if latitude == 0.0 and longitude == 0.0:
+        return None, None
+
+    return latitude, longitude
+
+
+def circuit_bandwidth(swi):
+    bandwidth = [swi.get(key, None) for key in ["link_bw_down", "link_bw_up"]]
+    return max([float(bw) for bw in bandwidth if bw is not None] or [0.0])
+
+
+def distance_km(site, location):
+    """
+    Great circle distance between a site and a PA Location, None if either has no coordinates
+    """
+    if None in [site.latitude, site.longitude, location.latitude, location.longitude]:
+        return None
+
+    lat1, lon1, lat2, lon2 = map(math.radians, [site.latitude, site.longitude, location.latitude, location.longitude])
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def site_demand(sase_session, inventory, sitename, circuit_names):
+    """
+    Per-site plan_capacity worker: the circuits the site would connect and their total BW.
+    reason is set if the site cannot be placed.
+    """
+    demand = {"site": sitename, "circuits": circuit_names, "demand": 0.0, "reason": None}
+    try:
+        create_site_dicts(sase_session=sase_session, inventory=inventory, action=CAPACITY, sitename=sitename)
+    except SystemExit:
+        demand["reason"] = "Could not retrieve Site WAN Interfaces"
+        return demand
+
+    sid = inventory.sites.id(sitename)
+    if circuit_names == "ALL":
+        circuits = inventory.site_circuits(sid, active=True, circuit_type="publicwan")
+    else:
+        circuits = []
+        for name in parse_circuit_name(circuit_names):
+            circuit = inventory.site_circuit(sid, name)
+            if circuit is None:
+                demand["reason"] = "No active circuit {}".format(name)
+                return demand
+            circuits.append(circuit)
+
+    if len(circuits) == 0:
+        demand["reason"] = "No active public circuits"
+    elif any(circuit.bandwidth <= 0 for circuit in circuits):
+        demand["reason"] = "No BW configured on circuit(s): {}".format(
+            ", ".join([circuit.name for circuit in circuits if circuit.bandwidth <= 0]))
+    else:
+        demand["demand"] = sum([circuit.bandwidth for circuit in circuits])
+
+    return demand
+
+
+def fetch_connection_usage(sase_session, inventory):
+    """
+    BW already connected per PA Location and per SPN, from every SASE Connection in the tenant
+    and the BW of its circuits. Returns (location usage, SPN usage, site ID -> PA Locations).
+    """
+    try:
+        connections = [item for items in query_pages(sase_session.post.prismasase_connections_query, {"query_params": {}})
+                       for item in items]
+    except APIError as e:
+        print("ERR: Could not retrieve SASE Connections.\nExiting..")
+        prisma_sase.jd_detailed(e.resp)
+        sys.exit()
+
+    swiids = list(dict.fromkeys([swiid for connection in connections
+                                 for swiid in connection.get("enabled_wan_interface_ids", None) or []]))
+    bandwidth = {}
+    if len(swiids) > 0:
+        data = {
+            "query_params": {
+                "id": {"in": swiids}
+            }
+        }
+        try:
+            for items in query_pages(sase_session.post.tenant_waninterfaces_query, data):
+                for swi in items:
+                    bandwidth[swi["id"]] = circuit_bandwidth(swi)
+        except APIError as e:
+            print("ERR: Could not retrieve WAN Interfaces of existing SASE Connections.\nExiting..")
+            prisma_sase.jd_detailed(e.resp)
+            sys.exit()
+
+    # The BW of a connection with several PA Locations (or SPNs) is split evenly between them,
+    # so that it is only counted once
+    location_usage = {}
+    spn_usage = {}
+    connected_sites = {}
+    for connection in connections:
+        used = sum([bandwidth.get(swiid, 0.0) for swiid in connection.get("enabled_wan_interface_ids", None) or []])
+        palocations = connection.get("prismaaccess_edge_location", None) or []
+        for palocation in palocations:
+            location_usage[palocation] = location_usage.get(palocation, 0.0) + used / len(palocations)
+        spns = [spn for rn in connection.get("remote_network_groups", None) or [] for spn in rn.get("spn_name", None) or []]
+        for spn in spns:
+            spn_usage[spn] = spn_usage.get(spn, 0.0) + used / len(spns)
+        if connection.get("site_id", None) is not None:
+            connected_sites.setdefault(connection["site_id"], []).extend(palocations)
+
+    return location_usage, spn_usage, connected_sites
+
+
+def place_sites(inventory, demands, region_used, preferred, headroom):
+    """
+    Greedy best fit decreasing: sites with the highest demand are placed first, each on the
+    first candidate PA Location whose aggregate region still has the BW. Candidates are the
+    preferred PA Locations in the given order, or every allocated PA Location nearest first.
+    Returns (placements, unplaced). region_used is updated with the placed demand.
+    """
+    capacity = {}
+    for region in inventory.allocated_regions:
+        location = inventory.locations.get(inventory.aggregate_regions[region][0])
+        capacity[region] = float(location.bandwidth or 0) * (100.0 - headroom) / 100.0
+
+    allocated = inventory.allocated_locations()
+    placements = []
+    unplaced = []
+    for demand in sorted(demands, key=lambda demand: (-demand["demand"], demand["site"])):
+        site = inventory.sites.find(demand["site"])
+        if preferred:
+            candidates = [(value, distance_km(site, inventory.locations.get(value))) for value in preferred]
+        else:
+            candidates = sorted([(value, distance_km(site, inventory.locations.get(value))) for value in allocated],
+                                key=lambda candidate: float("inf") if candidate[1] is None else candidate[1])
+
+        for value, distance in candidates:
+            region = inventory.locations.get(value).aggregate_region
+            if region_used[region] + demand["demand"] <= capacity[region]:
+                region_used[region] += demand["demand"]
+                placements.append(dict(demand, pa_location=value, aggregate_region=region, distance=distance))
+                break
+        else:
+            unplaced.append(dict(demand, reason="No PA Location with {:g} Mbps available".format(demand["demand"])))
+
+    return placements, unplaced
+
+
+def plan_capacity(sase_session, inventory, sitenames, circuit_names, preferred, headroom, workers):
+    print("\tSASE Connections")
+    location_usage, spn_usage, connected_sites = fetch_connection_usage(sase_session, inventory)
+
+    unplaced = []
+    pending = []
+    for sitename in sitenames:
+        palocations = connected_sites.get(inventory.sites.id(sitename), None)
+        if palocations is not None:
+            unplaced.append({"site": sitename, "demand": 0.0,
+                             "reason": "Already connected to {}".format(", ".join(palocations) or "a PA Location")})
+        else:
+            pending.append(sitename)
+
+    print("\tSite WAN Interfaces: {} sites".format(len(pending)))
+    demands = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for demand in executor.map(lambda sitename: site_demand(sase_session, inventory, sitename, circuit_names), pending):
+            if demand["reason"] is None:
+                demands.append(demand)
+            else:
+                unplaced.append(demand)
+
+    region_existing = {region: sum([location_usage.get(value, 0.0) for value in inventory.aggregate_regions[region]])
+                       for region in inventory.allocated_regions}
+    region_used = dict(region_existing)
+    placements, full = place_sites(inventory, demands, region_used, preferred, headroom)
+    unplaced.extend(full)
+
+    print("\nCapacity Plan: {} site(s) placed, {} not placed".format(len(placements), len(unplaced)))
+    print("\t{:<32}{:>12}{:>12}{:>12}{:>12}".format("Aggregate Region", "Allocated", "Existing", "Planned", "Remaining"))
+    for region in inventory.allocated_regions:
+        allocated = float(inventory.locations.get(inventory.aggregate_regions[region][0]).bandwidth or 0)
+        print("\t{:<32}{:>12g}{:>12g}{:>12g}{:>12g}".format(region, allocated, region_existing[region],
+                                                            region_used[region] - region_existing[region],
+                                                            allocated - region_used[region]))
+
+    if len(spn_usage) > 0:
+        print("Existing SASE Connection BW per SPN (Mbps):")
+        for spn in sorted(spn_usage):
+            print("\t{}: {:g}".format(spn, spn_usage[spn]))
+
+    if len(placements) > 0:
+        print("Placements:")
+        for placement in sorted(placements, key=lambda placement: placement["site"]):
+            print("\t{} -> {} [{}]: {:g} Mbps{}".format(placement["site"], placement["pa_location"], placement["aggregate_region"],
+                                                        placement["demand"], "" if placement["distance"] is None
+                                                        else ", {:.0f} km".format(placement["distance"])))
+
+    if len(unplaced) > 0:
+        print("Not placed:")
+        for demand in sorted(unplaced, key=lambda demand: demand["site"]):
+            print("\t{}: {}".format(demand["site"], demand["reason"]))
+
+    return placements
+
+
+def write_capacity_manifest(filename, placements):
+    """
+    Write the placements as a manifest for --manifest. YAML if the file name ends in .yml/.yaml, CSV otherwise.
+    """
+    rows = [{"site": placement["site"], "circuits": placement["circuits"], "pa_location": placement["pa_location"]}
+            for placement in sorted(placements, key=lambda placement: placement["site"])]
+    try:
+        with open(filename, "w", newline="") as f:
+            if filename.lower().endswith((".yml", ".yaml")):
+                yaml.safe_dump(rows, f, default_flow_style=False, sort_keys=False)
+            else:
+                writer = csv.DictWriter(f, fieldnames=["site", "circuits", "pa_location"])
+                writer.writeheader()
+                writer.writerows(rows)
+    except OSError as e:
+        print("ERR: Could not write manifest to {}: {}\nExiting..".format(filename, e))
+        sys.exit()
+
+    print("INFO: Manifest with {} site(s) written to {}".format(len(rows), filename))
+
+
+def parse_circuit_name(circuit_names):
+    if "," in circuit_names:
+        tmp = circuit_names.split(",")
+
+        return tmp
+    else:
+        return [circuit_names]
+
+
+def validate_config_input(inventory, sitename, circuit_names, palocation):
+    circuit_names_list = []
+    sid = inventory.sites.id(sitename)
+    swinames = [circuit.name for circuit in inventory.site_circuits(sid, active=True, circuit_type="publicwan")]
+    if circuit_names not in ["ALL"]:
+        circuit_names_list = parse_circuit_name(circuit_names)
+
+        for item in circuit_names_list:
+            if item not in swinames:
+                if item in [circuit.name for circuit in inventory.site_circuits(sid, active=False)]:
+                    print("ERR: Circuit {} not bound to any interface at Site {}. "
+                          "Please select from the following:".format(item, sitename))
+                else:
+                    print("ERR: Invalid circuit name: {}\nNo such circuit configured at Site {}. "
+                          "Please select from the following:".format(item, sitename))
+
+                for swi in swinames:
+                    print("\t{}".format(swi))
+                print("Exiting..")
+                sys.exit()
+    else:
+        circuit_names_list = ["ALL"]
+
+    palocations_bwalloc = inventory.allocated_locations()
+    if palocation not in inventory.locations:
+        print("ERR: Invalid PA Location! Please select from the following:")
+        for paloc in palocations_bwalloc:
+            print("\t{}".format(paloc))
+
+        print("Exiting..")
+        sys.exit()
+
+    else:
+        if palocation not in palocations_bwalloc:
+            print("ERR: No BW allocated to PA Location: {}".format(palocation))
+            print("Please select a PA Location from the following:")
+            for paloc in palocations_bwalloc:
+                print("\t{}".format(paloc))
+
+            print("Exiting..")
+            sys.exit()
+
+    return circuit_names_list
+
+
+##############################################################################
+# Request Retry & Rate Limiting
+# Every SDK call goes through API.rest_call(), so wrapping it on the session
+# covers rest_call, get.*, post.*, put.* and delete.* alike. Throttled and
+# unavailable responses are retried with exponential backoff and jitter,
+# honoring Retry-After. All threads share one token bucket.
+##############################################################################
+class TokenBucket(object):
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+def retry_after(resp):
+    """
+    Seconds requested by a Retry-After header (delta-seconds or HTTP date), or None
+    """
+    value = resp.headers.get("Retry-After", None) if getattr(resp, "headers", None) is not None else None
+    if value is None:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = email_utils.parsedate_to_datetime(value)
+        return max(0.0, (retry_at - datetime.datetime.now(retry_at.tzinfo)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(url, method, resp):
+    """
+    Connection errors are already retried by the SDK's HTTP adapter, so only status codes are handled here.
+    POSTs that create objects are only retried when the controller did not process them (429/503).
+    Query POSTs are read-only and are treated like GETs.
+    """
+    status_code = getattr(resp, "status_code", None)
+    if not isinstance(status_code, int) or status_code not in RETRY_STATUS:
+        return False
+
+    if method.lower() == "post" and not url.rstrip("/").endswith("/query"):
+        return status_code in [429, 503]
+
+    return True
+
+
+def install_request_wrapper(sase_session, limiter):
+    rest_call = sase_session.rest_call
+
+    def rest_call_with_retry(url, method, *args, **kwargs):
+        attempt = 0
+        while True:
+            if limiter is not None:
+                limiter.acquire()
+
+            start = time.time()
+            resp = rest_call(url, method, *args, **kwargs)
+            if api_profiler is not None:
+                api_profiler.record(method, url, resp, start, time.time(), attempt)
+
+            if resp is False or resp.cgx_status or attempt >= max_retries or not is_retryable(url, method, resp):
+                return resp
+
+            delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+            requested = retry_after(resp)
+            if requested is not None:
+                delay = min(RETRY_MAX_DELAY, requested) + delay / 2
+
+            attempt += 1
+            print("WARN: {} {} returned {}. Retry {}/{} in {:.1f}s".format(method.upper(), url, resp.status_code,
+                                                                         attempt, max_retries, delay))
+            time.sleep(delay)
+
+    sase_session.rest_call = rest_call_with_retry
+    return sase_session
+
+
+##############################################################################
+# API Profiling
+# With --profile every request attempt made through rest_call() is recorded
+# (endpoint, status, bytes, latency) and summarized at exit
+##############################################################################
+class APIProfiler(object):
+    def __init__(self):
+        self.calls = []
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def record(self, method, url, resp, start, end, attempt):
+        status_code = getattr(resp, "status_code", None)
+        content = getattr(resp, "content", None) if resp is not False else None
+        call = {
+            "method": method.upper(),
+            "url": url,
+            "endpoint": endpoint_name(url),
+            "status": status_code if isinstance(status_code, int) else None,
+            "bytes": len(content) if isinstance(content, bytes) else 0,
+            "start": start,
+            "end": end,
+            "attempt": attempt
+        }
+        with self.lock:
+            self.calls.append(call)
+
+    def merge(self, filename, tsg_id):
+        """
+        Add the calls of a per-tenant run's json profile, tagged with its TSG
+        """
+        try:
+            with open(filename, "r") as f:
+                calls = json.load(f)["calls"]
+        except (OSError, ValueError, KeyError):
+            return
+
+        with self.lock:
+            self.calls.extend(dict(call, tsg_id=tsg_id) for call in calls)
+
+    def summary(self):
+        """
+        Per endpoint stats, slowest total time first
+        """
+        endpoints = {}
+        for call in list(self.calls):
+            key = (call["method"], call["endpoint"])
+            latency = call["end"] - call["start"]
+            stats = endpoints.setdefault(key, {"method": call["method"], "endpoint": call["endpoint"], "count": 0,
+                                               "errors": 0, "bytes": 0, "total": 0.0, "max": 0.0, "statuses": {}})
+            stats["count"] += 1
+            stats["bytes"] += call["bytes"]
+            stats["total"] += latency
+            stats["max"] = max(stats["max"], latency)
+            status = str(call["status"])
+            stats["statuses"][status] = stats["statuses"].get(status, 0) + 1
+            if call["status"] is None or call["status"] >= 400:
+                stats["errors"] += 1
+
+        for stats in endpoints.values():
+            stats["avg"] = stats["total"] / stats["count"]
+
+        return sorted(endpoints.values(), key=lambda stats: stats["total"], reverse=True)
+
+    def print_report(self):
+        summary = self.summary()
+        print("\nAPI Profile: {} calls, {:.2f}s wall time".format(len(self.calls), time.time() - self.started))
+        print("{:<7}{:<60}{:>7}{:>7}{:>12}{:>10}{:>10}{:>10}".format("Method", "Endpoint", "Calls", "Errors",
+                                                                       "Bytes", "Total(s)", "Avg(ms)", "Max(ms)"))
+        for stats in summary:
+            print("{:<7}{:<60}{:>7}{:>7}{:>12}{:>10.2f}{:>10.0f}{:>10.0f}".format(stats["method"], stats["endpoint"][:59],
+                                                                                  stats["count"], stats["errors"],
+                                                                                  stats["bytes"], stats["total"],
+                                                                                  stats["avg"] * 1000, stats["max"] * 1000))
+
+    def spans(self):
+        """
+        Calls as OpenTelemetry style spans (OTLP JSON field names), one trace per run
+        """
+        trace_id = uuid.uuid4().hex
+        spans = []
+        for call in list(self.calls):
+            spans.append({
+                "traceId": trace_id,
+                "spanId": uuid.uuid4().hex[:16],
+                "name": "{} {}".format(call["method"], call["endpoint"]),
+                "kind": "SPAN_KIND_CLIENT",
+                "startTimeUnixNano": int(call["start"] * 1e9),
+                "endTimeUnixNano": int(call["end"] * 1e9),
+                "attributes": {
+                    "http.method": call["method"],
+                    "http.url": call["url"],
+                    "http.status_code": call["status"],
+                    "http.response_content_length": call["bytes"],
+                    "http.resend_count": call["attempt"]
+                },
+                "status": {"code": "STATUS_CODE_OK" if call["status"] is not None and call["status"] < 400 else "STATUS_CODE_ERROR"}
+            })
+            if "tsg_id" in call:
+                spans[-1]["attributes"]["tenant.tsg_id"] = call["tsg_id"]
+        return spans
+
+    def write(self, filename, output_format):
+        if output_format == "spans":
+            document = {"spans": self.spans()}
+        else:
+            document = {"wall_time": time.time() - self.started, "endpoints": self.summary(), "calls": list(self.calls)}
+
+        try:
+            with open(filename, "w") as f:
+                json.dump(document, f, indent=2)
+            print("INFO: API profile written to {}".format(filename))
+        except OSError as e:
+            print("ERR: Could not write API profile to {}: {}".format(filename, e))
+
+
+def endpoint_name(url):
+    """
+    URL path with object IDs replaced by {id}, so calls group by endpoint
+    """
+    path = url.split("://", 1)[-1].split("?", 1)[0]
+    path = path[path.find("/"):] if "/" in path else "/"
+    segments = path.split("/")
+    if "api" in segments:
+        # SD-WAN paths alternate collection/ID after /api/
+        start = segments.index("api") + 1
+        for position in range(start + 1, len(segments), 2):
+            if segments[position] not in ["query", "status"]:
+                segments[position] = "{id}"
+    else:
+        segments = ["{id}" if re.match(r"^(?=.*\d)[0-9a-fA-F-]{8,}$", segment) else segment for segment in segments]
+
+    return "/".join(segments)
+
+
+##############################################################################
+# Completion Tracking
+# With --wait every connection sent to the controller is tracked until all
+# of its tunnels are up. One scheduler polls the connection status of every
+# pending site, backing off per site while its status does not change.
+##############################################################################
+def parse_connection_status(status):
+    """
+    Connection state and WAN interface ID / tunnel name -> tunnel status (both lower case) from a
+    connection status. Returns None if the payload does not have the expected fields.
+    """
+    if not isinstance(status, dict) or "state" not in status or \
+            not isinstance(status.get("remote_network_groups", None) or [], list):
+        return None
+
+    states = {}
+    for rn in status.get("remote_network_groups", None) or []:
+        for tunnel in rn.get("ipsec_tunnels", None) or []:
+            if "status" not in tunnel:
+                return None
+
+            for key in ["wan_interface_id", "name"]:
+                if tunnel.get(key, None) is not None:
+                    states[tunnel[key]] = str(tunnel["status"]).lower()
+
+    state = status["state"]
+    return (str(state).lower() if state is not None else None), states
+
+
+def poll_until_done(executor, items, poll, pending, deadline, polled=None):
+    """
+    Poll each pending item with the executor whenever its next_poll time is due, until no item
+    is pending. Everything still pending gets a last poll at the deadline. polled(final) is
+    called after every round of polls. Returns True if the deadline was reached.
+    """
+    while True:
+        waiting = [item for item in items if pending(item)]
+        if len(waiting) == 0:
+            return False
+
+        now = time.time()
+        final = now >= deadline
+        due = [item for item in waiting if final or item["next_poll"] <= now]
+        if len(due) == 0:
+            time.sleep(max(0.0, min(deadline, min(item["next_poll"] for item in waiting)) - now))
+            continue
+
+        for future in [executor.submit(poll, item) for item in due]:
+            future.result()
+
+        if polled is not None:
+            polled(final)
+        if final:
+            return True
+
+
+class ConnectionTracker(object):
+    def __init__(self):
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def add(self, operation, resp):
+        connection_id = operation["args"].get("prismasase_connection_id", None) or \
+            (resp.cgx_content or {}).get("id", None)
+        if connection_id is None:
+            print("WARN: No connection ID returned for Site {}. Status will not be tracked.".format(operation["site"]))
+            return
+
+        submitted = time.time()
+        tunnels = {}
+        for rn in operation["data"].get("remote_network_groups", None) or []:
+            for tunnel in rn.get("ipsec_tunnels", None) or []:
+                tunnels[tunnel["wan_interface_id"]] = tunnel.get("name", tunnel["wan_interface_id"])
+
+        with self.lock:
+            self.connections.append({
+                "site": operation["site"],
+                "site_id": operation["site_id"],
+                "id": connection_id,
+                "summary": operation["summary"],
+                "tunnels": tunnels,
+                "submitted": submitted,
+                # WAN interface ID -> seconds from submission to first seen up
+                "up": {},
+                "states": {},
+                "state": None,
+                "done": False,
+                "failed": False,
+                "interval": WAIT_POLL_MIN,
+                "next_poll": submitted + WAIT_POLL_MIN
+            })
+
+    def poll(self, sase_session, connection):
+        resp = sase_session.get.prismasase_connections_status(site_id=connection["site_id"],
+                                                              prismasase_connection_id=connection["id"])
+        polled = time.time()
+        progress = False
+        parsed = parse_connection_status(resp.cgx_content) if resp.cgx_status else None
+        if resp.cgx_status and parsed is None:
+            print("ERR: Unrecognised SASE Connection status payload at Site {}".format(connection["site"]))
+            prisma_sase.jd_detailed(resp)
+            connection["failed"] = True
+            connection["done"] = True
+
+        elif resp.cgx_status:
+            connection["state"], states = parsed
+            for wid, name in connection["tunnels"].items():
+                state = states.get(wid, states.get(name, None))
+                if state != connection["states"].get(wid, None):
+                    progress = True
+                connection["states"][wid] = state
+                if wid not in connection["up"] and state in TUNNEL_UP_STATES:
+                    connection["up"][wid] = polled - connection["submitted"]
+
+            if connection["state"] in CONNECTION_FAILED_STATES:
+                connection["failed"] = True
+                connection["done"] = True
+            elif len(connection["up"]) == len(connection["tunnels"]):
+                connection["done"] = True
+
+        else:
+            print("WARN: Could not retrieve SASE Connection status at Site {}".format(connection["site"]))
+
+        # Poll again soon after a change, less often while the status stays the same
+        if progress:
+            connection["interval"] = WAIT_POLL_MIN
+        else:
+            connection["interval"] = min(WAIT_POLL_MAX, connection["interval"] * WAIT_POLL_BACKOFF)
+        connection["next_poll"] = time.time() + connection["interval"]
+
+    def wait(self, sase_session, timeout):
+        if len(self.connections) == 0:
+            return True
+
+        print("INFO: Waiting up to {}s for tunnels to come up on {} SASE Connection(s)..".format(timeout, len(self.connections)))
+        deadline = time.time() + timeout
+
+        def polled(final):
+            done = len([connection for connection in self.connections if connection["done"]])
+            print("INFO: {}/{} SASE Connection(s) done after {:.0f}s".format(done, len(self.connections),
+                                                                            time.time() - deadline + timeout))
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=api_concurrency) as executor:
+            poll_until_done(executor, self.connections, poll=lambda connection: self.poll(sase_session, connection),
+                            pending=lambda connection: not connection["done"], deadline=deadline, polled=polled)
+
+        return self.report()
+
+    def report(self):
+        up = [connection for connection in self.connections if connection["done"] and not connection["failed"]]
+        print("\nConnection Status: {} up, {} not up".format(len(up), len(self.connections) - len(up)))
+        for connection in sorted(self.connections, key=lambda connection: connection["site"]):
+            if connection["done"] and not connection["failed"]:
+                print("\tUP: {}: {} ({:.0f}s)".format(connection["site"], connection["summary"],
+                                                      max(list(connection["up"].values()) or [0.0])))
+            else:
+                print("\t{}: {}: {}".format("FAILED" if connection["failed"] else "PENDING", connection["site"],
+                                            connection["summary"]))
+
+            for wid, name in connection["tunnels"].items():
+                if wid in connection["up"]:
+                    print("\t\t{}: up after {:.0f}s".format(name, connection["up"][wid]))
+                else:
+                    print("\t\t{}: {}".format(name, connection["states"].get(wid, None) or "unknown"))
+
+        return len(up) == len(self.connections)
+
+
+##############################################################################
+# Decommission
+# delete_saseconn tears down the SASE Connections of many sites at once. The
+# unbind PUTs (no tunnels, no WAN interfaces) of every site are sent
+# concurrently, one scheduler polls each site until the controller has
+# removed its tunnels, and a site's connections are deleted as soon as it
+# has settled. Sites that do not settle before the timeout are not deleted.
+# The unbind and delete requests are planned up front, so they can also be
+# written with --plan and sent later with --apply.
+##############################################################################
+def fetch_site_connections(sase_session, sids):
+    """
+    Site ID -> SASE Connections, with one query for all sites
+    """
+    data = {
+        "query_params": {
+            "site_id": {"in": sids}
+        }
+    }
+    connections = {}
+    try:
+        for items in query_pages(sase_session.post.prismasase_connections_query, data):
+            for item in items:
+                connections.setdefault(item["site_id"], []).append(item)
+    except APIError as e:
+        print("ERR: Could not retrieve SASE Connections.\nExiting..")
+        prisma_sase.jd_detailed(e.resp)
+        sys.exit()
+
+    return connections
+
+
+def plan_decommission(sase_session, inventory, sitenames):
+    """
+    Unbind (PUT without tunnels and WAN interfaces) and DELETE operations for the SASE Connections
+    of every site. Connections that are already unbound only get the DELETE.
+    """
+    sids = [inventory.sites.id(sitename) for sitename in sitenames]
+    connections = fetch_site_connections(sase_session, sids)
+
+    operations = []
+    for sitename, sid in zip(sitenames, sids):
+        for saseconnection in connections.get(sid, []):
+            rns = saseconnection.get("remote_network_groups", None) or []
+            operation = {
+                "site": sitename,
+                "site_id": sid,
+                "resource": "prismasase_connections",
+                "args": {"site_id": sid, "prismasase_connection_id": saseconnection["id"]},
+                "summary": "SASE Connection to {}".format(", ".join(saseconnection.get("prismaaccess_edge_location", None) or [])
+                                                          or saseconnection["id"]),
+                "details": ["Site Name: {}".format(sitename)]
+            }
+            if saseconnection.get("enabled_wan_interface_ids", None) or any(rn.get("ipsec_tunnels", None) for rn in rns):
+                data = dict(saseconnection, enabled_wan_interface_ids=[],
+                            remote_network_groups=[dict(rn, ipsec_tunnels=[]) for rn in rns])
+                operations.append(dict(operation, method="put", changes=["enabled_wan_interface_ids", "ipsec_tunnels"],
+                                       data=data))
+
+            operations.append(dict(operation, method="delete", changes=[], data={}))
+
+    empty = [sitename for sitename, sid in zip(sitenames, sids) if len(connections.get(sid, [])) == 0]
+    if len(empty) > 0:
+        if len(sitenames) == 1:
+            print("WARN: No SASE Connections found at Site {}".format(sitenames[0]))
+        else:
+            print("INFO: {} of {} sites have no SASE Connections".format(len(empty), len(sitenames)))
+
+    return operations
+
+
+def confirm_decommission(operations, confirmed):
+    """
+    Deleting the SASE Connections of more than one site needs --confirm, or a yes at the prompt
+    """
+    sitenames = sorted(set([operation["site"] for operation in operations]))
+    if len(sitenames) < 2 or confirmed:
+        return
+
+    if not sys.stdin.isatty():
+        print("ERR: This deletes the SASE Connections of {} sites. Use --confirm to proceed.\nExiting..".format(len(sitenames)))
+        sys.exit()
+
+    print("SASE Connections to delete:")
+    for operation in operations:
+        if operation["method"] == "delete":
+            print("\t{}: {}".format(operation["site"], operation["summary"]))
+    answer = input("Delete the SASE Connections of these {} sites? [y/N]: ".format(len(sitenames)))
+    if answer.strip().lower() not in ["y", "yes"]:
+        print("INFO: No changes made.")
+        sys.exit()
+
+
+def unbind_site(sase_session, site, journal):
+    """
+    Remove the tunnels and WAN interfaces from the connections at the site
+    """
+    if journal is not None:
+        journal.record(site["site"], "started")
+
+    for operation in site["unbind"]:
+        resp = apply_operation(sase_session, operation)
+        if not resp.cgx_status:
+            print("ERR: Could not unbind circuits from SASE Connection at Site {}".format(site["site"]))
+            prisma_sase.jd_detailed(resp)
+            site["error"] = "unbind failed"
+            return
+
+        site["pending"].append(operation["args"]["prismasase_connection_id"])
+
+    site["unbound"] = time.time()
+    site["next_poll"] = site["unbound"] + UNBIND_POLL_MIN
+
+
+def poll_site(sase_session, site):
+    """
+    Check the connections still being torn down at the site
+    """
+    progress = False
+    for connection_id in list(site["pending"]):
+        resp = sase_session.get.prismasase_connections_status(site_id=site["site_id"],
+                                                              prismasase_connection_id=connection_id)
+        if not resp.cgx_status:
+            print("WARN: Could not retrieve SASE Connection status at Site {}".format(site["site"]))
+            continue
+
+        parsed = parse_connection_status(resp.cgx_content)
+        if parsed is None:
+            print("ERR: Unrecognised SASE Connection status payload at Site {}".format(site["site"]))
+            prisma_sase.jd_detailed(resp)
+            site["error"] = "unrecognised status payload"
+            return
+
+        state, states = parsed
+        if state in CONNECTION_FAILED_STATES:
+            site["error"] = "connection {} is {}".format(connection_id, state)
+            return
+        if len(states) == 0 and state not in UNBIND_PENDING_STATES:
+            site["pending"].remove(connection_id)
+            progress = True
+
+    if len(site["pending"]) == 0:
+        site["settled"] = time.time()
+        return
+
+    # Poll again soon after a change, less often while nothing happens
+    site["interval"] = UNBIND_POLL_MIN if progress else min(UNBIND_POLL_MAX, site["interval"] * WAIT_POLL_BACKOFF)
+    site["next_poll"] = time.time() + site["interval"]
+
+
+def delete_site(sase_session, site, journal):
+    for operation in site["delete"]:
+        resp = apply_operation(sase_session, operation)
+        if not resp.cgx_status:
+            print("ERR: Could not delete SASE Connection at Site {}".format(site["site"]))
+            prisma_sase.jd_detailed(resp)
+            site["error"] = "delete failed"
+            return
+
+    site["deleted"] = time.time()
+    if journal is not None:
+        journal.record(site["site"], "done")
+
+
+def decommission_sites(sase_session, operations, workers, timeout, journal=None):
+    """
+    Send the unbind and delete operations of every site, with up to workers requests at a time.
+    A site's DELETEs are sent once the tunnels of its unbound connections are removed. With a
+    journal each site is recorded as started before its first request and done or failed after
+    its last. Returns the per-site results.
+    """
+    sites = {}
+    for operation in operations:
+        site = sites.setdefault(operation["site_id"], {"site": operation["site"], "site_id": operation["site_id"],
+                                                       "unbind": [], "delete": [], "pending": [], "error": None,
+                                                       "unbound": None, "settled": None, "deleted": None,
+                                                       "delete_submitted": False, "interval": UNBIND_POLL_MIN,
+                                                       "next_poll": None})
+        site["delete" if operation["method"] == "delete" else "unbind"].append(operation)
+    sites = list(sites.values())
+    if len(sites) == 0:
+        return sites
+
+    print("INFO: Unbinding {} SASE Connection(s) at {} sites with {} workers..".format(
+        sum(len(site["delete"]) for site in sites), len(sites), workers))
+    started = time.time()
+    settled = [0]
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(unbind_site, sase_session, site, journal) for site in sites]
+
+            def submit_deletes(final=False):
+                for site in sites:
+                    # Sites with nothing left to tear down are deleted right away
+                    if site["settled"] is None and site["error"] is None and site["unbound"] is not None and \
+                            len(site["pending"]) == 0:
+                        site["settled"] = site["unbound"]
+                    if site["settled"] is not None and not site["delete_submitted"]:
+                        site["delete_submitted"] = True
+                        futures.append(executor.submit(delete_site, sase_session, site, journal))
+
+                count = len([site for site in sites if site["settled"] is not None])
+                if count > settled[0]:
+                    settled[0] = count
+                    print("INFO: {}/{} sites unbound after {:.0f}s".format(count, len(sites), time.time() - started))
+
+            try:
+                for future in concurrent.futures.as_completed(list(futures)):
+                    future.result()
+
+                submit_deletes()
+                if poll_until_done(executor, sites, poll=lambda site: poll_site(sase_session, site),
+                                   pending=lambda site: site["settled"] is None and site["error"] is None,
+                                   deadline=started + timeout, polled=submit_deletes):
+                    for site in sites:
+                        if site["settled"] is None and site["error"] is None:
+                            site["error"] = "tunnels not removed after {}s".format(timeout)
+
+                for future in list(futures):
+                    future.result()
+
+            except KeyboardInterrupt:
+                interrupted(futures, journal)
+                raise
+
+    finally:
+        if journal is not None:
+            for site in sites:
+                if site["error"] is not None:
+                    journal.record(site["site"], "failed", site["error"])
+
+    failed = [site for site in sites if site["deleted"] is None]
+    print("\nDecommission Summary: {} succeeded, {} failed".format(len(sites) - len(failed), len(failed)))
+    for site in sorted(sites, key=lambda site: site["site"]):
+        timings = []
+        for name, start, end in [("unbind", started, site["unbound"]), ("settle", site["unbound"], site["settled"]),
+                                 ("delete", site["settled"], site["deleted"])]:
+            if start is not None and end is not None:
+                timings.append("{} {:.1f}s".format(name, end - start))
+        if site["deleted"] is not None:
+            timings.append("total {:.1f}s".format(site["deleted"] - started))
+            print("\tSUCCESS: {} ({})".format(site["site"], ", ".join(timings)))
+        else:
+            print("\tFAILED: {}: {} ({})".format(site["site"], site["error"], ", ".join(timings) or "-"))
+
+    return sites
+
+
+##############################################################################
+# Login & Token Store
+# Access tokens are stored encrypted with a key derived from the client
+# secret, keyed by client ID and TSG ID. Requires the cryptography module.
+##############################################################################
+def token_store_key(client_id, tsg_id):
+    return hashlib.sha256("{}:{}".format(client_id, tsg_id).encode("utf-8")).hexdigest()
+
+
+def token_cipher(client_secret):
+    from cryptography.fernet import Fernet
+
+    key = base64.urlsafe_b64encode(hashlib.sha256(client_secret.encode("utf-8")).digest())
+    return Fernet(key)
+
+
+def read_token_store():
+    if not os.path.isfile(TOKEN_FILE):
+        return {}
+
+    try:
+        with open(TOKEN_FILE, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def load_token(client_id, client_secret, tsg_id):
+    """
+    Return the stored (access_token, expires_at) for the service account, or None if
+    there is no usable token or it expires within TOKEN_REFRESH_MARGIN seconds.
+    """
+    from cryptography.fernet import InvalidToken
+
+    blob = read_token_store().get(token_store_key(client_id, tsg_id), None)
+    if blob is None:
+        return None
+
+    try:
+        token = json.loads(token_cipher(client_secret).decrypt(blob.encode("utf-8")))
+    except (InvalidToken, ValueError):
+        return None
+
+    if token.get("expires_at", 0) - time.time() <= TOKEN_REFRESH_MARGIN:
+        return None
+
+    return token["access_token"], token["expires_at"]
+
+
+def save_token(client_id, client_secret, tsg_id, access_token, expires_at):
+    """
+    Add the token to the store. Concurrent runs (e.g. --tsg_ids) are serialised with a lock
+    file where fcntl is available, and the store is replaced atomically so it is never torn.
+    """
+    payload = json.dumps({"access_token": access_token, "expires_at": expires_at})
+    blob = token_cipher(client_secret).encrypt(payload.encode("utf-8")).decode("utf-8")
+
+    temp_file = None
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(TOKEN_FILE + ".lock", "a") as lock_file:
+            if importlib.util.find_spec("fcntl") is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+
+            store = read_token_store()
+            store[token_store_key(client_id, tsg_id)] = blob
+            # mkstemp creates the file readable by the owner only
+            fd, temp_file = tempfile.mkstemp(prefix=".tokens_", suffix=".json", dir=CACHE_DIR)
+            with os.fdopen(fd, "w") as f:
+                json.dump(store, f)
+            os.replace(temp_file, TOKEN_FILE)
+    except OSError as e:
+        print("WARN: Could not save access token to {}: {}".format(TOKEN_FILE, e))
+        if temp_file is not None and os.path.exists(temp_file):
+            os.remove(temp_file)
+
+
+def restore_token(sase_session, client_id, client_secret, tsg_id, access_token, expires_at):
+    """
+    Set up the session with a stored access token. The SDK still holds the client credentials,
+    so it regenerates the token by itself if it expires mid-run.
+    The profile call validates the token; returns False if the controller rejects it.
+    """
+    # Mirrors interactive.login_secret() of prisma_sase 6.x (tested with 6.8.1b1), minus the JWT request.
+    # grant_type, scope and jwt_expires_at are SDK internals used by _generate_jwt() on token refresh.
+    sase_session.client_id = client_id
+    sase_session.client_secret = client_secret
+    sase_session.tsg_id = tsg_id
+    sase_session.grant_type = "client_credentials"
+    sase_session.scope = "tsg_id:{} email profile".format(tsg_id)
+    sase_session.jwt_expires_at = datetime.datetime.fromtimestamp(expires_at)
+
+    auth_header = {"authorization": "Bearer {}".format(access_token)}
+    sase_session.add_headers(auth_header)
+    sase_session.websocket_add_headers(auth_header)
+
+    if sase_session.interactive.update_profile_vars() and sase_session.tenant_id and \
+            sase_session.interactive.tenant_update_vars():
+        return True
+
+    sase_session.remove_header("authorization")
+    sase_session.tenant_id = None
+    return False
+
+
+def login(client_id, client_secret, tsg_id, reuse_token=False):
+    if CONTROLLER_URL is not None:
+        sase_session = prisma_sase.API(controller=CONTROLLER_URL, update_check=False)
+    else:
+        sase_session = prisma_sase.API()
+
+    if AUTH_URL is not None:
+        sase_session.oauth_access_token_url = AUTH_URL
+
+    install_request_wrapper(sase_session, rate_limiter)
+
+    if reuse_token:
+        token = load_token(client_id, client_secret, tsg_id)
+        if token is not None:
+            if restore_token(sase_session, client_id, client_secret, tsg_id, *token):
+                print("INFO: Reusing stored access token")
+                sase_session.remove_header("X-PANW-Region")
+                return sase_session
+
+            print("WARN: Stored access token rejected. Logging in..")
+
+    sase_session.interactive.login_secret(client_id=client_id,
+                                          client_secret=client_secret,
+                                          tsg_id=tsg_id)
+    sase_session.remove_header("X-PANW-Region")
+
+    if reuse_token and sase_session.tenant_id is not None:
+        auth_header = sase_session.expose_session().headers.get("authorization", "")
+        if auth_header.startswith("Bearer "):
+            save_token(client_id, client_secret, tsg_id,
+                       access_token=auth_header[len("Bearer "):],
+                       expires_at=sase_session.jwt_expires_at.timestamp())
+
+    return sase_session
+
+
+##############################################################################
+# Machine-readable Output
+# With --output json/ndjson, records are written to stdout and the progress
+# text to stderr. ERR: lines are also written as error records, so tooling
+# does not have to parse the text.
+##############################################################################
+class RecordWriter(object):
+    """
+    ndjson records are written and flushed one per line as they are emitted.
+    json records are collected and written as one array by close().
+    """
+    def __init__(self, output, stream):
+        self.output = output
+        self.stream = stream
+        self.records = []
+        self.lock = threading.Lock()
+
+    def emit(self, *records):
+        with self.lock:
+            if self.output == OUTPUT_NDJSON:
+                for record in records:
+                    self.stream.write(json.dumps(record) + "\n")
+                self.stream.flush()
+            else:
+                self.records.extend(records)
+
+    def close(self):
+        with self.lock:
+            if self.output == OUTPUT_JSON:
+                json.dump(self.records, self.stream, indent=2)
+                self.stream.write("\n")
+            self.stream.flush()
+
+
+class ConsoleRedirect(object):
+    """
+    Replaces sys.stdout while records are written: text goes to stderr, ERR: lines also to the writer
+    """
+    def __init__(self, writer, stream):
+        self.writer = writer
+        self.stream = stream
+        self.line = ""
+        self.lock = threading.Lock()
+
+    def write(self, text):
+        with self.lock:
+            self.stream.write(text)
+            lines = (self.line + text).split("\n")
+            self.line = lines.pop()
+
+        for line in lines:
+            if line.startswith("ERR:"):
+                self.writer.emit({"type": "error", "message": line[len("ERR:"):].strip()})
+
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def emit(*records):
+    if record_writer is not None:
+        record_writer.emit(*records)
+
+
+def palocation_records(inventory):
+    records = []
+    for aggregion in inventory.allocated_regions:
+        for value in inventory.aggregate_regions[aggregion]:
+            location = inventory.locations.get(value)
+            records.append({"type": "pa_location", "value": value, "name": location.name, "aggregate_region": aggregion,
+                            "allocated_bandwidth": location.bandwidth, "spn_name_list": location.spn_name_list})
+    return records
+
+
+def site_inventory_records(inventory, sitename, bindings):
+    """
+    Records for a site whose translation dicts are built: the site, its elements with their
+    service links and zone bindings, and its active and inactive circuits
+    """
+    site = inventory.sites.find(sitename)
+    records = [{"type": "site", "id": site.id, "name": site.name, "role": site.role,
+                "latitude": site.latitude, "longitude": site.longitude}]
+    for element in inventory.site_elements(site.id):
+        records.append({"type": "element", "id": element.id, "name": element.name, "site_id": site.id, "site": sitename})
+        for slid in element.servicelink_ids:
+            records.append({"type": "service_link", "id": slid, "name": inventory.servicelinks.name(slid),
+                            "element_id": element.id, "element": element.name, "site": sitename})
+        for binding in (bindings or {}).get(element.id, []):
+            zone = inventory.zones.get(binding.get("zone_id", None))
+            records.append({"type": "zone_binding", "id": binding.get("id", None), "zone_id": binding.get("zone_id", None),
+                            "zone": zone.name if zone is not None else None, "element_id": element.id,
+                            "element": element.name, "site": sitename,
+                            "interface_ids": binding.get("interface_ids", None) or []})
+
+    for circuit in inventory.site_circuits(site.id):
+        records.append({"type": "circuit", "id": circuit.id, "name": circuit.name, "site_id": site.id, "site": sitename,
+                        "circuit_type": circuit.type, "active": circuit.active, "bandwidth": circuit.bandwidth})
+
+    return records
+
+
+def dump_inventory(sase_session, inventory, sitenames, workers):
+    """
+    Emit the tenant's zones, then each site's records as soon as the site is discovered.
+    Sites that cannot be read are reported with an error record and skipped.
+    """
+    emit(*[{"type": "zone", "id": zone.id, "name": zone.name} for zone in inventory.zones])
+
+    def site_records(sitename):
+        try:
+            create_site_dicts(sase_session=sase_session, inventory=inventory, action=INVENTORY, sitename=sitename)
+        except SystemExit:
+            return False
+
+        bindings = fetch_zone_bindings(sase_session, inventory, [inventory.sites.id(sitename)])
+        emit(*site_inventory_records(inventory, sitename, bindings))
+        return True
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(site_records, sitenames))
+
+    print("INFO: Inventory of {} of {} site(s) written".format(sum(results), len(sitenames)))
+
+
+##############################################################################
+# Batch (Manifest) Mode
+##############################################################################
+def load_manifest(filename):
+    """
+    Read a CSV or YAML manifest of (site, circuits, pa_location) rows.
+    CSV files need a header row. YAML files hold a list of mappings with the same keys.
+    circuits may be omitted, set to ALL, or given as a comma separated string or a YAML list.
+    """
+    if not os.path.isfile(filename):
+        print("ERR: Manifest file {} not found.\nExiting..".format(filename))
+        sys.exit()
+
+    if filename.lower().endswith((".yml", ".yaml")):
+        with open(filename, "r") as f:
+            rows = yaml.safe_load(f)
+        if not isinstance(rows, list):
+            print("ERR: YAML manifest must contain a list of sites.\nExiting..")
+            sys.exit()
+    else:
+        with open(filename, "r", newline="") as f:
+            rows = list(csv.DictReader(f))
+
+    manifest = []
+    for count, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            print("ERR: Manifest row {} is not a mapping.\nExiting..".format(count))
+            sys.exit()
+
+        row = {str(key).strip().lower(): value for key, value in row.items() if key is not None}
+        sitename = row.get("site", None)
+        palocation = row.get("pa_location", None)
+        circuits = row.get("circuits", None)
+        if not sitename or not palocation:
+            print("ERR: Manifest row {} is missing site or pa_location.\nExiting..".format(count))
+            sys.exit()
+
+        if isinstance(circuits, list):
+            circuits = ",".join([str(circuit).strip() for circuit in circuits])
+        if circuits in [None, ""]:
+            circuits = "ALL"
+
+        manifest.append({
+            "site": str(sitename).strip(),
+            "circuits": str(circuits).strip(),
+            "pa_location": str(palocation).strip()
+        })
+
+    if len(manifest) == 0:
+        print("ERR: No sites found in manifest {}.\nExiting..".format(filename))
+        sys.exit()
+
+    return manifest
+
+
+def config_site(sase_session, inventory, row, dry_run=False):
+    """
+    Per-site config_saseconn worker. Validation failures in the shared helpers exit via sys.exit(),
+    which is caught here so one bad row does not stop the rest of the batch.
+    With dry_run the operations are planned and returned instead of sent.
+    """
+    start = time.time()
+    sitename = row["site"]
+    status = False
+    operations = []
+    try:
+        create_site_dicts(sase_session=sase_session, inventory=inventory, action=CONFIG, sitename=sitename)
+        circuit_names_list = validate_config_input(inventory=inventory,
+                                                   sitename=sitename,
+                                                   circuit_names=row["circuits"],
+                                                   palocation=row["pa_location"])
+        if dry_run:
+            operations = plan_saseconnection(sase_session=sase_session,
+                                             inventory=inventory,
+                                             sitename=sitename,
+                                             circuit_names_list=circuit_names_list,
+                                             palocation=row["pa_location"])
+            status = operations is not None
+        else:
+            status = config_saseconnection(sase_session=sase_session,
+                                           inventory=inventory,
+                                           sitename=sitename,
+                                           circuit_names_list=circuit_names_list,
+                                           palocation=row["pa_location"])
+    except SystemExit:
+        status = False
+    except Exception as e:
+        print("ERR: Unexpected error at Site {}: {}".format(sitename, e))
+        status = False
+
+    return {
+        "site": sitename,
+        "pa_location": row["pa_location"],
+        "status": bool(status),
+        "operations": operations or [],
+        "elapsed": time.time() - start
+    }
+
+
+def batch_item(row):
+    """
+    Journal item for a manifest row. A site may appear once per PA Location.
+    """
+    return "{} [{}]".format(row["site"], row["pa_location"])
+
+
+def run_batch(sase_session, inventory, manifest, workers, dry_run=False, journal=None):
+    results = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(config_site, sase_session, inventory, row, dry_run) for row in manifest]
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                result = future.result()
+                if journal is not None:
+                    journal.record(batch_item(result), "done" if result["status"] else "failed")
+                results.append(result)
+        except KeyboardInterrupt:
+            interrupted(futures, journal)
+            raise
+
+    results.sort(key=lambda result: result["site"])
+    succeeded = [result for result in results if result["status"]]
+    failed = [result for result in results if not result["status"]]
+
+    print("\nBatch Summary: {} succeeded, {} failed".format(len(succeeded), len(failed)))
+    for result in results:
+        print("\t{}: {} [{}] ({:.1f}s)".format("SUCCESS" if result["status"] else "FAILED",
+                                              result["site"], result["pa_location"], result["elapsed"]))
+
+    return results
+
+
+##############################################################################
+# Plan & Apply
+# A plan holds every POST/PUT an action would send, with its payload, so it
+# can be reviewed and applied later without rediscovering the tenant
+##############################################################################
+def apply_operation(sase_session, operation):
+    request = getattr(getattr(sase_session, operation["method"]), operation["resource"])
+    if operation["method"] == "delete":
+        resp = request(**operation["args"])
+    else:
+        resp = request(data=operation["data"], **operation["args"])
+    if resp.cgx_status:
+        cache_invalidate_site(operation["site_id"])
+        if connection_tracker is not None and operation["resource"] == "prismasase_connections":
+            connection_tracker.add(operation, resp)
+
+    return resp
+
+
+def write_plan(filename, action, operations):
+    plan = {
+        "tsg_id": str(PRISMASASE_TSG_ID),
+        "action": action,
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "operations": operations
+    }
+    try:
+        with open(filename, "w") as f:
+            json.dump(plan, f, indent=2)
+    except OSError as e:
+        print("ERR: Could not write plan to {}: {}\nExiting..".format(filename, e))
+        sys.exit()
+
+    print("INFO: Plan with {} change(s) written to {}".format(len(operations), filename))
+    for operation in operations:
+        print("\t{} {}: {}{}".format(operation["method"].upper(), operation["site"], operation["summary"],
+                                     " ({})".format(", ".join(operation["changes"])) if operation["changes"] else ""))
+
+
+def load_plan(filename):
+    if not os.path.isfile(filename):
+        print("ERR: Plan file {} not found.\nExiting..".format(filename))
+        sys.exit()
+
+    try:
+        with open(filename, "r") as f:
+            plan = json.load(f)
+    except ValueError as e:
+        print("ERR: Invalid plan file {}: {}\nExiting..".format(filename, e))
+        sys.exit()
+
+    operations = plan.get("operations", None) if isinstance(plan, dict) else None
+    if not isinstance(operations, list):
+        print("ERR: Plan file {} has no operations.\nExiting..".format(filename))
+        sys.exit()
+
+    for count, operation in enumerate(operations, start=1):
+        if not isinstance(operation, dict) or operation.get("method", None) not in PLAN_METHODS \
+                or operation.get("resource", None) not in PLAN_RESOURCES \
+                or not isinstance(operation.get("args", None), dict) or not isinstance(operation.get("data", None), dict):
+            print("ERR: Plan operation {} is invalid.\nExiting..".format(count))
+            sys.exit()
+
+    if plan.get("tsg_id", None) != str(PRISMASASE_TSG_ID):
+        print("ERR: Plan was created for TSG {}, not {}.\nExiting..".format(plan.get("tsg_id", None), PRISMASASE_TSG_ID))
+        sys.exit()
+
+    return plan
+
+
+def run_apply(sase_session, operations, workers, title="Apply", journal=None):
+    """
+    Send the planned operations. Operations for the same site are sent in plan order.
+    With a journal each site is recorded as started before its first request and done or
+    failed after its last.
+    """
+    sites = {}
+    for operation in operations:
+        sites.setdefault(operation["site_id"], []).append(operation)
+
+    def apply_site(operations):
+        if journal is not None:
+            journal.record(operations[0]["site"], "started")
+
+        results = []
+        for operation in operations:
+            start = time.time()
+            resp = apply_operation(sase_session, operation)
+            if not resp.cgx_status:
+                print("ERR: Could not apply {} at Site {}".format(operation["summary"], operation["site"]))
+                prisma_sase.jd_detailed(resp)
+            results.append({"operation": operation, "status": bool(resp.cgx_status), "elapsed": time.time() - start})
+
+        if journal is not None:
+            failed = [result["operation"]["summary"] for result in results if not result["status"]]
+            journal.record(operations[0]["site"], "failed" if failed else "done", ", ".join(failed))
+        return results
+
+    results = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(apply_site, operations) for operations in sites.values()]
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                results.extend(future.result())
+        except KeyboardInterrupt:
+            interrupted(futures, journal)
+            raise
+
+    results.sort(key=lambda result: result["operation"]["site"])
+    failed = [result for result in results if not result["status"]]
+    print("\n{} Summary: {} succeeded, {} failed".format(title, len(results) - len(failed), len(failed)))
+    for result in results:
+        operation = result["operation"]
+        print("\t{}: {} {}: {} ({:.1f}s)".format("SUCCESS" if result["status"] else "FAILED", operation["method"].upper(),
+                                                operation["site"], operation["summary"], result["elapsed"]))
+
+    return results
+
+
+##############################################################################
+# Batch Journal
+# The progress of every site in a manifest, multi-site bind_zone or
+# delete_saseconn, or --apply run is recorded in SQLite as it happens. A run is identified by a
+# fingerprint of the tenant, action and input, so --resume with the same
+# input skips the sites already done and retries the rest.
+##############################################################################
+class BatchJournal(object):
+    """
+    Site status: pending, started (a request may have been sent), done or failed.
+    Runs that re-plan against the tenant (manifest, bind_zone) also retry started sites, since
+    planning skips what is already configured. --apply runs leave them out, as their planned
+    POSTs would be sent twice.
+    """
+    def __init__(self, filename, fingerprint, retry_started):
+        self.filename = filename
+        self.fingerprint = fingerprint
+        self.retry_started = retry_started
+        self.status = {}
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filename, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS journal_items ("
+                                "run_id TEXT, item TEXT, status TEXT, detail TEXT, updated_at REAL, "
+                                "PRIMARY KEY (run_id, item))")
 
-            resp = sase_session.post.elementsecurityzones(site_id=siteid, element_id=elemid, data=data)
-            if resp.cgx_status:
-                print("INFO: Zone {} bound to {}:{} on:".format(zone, sitename, elem_id_name[elemid]))
-                for slid in servicelinks:
-                    print("\t{}".format(servicelink_id_name[slid]))
+    def start(self, items, resume):
+        """
+        Returns the items still to be processed. Without resume the previous run with the same
+        fingerprint is discarded.
+        """
+        with self.lock, self.connection:
+            if resume:
+                self.status = dict(self.connection.execute("SELECT item, status FROM journal_items WHERE run_id=?",
+                                                           (self.fingerprint,)).fetchall())
             else:
-                print("ERR: Could not bind Zone {} to {}:{}".format(zone, sitename, elem_id_name[elemid]))
-                prisma_sase.jd_detailed(resp)
+                self.connection.execute("DELETE FROM journal_items WHERE run_id=?", (self.fingerprint,))
 
-    return
+            new_items = [item for item in dict.fromkeys(items) if item not in self.status]
+            self.connection.executemany("INSERT INTO journal_items VALUES (?, ?, 'pending', '', ?)",
+                                        [(self.fingerprint, item, time.time()) for item in new_items])
+            self.status.update({item: "pending" for item in new_items})
 
-def parse_circuit_name(circuit_names):
-    if "," in circuit_names:
-        tmp = circuit_names.split(",")
+        if resume:
+            done = [item for item in items if self.status[item] == "done"]
+            unknown = [item for item in items if self.status[item] == "started" and not self.retry_started]
+            if len(new_items) == len(set(items)):
+                print("WARN: No journal found for this run. Starting from the beginning.")
+            else:
+                print("INFO: Resuming: {} site(s) already done, {} to process".format(
+                    len(done), len(set(items)) - len(done) - len(unknown)))
+            for item in unknown:
+                print("WARN: {} was interrupted while its changes were being sent. Skipping it. "
+                      "Please check the site and re-plan it.".format(item))
 
-        return tmp
-    else:
-        return [circuit_names]
+        return [item for item in items if self.status[item] in ["pending", "failed"]
+                or (self.status[item] == "started" and self.retry_started)]
+
+    def sent(self):
+        """
+        Number of items of the previous run with the same fingerprint that were done or started
+        """
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM journal_items WHERE run_id=? AND status IN ('done', 'started')",
+                                           (self.fingerprint,)).fetchone()[0]
+
+    def record(self, item, status, detail=""):
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE journal_items SET status=?, detail=?, updated_at=? WHERE run_id=? AND item=?",
+                                    (status, detail, time.time(), self.fingerprint, item))
+            self.status[item] = status
+
+    def report(self):
+        unknown = [item for item, status in self.status.items() if status == "started" and not self.retry_started]
+        retry = [item for item, status in self.status.items() if status != "done" and item not in unknown]
+        if len(retry) > 0:
+            print("INFO: {} site(s) not completed. Run the same command with --resume to retry them.".format(len(retry)))
+        if len(unknown) > 0:
+            print("WARN: {} site(s) were interrupted while their changes were being sent and are not retried "
+                  "by --resume: {}".format(len(unknown), ", ".join(sorted(unknown))))
+
+
+def interrupted(futures, journal):
+    """
+    Ctrl-C during a batch: drop the queued sites and let the ones in progress finish
+    """
+    for future in futures:
+        future.cancel()
+
+    print("\nINFO: Interrupted. Waiting for the sites in progress..")
+    if journal is not None:
+        print("INFO: Run the same command with --resume to continue.")
+
+
+def open_journal(action, work, retry_started):
+    """
+    Journal for a run of action over work (any JSON serializable description of the input),
+    or None if it cannot be opened
+    """
+    fingerprint = hashlib.sha1(json.dumps([str(PRISMASASE_TSG_ID), action, work], sort_keys=True).encode("utf-8")).hexdigest()
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        return BatchJournal(JOURNAL_FILE, fingerprint, retry_started)
+    except (OSError, sqlite3.Error) as e:
+        print("WARN: Could not open journal {}: {}. Progress will not be recorded.".format(JOURNAL_FILE, e))
+        return None
+
+
+##############################################################################
+# Serve Mode
+# One logged in session and the tenant level indexes are kept in memory and
+# the actions are exposed over a local HTTP or Unix socket API. Indexes are
+# rebuilt in the background; each rebuild only fetches the resources whose
+# cache entry has expired, the rest are read from the on-disk cache.
+##############################################################################
+class RequestOutput(object):
+    """
+    Replaces sys.stdout in serve mode. Text printed by a thread while it handles a request
+    is returned with the response, everything else goes to the server's own output.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def capture(self):
+        self.local.chunks = []
+
+    def release(self):
+        """
+        Captured lines, without the "Exiting.." that follows CLI errors
+        """
+        text = "".join(getattr(self.local, "chunks", None) or [])
+        self.local.chunks = None
+        return [line for line in text.split("\n") if line.strip() and line.strip() != "Exiting.."]
+
+    def write(self, text):
+        chunks = getattr(self.local, "chunks", None)
+        if chunks is None:
+            return self.stream.write(text)
+
+        chunks.append(text)
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+class TenantService(object):
+    """
+    Serve mode state. Requests use the inventory current when they start; a rebuild swaps in a new one.
+    """
+    def __init__(self, sase_session, refresh_interval, workers):
+        self.sase_session = sase_session
+        self.refresh_interval = refresh_interval
+        self.workers = workers
+        self.inventory = None
+        self.refreshed_at = None
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def refresh(self, force=False):
+        if force:
+            cache_expire(ACTION_RESOURCES[SERVE])
+
+        inventory = TenantInventory()
+        create_tenant_dicts(sase_session=self.sase_session, inventory=inventory, action=SERVE)
+        with self.lock:
+            self.inventory = inventory
+            self.refreshed_at = time.time()
+
+    def refresh_loop(self):
+        while not self.stopped.wait(self.refresh_interval):
+            # Progress text is only shown if the refresh fails
+            sys.stdout.capture()
+            try:
+                self.refresh()
+                sys.stdout.release()
+            except SystemExit:
+                output = sys.stdout.release()
+                print("\n".join(output + ["WARN: Background refresh failed. Serving the previous indexes."]))
+            except Exception as e:
+                output = sys.stdout.release()
+                print("\n".join(output + ["WARN: Background refresh failed: {}. Serving the previous indexes.".format(e)]))
+
+    def health(self, body):
+        inventory = self.inventory
+        return True, {"tsg_id": str(PRISMASASE_TSG_ID), "refreshed_at": self.refreshed_at,
+                      "sites": len(inventory.sites), "pa_locations": len(inventory.allocated_locations())}
+
+    def list_palocations(self, body):
+        return True, {"pa_locations": palocation_records(self.inventory)}
+
+    def reload(self, body):
+        self.refresh(force=True)
+        return self.health(body)
+
+    def config_saseconn(self, body):
+        inventory = self.inventory
+        sitename, palocation = request_fields(body, "site", "pa_location")
+        circuits = body.get("circuits", None) or "ALL"
+        if isinstance(circuits, list):
+            circuits = ",".join([str(circuit).strip() for circuit in circuits])
+
+        create_site_dicts(sase_session=self.sase_session, inventory=inventory, action=CONFIG, sitename=sitename)
+        circuit_names_list = validate_config_input(inventory=inventory, sitename=sitename, circuit_names=circuits,
+                                                   palocation=palocation)
+        operations = plan_saseconnection(sase_session=self.sase_session, inventory=inventory, sitename=sitename,
+                                         circuit_names_list=circuit_names_list, palocation=palocation)
+        if operations is None:
+            return False, {}
+
+        return self.apply(operations, body)
+
+    def bind_zone(self, body):
+        inventory = self.inventory
+        sitename, zone = request_fields(body, "site", "zone")
+        if inventory.zones.find(zone) is None:
+            print("ERR: Invalid Zone: {}.".format(zone))
+            return False, {}
+
+        if site_selector(sitename):
+            sitenames = select_spokes(inventory, sitename, sase_session=self.sase_session)
+            operations = plan_bind_zones_sites(sase_session=self.sase_session, inventory=inventory,
+                                               sitenames=sitenames, zone=zone)
+        else:
+            create_site_dicts(sase_session=self.sase_session, inventory=inventory, action=BIND, sitename=sitename)
+            bindings = fetch_zone_bindings(self.sase_session, inventory, [inventory.sites.id(sitename)])
+            operations = plan_bind_zones(inventory=inventory, sitename=sitename, zone=zone, bindings=bindings)
+
+        return self.apply(operations, body)
+
+    def apply(self, operations, body):
+        """
+        Send the operations unless the request only asks for the plan
+        """
+        if body.get("plan", False):
+            return True, {"operations": operations}
+
+        results = run_apply(sase_session=self.sase_session, operations=operations, workers=self.workers)
+        return all(result["status"] for result in results), {
+            "operations": operations,
+            "results": [{"site": result["operation"]["site"], "summary": result["operation"]["summary"],
+                         "status": result["status"], "elapsed": result["elapsed"]} for result in results]
+        }
+
+
+def request_fields(body, *fields):
+    values = [body.get(field, None) for field in fields]
+    missing = [field for field, value in zip(fields, values) if not value]
+    if len(missing) > 0:
+        print("ERR: Missing field(s): {}".format(", ".join(missing)))
+        sys.exit()
+
+    return [str(value).strip() for value in values]
+
+
+# (method, path) -> TenantService method
+SERVE_ROUTES = {
+    ("GET", "/health"): TenantService.health,
+    ("GET", "/list_palocations"): TenantService.list_palocations,
+    ("POST", "/refresh"): TenantService.reload,
+    ("POST", "/config_saseconn"): TenantService.config_saseconn,
+    ("POST", "/bind_zone"): TenantService.bind_zone
+}
+
+
+class ServeRequestHandler(object):
+    """
+    API request handling, combined with http.server.BaseHTTPRequestHandler by run_server()
+    """
+    protocol_version = "HTTP/1.1"
+
+    def address_string(self):
+        return str(self.client_address[0]) if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        sys.stderr.write("{} - {}\n".format(self.address_string(), format % args))
+
+    def do_GET(self):
+        self.handle_api("GET")
+
+    def do_POST(self):
+        self.handle_api("POST")
+
+    def send_json(self, status, document):
+        body = json.dumps(document).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def reject(self, status, message):
+        """
+        Error response to a request whose body was not read, so the connection can not be reused
+        """
+        self.close_connection = True
+        self.send_json(status, {"status": False, "output": ["ERR: {}".format(message)]})
+
+    def authorized(self):
+        token = self.server.token
+        if token is None:
+            return True
+
+        auth_header = self.headers.get("Authorization", None) or ""
+        return auth_header.startswith("Bearer ") and \
+            hmac.compare_digest(auth_header[len("Bearer "):].encode("utf-8"), token.encode("utf-8"))
+
+    def handle_api(self, method):
+        route = SERVE_ROUTES.get((method, self.path.split("?")[0]), None)
+        if not self.authorized():
+            self.reject(401, "Missing or invalid bearer token")
+            return
+
+        length = (self.headers.get("Content-Length", None) or "0").strip()
+        if not length.isdigit():
+            self.reject(400, "Invalid Content-Length: {}".format(length))
+            return
+        if int(length) > SERVE_MAX_BODY:
+            self.reject(413, "Request body larger than {} bytes".format(SERVE_MAX_BODY))
+            return
+
+        data = self.rfile.read(int(length)) if int(length) > 0 else b""
+        if route is None:
+            self.send_json(404, {"status": False, "output": ["ERR: Not found: {} {}".format(method, self.path)]})
+            return
+
+        try:
+            body = json.loads(data.decode("utf-8")) if data else {}
+            if not isinstance(body, dict):
+                raise ValueError("expected a JSON object")
+        except ValueError as e:
+            self.send_json(400, {"status": False, "output": ["ERR: Invalid request body: {}".format(e)]})
+            return
+
+        sys.stdout.capture()
+        try:
+            status, document = route(self.server.service, body)
+        except SystemExit:
+            status, document = False, {}
+        except Exception as e:
+            print("ERR: Unexpected error: {}".format(e))
+            status, document = False, {}
+        finally:
+            output = sys.stdout.release()
+
+        self.send_json(200 if status else 422, dict(document, status=status, output=output))
+
+
+def parse_listen(listen):
+    """
+    (host, port) from HOST:PORT, or None if invalid
+    """
+    host, separator, port = listen.rpartition(":")
+    if not separator or not port.isdigit() or not 0 < int(port) < 65536:
+        return None
+
+    return host or SERVE_HOST, int(port)
+
+
+def loopback_host(host):
+    if host == "localhost":
+        return True
+
+    try:
+        return ipaddress.ip_address(host.strip("[]")).is_loopback
+    except ValueError:
+        return False
+
+
+def run_server(sase_session, listen, socket_path, refresh_interval, workers, token=None):
+    sys.stdout = RequestOutput(sys.stdout)
+    service = TenantService(sase_session=sase_session, refresh_interval=refresh_interval, workers=workers)
+    print("INFO: Building Tenant Translation Dicts..")
+    service.refresh()
+
+    handler = type("ServeRequestHandler", (ServeRequestHandler, http_server.BaseHTTPRequestHandler), {})
+    try:
+        if socket_path is not None:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            server = socketserver.ThreadingUnixStreamServer(socket_path, handler)
+            os.chmod(socket_path, 0o600)
+            atexit.register(os.remove, socket_path)
+            address = socket_path
+        else:
+            server = http_server.ThreadingHTTPServer(listen, handler)
+            address = "http://{}:{}".format(*server.server_address[:2])
+    except OSError as e:
+        print("ERR: Could not listen on {}: {}\nExiting..".format(socket_path or "{}:{}".format(*listen), e))
+        sys.exit()
+
+    server.service = service
+    server.token = token
+    server.daemon_threads = True
+    threading.Thread(target=service.refresh_loop, daemon=True).start()
+    print("INFO: Serving TSG {} on {}. Indexes are refreshed every {}s.".format(PRISMASASE_TSG_ID, address, refresh_interval))
+    if token is not None:
+        print("INFO: Requests require the bearer token from {}".format(SERVE_TOKEN_ENV))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stopped.set()
+        server.server_close()
+
+
+##############################################################################
+# Multi-tenant (MSP) Runs
+# With --tsg_ids the action runs once per TSG, each in its own process of this
+# script with --tsg_id, so every tenant gets its own session, inventory, cache
+# entries and rate limit. This process only collects and reports the results.
+##############################################################################
+def list_child_tsgs(sase_session, tsg_id):
+    """
+    (TSG ID, name) of every child TSG of a tenant, including nested children
+    """
+    url = "{}/tenancy/v1/tenant_service_groups/{}/operations/list_children?hierarchy=true".format(sase_session.controller, tsg_id)
+    resp = sase_session.rest_call(url, method="GET")
+    if not resp.cgx_status:
+        print("ERR: Could not retrieve the child TSGs of {}.\nExiting..".format(tsg_id))
+        prisma_sase.jd_detailed(resp)
+        sys.exit()
+
+    return [(str(item["id"]), item.get("display_name", None)) for item in resp.cgx_content.get("items", None) or []]
+
+
+def tenant_argv(argv, action):
+    """
+    Arguments of a per-tenant run: this run's own, without the multi-tenant options.
+    list_palocations runs write ndjson records, which are aggregated here.
+    """
+    options = TENANT_RUN_OPTIONS + (["--output", "-O"] if action == LIST else [])
+    result = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+            continue
+        if arg in TENANT_RUN_FLAGS:
+            continue
+        if arg.split("=", 1)[0] in options:
+            skip = "=" not in arg
+            continue
+        result.append(arg)
+
+    if action == LIST:
+        result += ["--output", OUTPUT_NDJSON]
+    return result
+
+
+def run_tenant(tsg_id, name, argv, action):
+    start = time.time()
+    profile_file = None
+    if api_profiler is not None:
+        fd, profile_file = tempfile.mkstemp(prefix="manage_sase_connection_profile_", suffix=".json")
+        os.close(fd)
+        argv = argv + ["--profile_output", profile_file, "--profile_format", "json"]
+
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__)] + argv + ["--tsg_id", tsg_id],
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if profile_file is not None:
+        api_profiler.merge(profile_file, tsg_id)
+        os.remove(profile_file)
+
+    records = []
+    text = proc.stdout
+    if action == LIST:
+        text = proc.stderr
+        for line in proc.stdout.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("type", None) == "pa_location":
+                records.append(record)
+
+    lines = [line for line in text.splitlines() if TENANT_REPORT.match(line)]
+    errors = [line for line in lines if line.startswith("ERR:")]
+    if proc.returncode != 0 and len(errors) == 0:
+        # Killed or crashed: the last line of stderr is the most useful
+        stderr = proc.stderr.strip().splitlines() or ["exit status {}".format(proc.returncode)]
+        errors.append("ERR: {}".format(stderr[-1]))
+        lines.append(errors[-1])
+
+    return {"tsg_id": tsg_id, "name": name, "status": len(errors) == 0, "elapsed": time.time() - start,
+            "lines": lines, "errors": errors, "records": records}
+
+
+def run_tenants(tenants, argv, action, workers):
+    """
+    Runs the action for every (TSG ID, name) in tenants with up to workers at a time
+    and prints one report
+    """
+    argv = tenant_argv(argv, action)
+    results = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_tenant, tsg_id, name, argv, action) for tsg_id, name in tenants]
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                result = future.result()
+                print("\t{}: TSG {} ({:.1f}s)".format("DONE" if result["status"] else "FAILED", result["tsg_id"],
+                                                      result["elapsed"]))
+                results.append(result)
+        except KeyboardInterrupt:
+            for future in futures:
+                future.cancel()
+            raise
+
+    order = [tsg_id for tsg_id, name in tenants]
+    results.sort(key=lambda result: order.index(result["tsg_id"]))
+
+    if record_writer is not None:
+        for result in results:
+            emit(*[dict(record, tsg_id=result["tsg_id"]) for record in result["records"]])
+            emit({"type": "tenant", "tsg_id": result["tsg_id"], "name": result["name"],
+                  "status": "success" if result["status"] else "failed", "elapsed": round(result["elapsed"], 3),
+                  "errors": [line[len("ERR:"):].strip() for line in result["errors"]]})
+        return results
+
+    if action == LIST:
+        print("\nAllocated BW by tenant:")
+        total = 0
+        for result in results:
+            regions = {}
+            for record in result["records"]:
+                region = regions.setdefault(record["aggregate_region"], {"bandwidth": record["allocated_bandwidth"] or 0,
+                                                                         "locations": []})
+                region["locations"].append(record["value"])
+            bandwidth = sum(region["bandwidth"] for region in regions.values())
+            total += bandwidth
+            print("TSG {}{}: {} Mbps in {} aggregate regions".format(result["tsg_id"], tenant_label(result["name"]),
+                                                                   bandwidth, len(regions)))
+            for region, allocation in regions.items():
+                print("\t{}: {} Mbps [{}]".format(region, allocation["bandwidth"], ", ".join(allocation["locations"])))
+        print("Total allocated BW: {} Mbps across {} tenants".format(total, len(results)))
+
+    failed = [result for result in results if not result["status"]]
+    print("\nTenant Summary: {} succeeded, {} failed".format(len(results) - len(failed), len(failed)))
+    for result in results:
+        print("\t{}: TSG {}{} ({:.1f}s)".format("SUCCESS" if result["status"] else "FAILED", result["tsg_id"],
+                                               tenant_label(result["name"]), result["elapsed"]))
+        if action != LIST or not result["status"]:
+            for line in result["lines"]:
+                print("\t\t{}".format(line))
+
+    if len(failed) > 0:
+        print("INFO: Rerun a single tenant with --tsg_id <TSG ID> for its full output.")
+    return results
+
+
+def tenant_label(name):
+    return " ({})".format(name) if name else ""
 
 
 def go():
@@ -457,27 +3610,213 @@ def go():
     ############################################################################
     parser = argparse.ArgumentParser(description="{0}.".format("Prisma SD-WAN UTD Lab Setup"))
     config_group = parser.add_argument_group('Config', 'Details for the tenant you wish to operate')
-    config_group.add_argument("--action", "-A", help="Action. Allowed Actions: list_palocations, config_saseconn, bind_zone", default=None)
-    config_group.add_argument("--sitename", "-S", help="Site Name", default=None)
-    config_group.add_argument("--palocation", "-PL", help="PA Location", default=None)
+    config_group.add_argument("--action", "-A", help="Action. Allowed Actions: list_palocations, config_saseconn, delete_saseconn, bind_zone, plan_capacity, inventory", default=None)
+    config_group.add_argument("--sitename", "-S", help="Site Name. For delete_saseconn, bind_zone, plan_capacity and inventory, also a comma separated list, a glob pattern (e.g. \"Branch-*\") or {} for every spoke site".format(ALL_SPOKES), default=None)
+    config_group.add_argument("--palocation", "-PL", help="PA Location. For plan_capacity, an optional comma separated list of PA Locations in order of preference", default=None)
     config_group.add_argument("--circuit_names", "-CN", help="Comma separated circuit list (Site WAN Interface Names). For all public circuits, use keyword: ALL", default="ALL")
     config_group.add_argument("--zone", "-Z", help="Security Zone to bind to SASE circuits", default=None)
+    config_group.add_argument("--output", "-O", help="Output format for list_palocations and inventory. Allowed: text, json, ndjson. Default: text (ndjson for inventory)", default=None)
     #config_group.add_argument("--circuit_ids", "-CI", help="Comma separated circuit list (Site WAN Interface IDs). For all public circuits, use keyword: ALL", default="ALL")
 
+    batch_group = parser.add_argument_group('Batch', 'Run an action across many sites from a manifest')
+    batch_group.add_argument("--manifest", "-M", help="CSV or YAML manifest with columns: site, circuits, pa_location. Supported with action: config_saseconn", default=None)
+    batch_group.add_argument("--resume", help="Skip the sites a previous run with the same input completed and retry the rest. Supported with --manifest, multi-site bind_zone and delete_saseconn, and --apply", action="store_true", default=False)
+    batch_group.add_argument("--confirm", help="Delete the SASE Connections of more than one site with delete_saseconn without asking", action="store_true", default=False)
+    batch_group.add_argument("--workers", "-W", help="Number of sites to process in parallel (manifest, multi-site bind_zone, --apply, delete_saseconn). Default: {}".format(BATCH_WORKERS), type=int, default=BATCH_WORKERS)
+
+    plan_group = parser.add_argument_group('Plan', 'Review changes before sending them')
+    plan_group.add_argument("--plan", help="Write the changes (payloads) to this JSON file instead of sending them. Supported with actions: config_saseconn, bind_zone, delete_saseconn", default=None)
+    plan_group.add_argument("--apply", help="Send the changes in a plan file written by --plan, without rediscovering the tenant", default=None)
+    plan_group.add_argument("--force", help="With --apply, send a plan again even if the journal records it as already applied", action="store_true", default=False)
+    capacity_group = parser.add_argument_group('Capacity', 'Place sites on PA Locations with plan_capacity')
+    capacity_group.add_argument("--manifest_output", "-MO", help="Write the placements to this CSV or YAML manifest, ready for --manifest", default=None)
+    capacity_group.add_argument("--headroom", help="Percentage of each aggregate region's allocated BW to keep free. Default: {:g}".format(CAPACITY_HEADROOM), type=float, default=CAPACITY_HEADROOM)
+    serve_group = parser.add_argument_group('Serve', 'Keep a session and the tenant indexes warm and expose list_palocations, config_saseconn and bind_zone over a local API')
+    serve_group.add_argument("--serve", help="Run as a local API server instead of performing an action", action="store_true", default=False)
+    serve_group.add_argument("--listen", help="HOST:PORT to listen on. Default: {}:{}".format(SERVE_HOST, SERVE_PORT), default="{}:{}".format(SERVE_HOST, SERVE_PORT))
+    serve_group.add_argument("--socket", help="Listen on this Unix socket instead of TCP", default=None)
+    serve_group.add_argument("--refresh_interval", help="Seconds between background index refreshes. Default: {}".format(SERVE_REFRESH), type=int, default=SERVE_REFRESH)
+    tenant_group = parser.add_argument_group('MSP', 'Run an action across tenants (TSGs) of a multi-tenant account')
+    tenant_group.add_argument("--tsg_id", help="TSG ID to operate on instead of PRISMASASE_TSG_ID, e.g. a child tenant", default=None)
+    tenant_group.add_argument("--tsg_ids", help="Comma separated TSG IDs, or {} for every child TSG of PRISMASASE_TSG_ID. Runs the action for each tenant and prints one report. Supported with actions: list_palocations, config_saseconn, bind_zone".format(ALL_CHILDREN), default=None)
+    tenant_group.add_argument("--tsg_workers", help="Number of tenants to run in parallel with --tsg_ids. Default: {}".format(TENANT_WORKERS), type=int, default=TENANT_WORKERS)
+    wait_group = parser.add_argument_group('Completion', 'Track the SASE Connections sent to the controller')
+    wait_group.add_argument("--wait", help="After config_saseconn, wait for the tunnels of every new or updated SASE Connection to come up and report the time taken", action="store_true", default=False)
+    wait_group.add_argument("--wait_timeout", help="Maximum seconds to wait with --wait. Default: {}".format(WAIT_TIMEOUT), type=int, default=WAIT_TIMEOUT)
+    wait_group.add_argument("--unbind_timeout", help="Maximum seconds delete_saseconn waits for the tunnels of a site to be removed before deleting its connections. Default: {}".format(UNBIND_TIMEOUT), type=int, default=UNBIND_TIMEOUT)
+
+    perf_group = parser.add_argument_group('Performance', 'Tune API request concurrency')
+    perf_group.add_argument("--max_concurrency", "-MC", help="Maximum concurrent API requests per site (element interfaces, WAN interfaces). Default: {}".format(API_CONCURRENCY), type=int, default=API_CONCURRENCY)
+    perf_group.add_argument("--refresh", help="Ignore cached translation data and fetch everything from the controller", action="store_true", default=False)
+    perf_group.add_argument("--no_cache", help="Disable the on-disk translation cache", action="store_true", default=False)
+    perf_group.add_argument("--rate_limit", "-RL", help="Maximum API requests per second across all workers. 0 disables the limit. Default: {}".format(RATE_LIMIT), type=float, default=RATE_LIMIT)
+    perf_group.add_argument("--max_retries", help="Retries for throttled (429) or unavailable (5xx) API responses. Default: {}".format(MAX_RETRIES), type=int, default=MAX_RETRIES)
+    perf_group.add_argument("--profile", help="Time every API call and print a per endpoint summary at exit", action="store_true", default=False)
+    perf_group.add_argument("--profile_output", help="Also write the API profile to this JSON file", default=None)
+    perf_group.add_argument("--profile_format", help="Format of --profile_output. Allowed: json, spans (OpenTelemetry style). Default: json", default="json")
+    perf_group.add_argument("--reuse_token", help="Store the access token encrypted on disk and reuse it across runs until it nears expiry. Requires the cryptography module", action="store_true", default=False)
+
     #############################################################################
     # Parse Arguments
     #############################################################################
     args = vars(parser.parse_args())
     action = args.get("action", None)
-    if action not in ACTION:
-        print("ERR: Invalid Action! Please choose from: list_palocations, delete_saseconn, config_saseconn, bind_zone\nExiting..")
+    global PRISMASASE_TSG_ID
+    if args.get("tsg_id", None) is not None:
+        PRISMASASE_TSG_ID = args["tsg_id"]
+
+    plan_file = args.get("plan", None)
+    apply_file = args.get("apply", None)
+    serve = args.get("serve", False)
+    if args.get("force", False) and apply_file is None:
+        print("ERR: --force is only supported with --apply.\nExiting..")
+        sys.exit()
+
+    if apply_file is not None:
+        if plan_file is not None or serve:
+            print("ERR: --apply cannot be used with --plan or --serve.\nExiting..")
+            sys.exit()
+
+    elif serve:
+        if plan_file is not None or args.get("manifest", None) is not None:
+            print("ERR: --serve cannot be used with --plan or --manifest.\nExiting..")
+            sys.exit()
+
+        listen = parse_listen(args.get("listen", None) or "")
+        if listen is None:
+            print("ERR: Invalid listen address: {}. Please use HOST:PORT\nExiting..".format(args.get("listen", None)))
+            sys.exit()
+
+        if args.get("socket", None) is None and not loopback_host(listen[0]) and not os.environ.get(SERVE_TOKEN_ENV, None):
+            print("ERR: Listening on {} exposes the API to other hosts. Please set a bearer token in {} "
+                  "or listen on a loopback address.\nExiting..".format(listen[0], SERVE_TOKEN_ENV))
+            sys.exit()
+
+        if args.get("refresh_interval", SERVE_REFRESH) < 1:
+            print("ERR: Refresh interval must be 1 or more.\nExiting..")
+            sys.exit()
+
+    elif action not in ACTION:
+        print("ERR: Invalid Action! Please choose from: list_palocations, delete_saseconn, config_saseconn, bind_zone, plan_capacity, inventory\nExiting..")
+        sys.exit()
+
+    output = args.get("output", None)
+    if output is None:
+        output = OUTPUT_NDJSON if action == INVENTORY else OUTPUT_TEXT
+    if output not in OUTPUT_FORMATS:
+        print("ERR: Invalid output format: {}. Please choose from: {}\nExiting..".format(output, ", ".join(OUTPUT_FORMATS)))
+        sys.exit()
+
+    if (output != OUTPUT_TEXT and action not in [LIST, INVENTORY]) or (output == OUTPUT_TEXT and action == INVENTORY):
+        print("ERR: Output format {} is not supported with action {}.\nExiting..".format(output, action))
+        sys.exit()
+
+    global record_writer
+    if output != OUTPUT_TEXT:
+        record_writer = RecordWriter(output, sys.stdout)
+        sys.stdout = ConsoleRedirect(record_writer, sys.stderr)
+        atexit.register(record_writer.close)
+
+    tsg_ids = args.get("tsg_ids", None)
+    tsg_workers = args.get("tsg_workers", TENANT_WORKERS)
+    if tsg_ids is not None:
+        if plan_file is not None or apply_file is not None or serve or args.get("tsg_id", None) is not None:
+            print("ERR: --tsg_ids cannot be used with --tsg_id, --plan, --apply or --serve.\nExiting..")
+            sys.exit()
+
+        if action not in TENANT_ACTIONS:
+            print("ERR: --tsg_ids is only supported with actions: {}\nExiting..".format(", ".join(TENANT_ACTIONS)))
+            sys.exit()
+
+        if tsg_workers < 1:
+            print("ERR: TSG workers must be 1 or more.\nExiting..")
+            sys.exit()
+
+    if plan_file is not None and action not in PLAN_ACTIONS:
+        print("ERR: Plan is only supported with actions: {}\nExiting..".format(", ".join(PLAN_ACTIONS)))
+        sys.exit()
+
+    global connection_tracker
+    wait_timeout = args.get("wait_timeout", WAIT_TIMEOUT)
+    if args.get("wait", False):
+        if plan_file is not None or (apply_file is None and action != CONFIG):
+            print("ERR: --wait is only supported with action config_saseconn or --apply.\nExiting..")
+            sys.exit()
+
+        connection_tracker = ConnectionTracker()
+
+    global api_concurrency
+    api_concurrency = args.get("max_concurrency", API_CONCURRENCY)
+    if api_concurrency < 1:
+        print("ERR: Max concurrency must be 1 or more.\nExiting..")
+        sys.exit()
+
+    global api_profiler
+    profile_output = args.get("profile_output", None)
+    profile_format = args.get("profile_format", "json")
+    if profile_format not in ["json", "spans"]:
+        print("ERR: Invalid profile format: {}. Please choose from: json, spans\nExiting..".format(profile_format))
+        sys.exit()
+
+    if args.get("profile", False) or profile_output is not None:
+        api_profiler = APIProfiler()
+        if args.get("profile", False):
+            atexit.register(api_profiler.print_report)
+        if profile_output is not None:
+            atexit.register(api_profiler.write, profile_output, profile_format)
+
+    global max_retries, rate_limiter
+    max_retries = max(0, args.get("max_retries", MAX_RETRIES))
+    rate_limit = args.get("rate_limit", RATE_LIMIT)
+    if rate_limit > 0:
+        rate_limiter = TokenBucket(rate=rate_limit, capacity=max(1.0, rate_limit))
+
+    global cache_file, cache_tsg_id, cache_refresh
+    cache_refresh = args.get("refresh", False)
+    cache_tsg_id = str(PRISMASASE_TSG_ID)
+    if not args.get("no_cache", False) and PRISMASASE_TSG_ID is not None:
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            cache_file = CACHE_FILE
+        except OSError as e:
+            print("WARN: Could not create cache directory {}: {}. Caching disabled.".format(CACHE_DIR, e))
+
+    if cache_file is None:
+        # Items are still streamed through a store, which only lives for this run
+        fd, cache_file = tempfile.mkstemp(prefix="manage_sase_connection_", suffix=".db")
+        os.close(fd)
+        atexit.register(os.remove, cache_file)
+
+    manifest = None
+    manifest_file = args.get("manifest", None)
+    workers = args.get("workers", BATCH_WORKERS)
+    if workers < 1:
+        print("ERR: Workers must be 1 or more.\nExiting..")
         sys.exit()
 
+    if manifest_file is not None and apply_file is None:
+        if action not in BATCH_ACTIONS:
+            print("ERR: Manifest is only supported with action: {}\nExiting..".format(", ".join(BATCH_ACTIONS)))
+            sys.exit()
+
+        manifest = load_manifest(manifest_file)
+
+    plan = None
+    if apply_file is not None:
+        plan = load_plan(apply_file)
+
+    resume = args.get("resume", False)
+    if resume:
+        multisite = action in [BIND, DELETE] and site_selector(args.get("sitename", None) or "")
+        if plan_file is not None or (manifest is None and plan is None and not multisite):
+            print("ERR: --resume is only supported with --manifest, multi-site bind_zone or delete_saseconn, or --apply, without --plan.\nExiting..")
+            sys.exit()
+
     sitename = None
     circuit_names = "ALL"
     palocation = None
     zone = None
-    if action in [DELETE, CONFIG, BIND]:
+    if action in [DELETE, CONFIG, BIND, CAPACITY, INVENTORY] and manifest is None and plan is None:
         sitename = args.get("sitename", None)
         if sitename is None:
             print("ERR: Site name not provided.\nExiting..")
@@ -499,95 +3838,300 @@ def go():
                 print("ERR: PA Location not provided.\nExiting..")
                 sys.exit()
 
+    headroom = args.get("headroom", CAPACITY_HEADROOM)
+    if action == CAPACITY and not 0 <= headroom < 100:
+        print("ERR: Headroom must be a percentage from 0 to less than 100.\nExiting..")
+        sys.exit()
+
+    ##############################################################################
+    # Multi-tenant Run
+    ##############################################################################
+    if tsg_ids is not None:
+        if tsg_ids == ALL_CHILDREN:
+            sase_session = login(client_id=PRISMASASE_CLIENT_ID,
+                                 client_secret=PRISMASASE_CLIENT_SECRET,
+                                 tsg_id=PRISMASASE_TSG_ID)
+            if sase_session.tenant_id is None:
+                print("ERR: Service Account login failure. Please check client credentials")
+                sys.exit()
+
+            tenants = list_child_tsgs(sase_session, PRISMASASE_TSG_ID)
+        else:
+            tenants = [(tsg_id.strip(), None) for tsg_id in tsg_ids.split(",") if tsg_id.strip()]
+            tenants = list(dict.fromkeys(tenants))
+
+        if len(tenants) == 0:
+            print("ERR: No TSGs to run {} on.\nExiting..".format(action))
+            sys.exit()
+
+        print("INFO: Running {} on {} tenants with {} workers..".format(action, len(tenants), tsg_workers))
+        run_tenants(tenants=tenants, argv=sys.argv[1:], action=action, workers=tsg_workers)
+        sys.exit()
+
+    ##############################################################################
+    # List PA Locations from the cache, without logging in
+    ##############################################################################
+    if action == LIST and all(cache_fresh(resource) for resource in ACTION_RESOURCES[LIST]):
+        inventory = TenantInventory()
+        print("INFO: Building Translation Dicts from cache..")
+        create_tenant_dicts(sase_session=None, inventory=inventory, action=action)
+        list_palocations(inventory=inventory)
+        sys.exit()
+
     ##############################################################################
     # Login
     ##############################################################################
-    sase_session = prisma_sase.API()
-    sase_session.interactive.login_secret(client_id=PRISMASASE_CLIENT_ID,
-                                          client_secret=PRISMASASE_CLIENT_SECRET,
-                                          tsg_id=PRISMASASE_TSG_ID)
-    sase_session.remove_header("X-PANW-Region")
+    reuse_token = args.get("reuse_token", False)
+    if reuse_token:
+        if importlib.util.find_spec("cryptography") is None:
+            print("WARN: Token reuse requires the cryptography module. Logging in without it..")
+            reuse_token = False
+
+    sase_session = login(client_id=PRISMASASE_CLIENT_ID,
+                         client_secret=PRISMASASE_CLIENT_SECRET,
+                         tsg_id=PRISMASASE_TSG_ID,
+                         reuse_token=reuse_token)
     if sase_session.tenant_id is None:
         print("ERR: Service Account login failure. Please check client credentials")
         sys.exit()
 
+    global cache_syncer
+    cache_syncer = CacheSync(sase_session)
+    inventory = TenantInventory()
+
     ##############################################################################
-    # Create Translation Dicts
+    # Serve
     ##############################################################################
-    print("INFO: Building Translation Dicts..")
-    create_dicts(sase_session=sase_session, action=action, sitename=sitename)
+    if serve:
+        run_server(sase_session=sase_session, listen=listen, socket_path=args.get("socket", None),
+                   token=os.environ.get(SERVE_TOKEN_ENV, None) or None,
+                   refresh_interval=args.get("refresh_interval", SERVE_REFRESH), workers=workers)
+        sys.exit()
 
     ##############################################################################
-    # Validate Input Data
+    # Apply Plan
     ##############################################################################
-    circuit_names_list = []
-    if action in [CONFIG]:
-        sid = site_name_id[sitename]
-        swinames = siteid_swinamelist[sid]
-        if circuit_names not in ["ALL"]:
-            circuit_names_list = parse_circuit_name(circuit_names)
-
-            for item in circuit_names_list:
-                if item not in swinames:
-                    if item in swis_inactive:
-                        print("ERR: Circuit {} not bound to any interface at Site {}. "
-                              "Please select from the following:".format(item, sitename))
-                    else:
-                        print("ERR: Invalid circuit name: {}\nNo such circuit configured at Site {}. "
-                              "Please select from the following:".format(item, sitename))
+    if plan is not None:
+        operations = plan["operations"]
+        decommission = plan.get("action", None) == DELETE
+        if decommission and connection_tracker is not None:
+            print("ERR: --wait is not supported with delete_saseconn plans.\nExiting..")
+            sys.exit()
 
-                    for swi in swinames:
-                        print("\t{}".format(swi))
-                    print("Exiting..")
-                    sys.exit()
+        journal = open_journal(APPLY, operations, retry_started=False)
+        if journal is not None and not resume and not args.get("force", False) and journal.sent() > 0:
+            print("ERR: {} was already applied ({} site(s) sent). Use --resume to retry the sites that did not complete, "
+                  "or --force to send the whole plan again.\nExiting..".format(apply_file, journal.sent()))
+            sys.exit()
+        if journal is not None:
+            sitenames = set(journal.start([operation["site"] for operation in operations], resume))
+            operations = [operation for operation in operations if operation["site"] in sitenames]
+
+        print("INFO: Applying {} change(s) from {} with {} workers..".format(len(operations), apply_file, workers))
+        if decommission:
+            decommission_sites(sase_session=sase_session, operations=operations, workers=workers,
+                               timeout=args.get("unbind_timeout", UNBIND_TIMEOUT), journal=journal)
         else:
-            circuit_names_list = ["ALL"]
+            run_apply(sase_session=sase_session, operations=operations, workers=workers, journal=journal)
+        if journal is not None:
+            journal.report()
+        if connection_tracker is not None:
+            connection_tracker.wait(sase_session=sase_session, timeout=wait_timeout)
+        sys.exit()
 
-        if palocation not in palocations_value_displayname.keys():
-            print("ERR: Invalid PA Location! Please select from the following:")
-            for paloc in palocations_bwalloc:
-                print("\t{}".format(paloc))
+    ##############################################################################
+    # Batch Mode
+    ##############################################################################
+    if manifest is not None:
+        journal = None
+        if plan_file is None:
+            journal = open_journal(action, manifest, retry_started=True)
+        if journal is not None:
+            items = set(journal.start([batch_item(row) for row in manifest], resume))
+            manifest = [row for row in manifest if batch_item(row) in items]
+            if len(manifest) == 0:
+                print("INFO: All sites in the manifest are already done.")
+                sys.exit()
+
+        print("INFO: Building Tenant Translation Dicts..")
+        create_tenant_dicts(sase_session=sase_session, inventory=inventory, action=action,
+                            sitenames=list(dict.fromkeys([row["site"] for row in manifest])))
+
+        print("INFO: {} {} sites with {} workers..".format("Planning" if plan_file else "Configuring", len(manifest), workers))
+        results = run_batch(sase_session=sase_session, inventory=inventory, manifest=manifest, workers=workers,
+                            dry_run=plan_file is not None, journal=journal)
+        if journal is not None:
+            journal.report()
+        if plan_file is not None:
+            write_plan(plan_file, action, [operation for result in results if result["status"]
+                                           for operation in result["operations"]])
+        if connection_tracker is not None:
+            connection_tracker.wait(sase_session=sase_session, timeout=wait_timeout)
+        sys.exit()
+
+    ##############################################################################
+    # Multi-site Zone Binding
+    ##############################################################################
+    if action == BIND and site_selector(sitename):
+        sitenames = resolve_target_sites(sase_session=sase_session, inventory=inventory, action=action, sitename=sitename)
+        if inventory.zones.find(zone) is None:
+            print("ERR: Invalid Zone: {}. Please select from the following: ".format(zone))
+            for item in inventory.zones.names():
+                print("\t{}".format(item))
 
             print("Exiting..")
             sys.exit()
 
+        journal = None
+        if plan_file is None:
+            journal = open_journal(action, [sitename, zone], retry_started=True)
+        if journal is not None:
+            sitenames = journal.start(sitenames, resume)
+            if len(sitenames) == 0:
+                print("INFO: All selected sites are already done.")
+                sys.exit()
+
+        print("INFO: Building Translation Dicts for {} sites..".format(len(sitenames)))
+        operations = plan_bind_zones_sites(sase_session=sase_session, inventory=inventory, sitenames=sitenames, zone=zone)
+        if plan_file is not None:
+            write_plan(plan_file, action, operations)
         else:
-            if palocation not in palocations_bwalloc:
-                print("ERR: No BW allocated to PA Location: {}".format(palocation))
-                print("Please select a PA Location from the following:")
-                for paloc in palocations_bwalloc:
-                    print("\t{}".format(paloc))
+            if journal is not None:
+                # Sites with nothing left to bind are done
+                for name in set(sitenames) - set([operation["site"] for operation in operations]):
+                    journal.record(name, "done")
 
-                print("Exiting..")
+            print("INFO: Binding Zone {} on {} element(s) with {} workers..".format(zone, len(operations), workers))
+            run_apply(sase_session=sase_session, operations=operations, workers=workers, title="Bind", journal=journal)
+            if journal is not None:
+                journal.report()
+        sys.exit()
+
+    ##############################################################################
+    # Capacity Planning
+    ##############################################################################
+    if action == CAPACITY:
+        sitenames = resolve_target_sites(sase_session=sase_session, inventory=inventory, action=action, sitename=sitename)
+        preferred = []
+        if palocation is not None:
+            palocations_bwalloc = inventory.allocated_locations()
+            preferred = list(dict.fromkeys([value.strip() for value in palocation.split(",") if value.strip()]))
+            for value in preferred:
+                if value not in palocations_bwalloc:
+                    print("ERR: No BW allocated to PA Location: {}".format(value))
+                    print("Please select PA Locations from the following:")
+                    for paloc in palocations_bwalloc:
+                        print("\t{}".format(paloc))
+
+                    print("Exiting..")
+                    sys.exit()
+
+        print("INFO: Planning capacity for {} sites..".format(len(sitenames)))
+        placements = plan_capacity(sase_session=sase_session, inventory=inventory, sitenames=sitenames,
+                                   circuit_names=circuit_names, preferred=preferred, headroom=headroom, workers=workers)
+        manifest_output = args.get("manifest_output", None)
+        if manifest_output is not None:
+            write_capacity_manifest(manifest_output, placements)
+        sys.exit()
+
+    ##############################################################################
+    # Decommission
+    ##############################################################################
+    if action == DELETE:
+        sitenames = resolve_target_sites(sase_session=sase_session, inventory=inventory, action=action, sitename=sitename)
+        journal = None
+        if plan_file is None and site_selector(sitename):
+            journal = open_journal(action, [sitename], retry_started=True)
+        if journal is not None:
+            sitenames = journal.start(sitenames, resume)
+            if len(sitenames) == 0:
+                print("INFO: All selected sites are already done.")
                 sys.exit()
 
+        operations = plan_decommission(sase_session=sase_session, inventory=inventory, sitenames=sitenames)
+        if plan_file is not None:
+            write_plan(plan_file, action, operations)
+            sys.exit()
+
+        confirm_decommission(operations, args.get("confirm", False))
+        if journal is not None:
+            # Sites without SASE Connections are done
+            for name in set(sitenames) - set([operation["site"] for operation in operations]):
+                journal.record(name, "done")
+
+        decommission_sites(sase_session=sase_session, operations=operations, workers=workers,
+                           timeout=args.get("unbind_timeout", UNBIND_TIMEOUT), journal=journal)
+        if journal is not None:
+            journal.report()
+        sys.exit()
+
+    ##############################################################################
+    # Inventory
+    ##############################################################################
+    if action == INVENTORY:
+        sitenames = resolve_target_sites(sase_session=sase_session, inventory=inventory, action=action, sitename=sitename)
+        print("INFO: Retrieving inventory of {} sites with {} workers..".format(len(sitenames), workers))
+        dump_inventory(sase_session=sase_session, inventory=inventory, sitenames=sitenames, workers=workers)
+        sys.exit()
+
+    ##############################################################################
+    # Create Translation Dicts
+    ##############################################################################
+    print("INFO: Building Translation Dicts..")
+    create_dicts(sase_session=sase_session, inventory=inventory, action=action, sitename=sitename)
+
+    ##############################################################################
+    # Validate Input Data
+    ##############################################################################
+    circuit_names_list = []
+    if action in [CONFIG]:
+        circuit_names_list = validate_config_input(inventory=inventory, sitename=sitename, circuit_names=circuit_names, palocation=palocation)
+
     elif action in [BIND]:
-        if zone not in zone_name_id.keys():
+        if inventory.zones.find(zone) is None:
             print("ERR: Invalid Zone: {}. Please select from the following: ".format(zone))
-            for item in zone_name_id.keys():
+            for item in inventory.zones.names():
                 print("\t{}".format(item))
 
             print("Exiting..")
             sys.exit()
     ##############################################################################
+    # Plan task
+    ##############################################################################
+    if plan_file is not None:
+        if action == CONFIG:
+            operations = plan_saseconnection(sase_session=sase_session, inventory=inventory, sitename=sitename,
+                                             circuit_names_list=circuit_names_list, palocation=palocation)
+            if operations is None:
+                sys.exit()
+        else:
+            bindings = fetch_zone_bindings(sase_session, inventory, [inventory.sites.id(sitename)])
+            operations = plan_bind_zones(inventory=inventory, sitename=sitename, zone=zone, bindings=bindings)
+
+        write_plan(plan_file, action, operations)
+        sys.exit()
+
+    ##############################################################################
     # Perform task
     ##############################################################################
 
     if action == LIST:
-        list_palocations()
+        list_palocations(inventory=inventory)
 
     elif action == CONFIG:
-        config_saseconnection(sase_session=sase_session, sitename=sitename, circuit_names_list=circuit_names_list, palocation=palocation)
-
-    elif action == DELETE:
-        print("Delete action is currently not supported by the script")
-        #delete_saseconnection(sase_session=sase_session, sitename=sitename)
+        config_saseconnection(sase_session=sase_session, inventory=inventory, sitename=sitename, circuit_names_list=circuit_names_list, palocation=palocation)
+        if connection_tracker is not None:
+            connection_tracker.wait(sase_session=sase_session, timeout=wait_timeout)
 
     elif action == BIND:
-        bind_zones(sase_session=sase_session, sitename=sitename, zone=zone)
+        bind_zones(sase_session=sase_session, inventory=inventory, sitename=sitename, zone=zone)
 
     sys.exit()
 
 
 if __name__ == "__main__":
-    go()
+    try:
+        go()
+    except KeyboardInterrupt:
+        print("ERR: Interrupted.\nExiting..")
+        sys.exit(130)
@@ -0,0 +1,68 @@
+"""
+Tests run manage_sase_connection.py against the mock controller in benchmarks/,
+in a scratch directory with its own home (cache, journal, token store).
+"""
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+sys.path.insert(0, ROOT)
+
+import mock_controller  # noqa: E402
+import run_benchmarks  # noqa: E402
+
+SITES = 20
+
+
+class Script(object):
+    def __init__(self, workdir, controller):
+        self.workdir = workdir
+        self.controller = controller
+        self.home = os.path.join(workdir, "home")
+
+    def env(self):
+        return dict(os.environ, HOME=self.home, PRISMASASE_CONTROLLER=self.controller.url,
+                    PRISMASASE_AUTH_URL="{}/auth/v1/oauth2/access_token".format(self.controller.url),
+                    PYTHONDONTWRITEBYTECODE="1")
+
+    def start(self, *args):
+        """
+        Start the script without waiting for it, e.g. to interrupt it
+        """
+        return subprocess.Popen([sys.executable, "manage_sase_connection.py"] + list(args) + ["-RL", "0"],
+                                cwd=self.workdir, env=self.env(), stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+    def run(self, *args):
+        """
+        Run the script without rate limiting. Returns (ok, output): ok is False on a non-zero
+        exit status, an ERR: line or a traceback.
+        """
+        wall, peak_rss, ok, text = run_benchmarks.run_script(self.workdir, self.home, self.controller,
+                                                             list(args) + ["-RL", "0"])
+        return ok, text
+
+    @property
+    def cache_file(self):
+        return os.path.join(self.home, ".manage_sase_connection", "cache.db")
+
+
+@pytest.fixture
+def controller():
+    controller = mock_controller.MockController(("127.0.0.1", 0), mock_controller.MockTenant(sites=SITES,
+                                                                                              provision_time=0))
+    controller.start()
+    yield controller
+    controller.shutdown()
+
+
+@pytest.fixture
+def script(tmp_path, controller):
+    shutil.copy(os.path.join(ROOT, "manage_sase_connection.py"), str(tmp_path))
+    with open(os.path.join(str(tmp_path), "prismasase_settings.py"), "w") as f:
+        f.write(run_benchmarks.SETTINGS)
+    return Script(str(tmp_path), controller)
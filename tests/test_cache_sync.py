@@ -0,0 +1,167 @@
+"""
+Incremental cache sync of site level objects (user-022)
+"""
+import json
+import os
+import sqlite3
+import time
+
+import pytest
+
+import manage_sase_connection
+import run_benchmarks
+
+# Older than the waninterfaces TTL, younger than its sync chain
+AGE = 1000
+
+
+def cached(script, resource):
+    """
+    Item ID -> (key, body) of the cached items of resource
+    """
+    connection = sqlite3.connect(script.cache_file)
+    try:
+        return {item_id: (key, json.loads(body)) for key, item_id, body in
+                connection.execute("SELECT key, item_id, body FROM cache_items WHERE resource=?", (resource,))}
+    finally:
+        connection.close()
+
+
+def watermark(script, resource):
+    connection = sqlite3.connect(script.cache_file)
+    try:
+        return connection.execute("SELECT watermark FROM cache_sync WHERE resource=?", (resource,)).fetchone()[0]
+    finally:
+        connection.close()
+
+
+def calls(controller, method, endpoint):
+    return sum(item["count"] for item in controller.stats()["endpoints"]
+               if item["method"] == method and item["endpoint"] == endpoint)
+
+
+def site_circuits(controller, count):
+    return [swi for site in controller.tenant.sites[:count] for swi in controller.tenant.waninterfaces(site["id"])]
+
+
+def inventory(script):
+    ok, text = script.run("-A", "inventory", "-S", "ALL_SPOKES")
+    assert ok, text
+    return text
+
+
+def resync(script, controller):
+    run_benchmarks.age_cache(script.home, AGE)
+    controller.reset_stats()
+    started = time.time()
+    text = inventory(script)
+    # Brought up to date by the query API, not by listing every site again
+    assert calls(controller, "GET", "/sdwan/api/sites/{id}/waninterfaces") == 0
+    assert calls(controller, "POST", "/sdwan/api/waninterfaces/query") > 0
+    return started, text
+
+
+def test_changed_items_patched(script, controller):
+    inventory(script)
+    rows = cached(script, "waninterfaces")
+    initial = watermark(script, "waninterfaces")
+
+    controller.tenant.touch(3)
+    changed = [swi["id"] for swi in site_circuits(controller, 3)]
+    started, text = resync(script, controller)
+
+    synced = cached(script, "waninterfaces")
+    assert sorted(synced) == sorted(rows)
+    for item_id, (key, body) in synced.items():
+        assert key == rows[item_id][0]
+        assert (body.get("description", None) == "changed") == (item_id in changed)
+
+    newest = max(controller.tenant.changes[item_id]["_updated_on_utc"] for item_id in changed)
+    assert newest > initial
+    assert watermark(script, "waninterfaces") == newest
+
+    connection = sqlite3.connect(script.cache_file)
+    try:
+        fetched = [row[0] for row in connection.execute("SELECT fetched_at FROM cache_resources "
+                                                        "WHERE resource='waninterfaces'")]
+    finally:
+        connection.close()
+    assert len(fetched) == len(controller.tenant.sites) and min(fetched) >= started
+
+
+def test_deleted_items_dropped(script, controller):
+    inventory(script)
+    rows = cached(script, "waninterfaces")
+    initial = watermark(script, "waninterfaces")
+
+    before = set(swi["id"] for swi in site_circuits(controller, 2))
+    controller.tenant.remove_circuits(2)
+    removed = before - set(swi["id"] for swi in site_circuits(controller, 2))
+    assert len(removed) == 2
+    started, text = resync(script, controller)
+
+    synced = cached(script, "waninterfaces")
+    assert sorted(synced) == sorted(set(rows) - removed)
+    assert watermark(script, "waninterfaces") == initial
+    for item_id in removed:
+        assert '"id": "{}"'.format(item_id) not in text
+
+
+def test_cache_patch(tmp_path, monkeypatch):
+    monkeypatch.setattr(manage_sase_connection, "cache_file", str(tmp_path / "cache.db"))
+    monkeypatch.setattr(manage_sase_connection, "cache_tsg_id", "1")
+    connection = manage_sase_connection.cache_connect()
+
+    def rows():
+        return [(key, item_id, json.loads(body)["name"]) for key, item_id, body in
+                connection.execute("SELECT key, item_id, body FROM cache_items ORDER BY key, seq")]
+
+    keys = set(["s1", "s2"])
+    for key, item_id in [("s1", "a"), ("s1", "b"), ("s2", "c"), ("s3", "d")]:
+        manage_sase_connection.cache_patch(connection, "elements", keys, key, {"id": item_id, "name": item_id})
+    # Items of entries not being synced are not stored
+    assert rows() == [("s1", "a", "a"), ("s1", "b", "b"), ("s2", "c", "c")]
+
+    # Changed in place, moved to another site, moved to a site that is not synced
+    manage_sase_connection.cache_patch(connection, "elements", keys, "s1", {"id": "a", "name": "a2"})
+    manage_sase_connection.cache_patch(connection, "elements", keys, "s2", {"id": "b", "name": "b2"})
+    manage_sase_connection.cache_patch(connection, "elements", keys, "s3", {"id": "c", "name": "c2"})
+    assert rows() == [("s1", "a", "a2"), ("s2", "b", "b2")]
+    connection.close()
+
+
+@pytest.fixture
+def paged_script(script):
+    """
+    The script with two items per query page
+    """
+    filename = os.path.join(script.workdir, "manage_sase_connection.py")
+    with open(filename) as f:
+        source = f.read()
+    assert "\nQUERY_PAGE_LIMIT = 500\n" in source
+    with open(filename, "w") as f:
+        f.write(source.replace("\nQUERY_PAGE_LIMIT = 500\n", "\nQUERY_PAGE_LIMIT = 2\n"))
+    return script
+
+
+def test_watermark_from_every_page(paged_script, controller):
+    script = paged_script
+    inventory(script)
+
+    controller.tenant.touch(4)
+    changed = [swi["id"] for swi in site_circuits(controller, 4)]
+    # The newest change is on the last page
+    newest = max(controller.tenant.changes[item_id]["_updated_on_utc"] for item_id in changed) + 1000000
+    controller.tenant.changes[changed[-1]]["_updated_on_utc"] = newest
+    resync(script, controller)
+    assert calls(controller, "POST", "/sdwan/api/waninterfaces/query") >= len(changed) // 2
+
+    synced = cached(script, "waninterfaces")
+    assert all(synced[item_id][1]["description"] == "changed" for item_id in changed)
+    assert watermark(script, "waninterfaces") == newest
+
+    # Nothing changed since: the next sync finds no changes
+    rows = cached(script, "waninterfaces")
+    resync(script, controller)
+    assert cached(script, "waninterfaces") == rows
+    assert watermark(script, "waninterfaces") == newest
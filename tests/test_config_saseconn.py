@@ -0,0 +1,106 @@
+"""
+Idempotent config_saseconn (user-012)
+"""
+import manage_sase_connection
+
+
+def connection_writes(controller):
+    return sum(endpoint["count"] for endpoint in controller.stats()["endpoints"]
+               if endpoint["method"] in ["POST", "PUT"] and "prismasase_connections" in endpoint["endpoint"]
+               and "query" not in endpoint["endpoint"])
+
+
+def site_connections(controller, site_id):
+    return [item for item in controller.tenant.connections.values() if item["site_id"] == site_id]
+
+
+def test_rerun_is_a_noop(script, controller):
+    ok, text = script.run("-A", "config_saseconn", "-S", "Site 1", "-PL", "loc-1")
+    assert ok, text
+
+    controller.reset_stats()
+    ok, text = script.run("-A", "config_saseconn", "-S", "Site 1", "-PL", "loc-1")
+    assert ok, text
+    assert "is up to date. No changes made." in text
+    assert connection_writes(controller) == 0
+    assert len(site_connections(controller, controller.tenant.sites[1]["id"])) == 1
+
+
+def test_custom_settings_preserved(script, controller):
+    site_id = controller.tenant.sites[2]["id"]
+    ok, text = script.run("-A", "config_saseconn", "-S", "Site 2", "-PL", "loc-2", "-CN", "Circuit 0")
+    assert ok, text
+
+    # An admin customises BGP, QoS and CIR on the connection
+    connection = site_connections(controller, site_id)[0]
+    connection["routing_configs"] = dict(connection["routing_configs"], bgp_secret="secret", export_routes=True)
+    connection["prismaaccess_qos_profile_id"] = "custom-qos"
+    connection["prismaaccess_qos_cir_mbps"] = 50
+
+    controller.reset_stats()
+    ok, text = script.run("-A", "config_saseconn", "-S", "Site 2", "-PL", "loc-2", "-CN", "Circuit 0")
+    assert ok, text
+    assert "is up to date" in text
+    assert connection_writes(controller) == 0
+
+    # A change to a managed field keeps the customised settings
+    ok, text = script.run("-A", "config_saseconn", "-S", "Site 2", "-PL", "loc-2")
+    assert ok, text
+    connection = site_connections(controller, site_id)[0]
+    assert connection["routing_configs"]["bgp_secret"] == "secret"
+    assert connection["routing_configs"]["export_routes"] is True
+    assert connection["prismaaccess_qos_profile_id"] == "custom-qos"
+    assert connection["prismaaccess_qos_cir_mbps"] == 50
+
+
+def test_new_wan_interface_adds_one_tunnel(script, controller):
+    site_id = controller.tenant.sites[3]["id"]
+    ok, text = script.run("-A", "config_saseconn", "-S", "Site 3", "-PL", "loc-3", "-CN", "Circuit 0")
+    assert ok, text
+    before = site_connections(controller, site_id)[0]
+    first_tunnel = dict(before["remote_network_groups"][0]["ipsec_tunnels"][0], name="renamed-by-admin")
+    before["remote_network_groups"][0]["ipsec_tunnels"][0] = first_tunnel
+
+    controller.reset_stats()
+    ok, text = script.run("-A", "config_saseconn", "-S", "Site 3", "-PL", "loc-3")
+    assert ok, text
+    assert "Updated: enabled_wan_interface_ids, remote_network_groups" in text
+    assert connection_writes(controller) == 1
+
+    connections = site_connections(controller, site_id)
+    assert len(connections) == 1
+    tunnels = connections[0]["remote_network_groups"][0]["ipsec_tunnels"]
+    assert len(tunnels) == 2
+    assert tunnels[0] == first_tunnel
+    assert sorted(connections[0]["enabled_wan_interface_ids"]) == sorted(tunnel["wan_interface_id"] for tunnel in tunnels)
+
+
+def test_changes_ignore_unmanaged_fields():
+    desired = {
+        "enabled_wan_interface_ids": ["1", "2"],
+        "prismaaccess_edge_location": ["loc-1"],
+        "prismaaccess_qos_cir_mbps": 1,
+        "routing_configs": {"bgp_secret": None, "export_routes": False},
+        "remote_network_groups": [{"name": "Site1_spn", "spn_name": ["spn"],
+                                   "ipsec_tunnels": [{"name": "t1", "wan_interface_id": "1"},
+                                                     {"name": "t2", "wan_interface_id": "2"}]}]
+    }
+    current = {
+        "id": "c1",
+        "enabled_wan_interface_ids": ["2", "1"],
+        "prismaaccess_edge_location": ["loc-1"],
+        "prismaaccess_qos_cir_mbps": 100,
+        "routing_configs": {"bgp_secret": "secret", "export_routes": True},
+        "remote_network_groups": [{"name": "Renamed", "spn_name": ["spn"],
+                                   "ipsec_tunnels": [{"name": "custom", "wan_interface_id": "2"},
+                                                     {"name": "t1", "wan_interface_id": "1"}]}]
+    }
+    assert manage_sase_connection.connection_changes(current, desired) == []
+
+    current["prismaaccess_edge_location"] = ["loc-2"]
+    assert manage_sase_connection.connection_changes(current, desired) == ["prismaaccess_edge_location"]
+    merged = manage_sase_connection.merge_connection(current, desired)
+    assert merged["prismaaccess_edge_location"] == ["loc-1"]
+    assert merged["prismaaccess_qos_cir_mbps"] == 100
+    assert merged["routing_configs"] == {"bgp_secret": "secret", "export_routes": True}
+    assert merged["remote_network_groups"][0]["name"] == "Renamed"
@@ -0,0 +1,94 @@
+"""
+delete_saseconn confirmation, --plan/--apply and --resume (user-023)
+"""
+import json
+import os
+import signal
+import time
+
+SITES = ["Site {}".format(count) for count in range(1, 6)]
+SELECTOR = ",".join(SITES)
+
+
+def requests(controller, method):
+    return sum(endpoint["count"] for endpoint in controller.stats()["endpoints"]
+               if endpoint["method"] == method and endpoint["endpoint"].startswith("/sdwan/api/sites/{id}/prismasase_connections")
+               and "status" not in endpoint["endpoint"])
+
+
+def connect(script, controller):
+    manifest = os.path.join(script.workdir, "manifest.csv")
+    with open(manifest, "w") as f:
+        f.write("site,circuits,pa_location\n")
+        for site in SITES:
+            f.write("{},ALL,loc-1\n".format(site))
+    ok, text = script.run("-A", "config_saseconn", "-M", manifest)
+    assert ok, text
+    assert len(controller.tenant.connections) == len(SITES)
+    controller.reset_stats()
+
+
+def test_multi_site_delete_needs_confirm(script, controller):
+    connect(script, controller)
+
+    ok, text = script.run("-A", "delete_saseconn", "-S", SELECTOR)
+    assert not ok
+    assert "This deletes the SASE Connections of {} sites. Use --confirm to proceed.".format(len(SITES)) in text
+    assert requests(controller, "PUT") == 0 and requests(controller, "DELETE") == 0
+    assert len(controller.tenant.connections) == len(SITES)
+
+    ok, text = script.run("-A", "delete_saseconn", "-S", SELECTOR, "--confirm")
+    assert ok, text
+    assert "Decommission Summary: {} succeeded, 0 failed".format(len(SITES)) in text
+    assert len(controller.tenant.connections) == 0
+
+
+def test_plan_and_apply(script, controller):
+    connect(script, controller)
+    plan = os.path.join(script.workdir, "plan.json")
+    ok, text = script.run("-A", "delete_saseconn", "-S", SELECTOR, "--plan", plan)
+    assert ok, text
+    assert requests(controller, "PUT") == 0 and requests(controller, "DELETE") == 0
+
+    with open(plan) as f:
+        operations = json.load(f)["operations"]
+    assert [operation["method"] for operation in operations] == ["put", "delete"] * len(SITES)
+    assert all(operation["data"]["enabled_wan_interface_ids"] == [] for operation in operations
+               if operation["method"] == "put")
+
+    ok, text = script.run("--apply", plan)
+    assert ok, text
+    assert "Decommission Summary: {} succeeded, 0 failed".format(len(SITES)) in text
+    assert len(controller.tenant.connections) == 0
+    assert requests(controller, "PUT") == len(SITES) and requests(controller, "DELETE") == len(SITES)
+
+    ok, text = script.run("--apply", plan)
+    assert not ok
+    assert "was already applied" in text
+
+    ok, text = script.run("--apply", plan, "--wait", "--force")
+    assert not ok
+    assert "--wait is not supported with delete_saseconn plans." in text
+
+
+def test_interrupted_delete_resumed(script, controller):
+    connect(script, controller)
+
+    controller.latency = 0.2
+    proc = script.start("-A", "delete_saseconn", "-S", SELECTOR, "--confirm", "-W", "1")
+    deadline = time.time() + 60
+    while len(controller.tenant.connections) > len(SITES) - 2:
+        assert proc.poll() is None and time.time() < deadline, proc.stdout.read().decode("utf-8")
+        time.sleep(0.05)
+    proc.send_signal(signal.SIGINT)
+    text = proc.communicate(timeout=60)[0].decode("utf-8")
+    controller.latency = 0.0
+    assert "Run the same command with --resume to continue." in text, text
+    remaining = len(controller.tenant.connections)
+    assert 0 < remaining < len(SITES)
+
+    ok, text = script.run("-A", "delete_saseconn", "-S", SELECTOR, "--confirm", "--resume")
+    assert ok, text
+    assert "INFO: Resuming: {} site(s) already done".format(len(SITES) - remaining) in text
+    assert len(controller.tenant.connections) == 0
+    assert requests(controller, "DELETE") == len(SITES)
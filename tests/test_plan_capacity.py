@@ -0,0 +1,49 @@
+"""
+Existing SASE Connection BW in plan_capacity (user-016)
+"""
+
+
+def existing(text):
+    """
+    Aggregate region -> existing BW from the capacity plan table
+    """
+    usage = {}
+    for line in text.splitlines():
+        fields = line.split()
+        if len(fields) == 5 and fields[0].startswith("region-"):
+            usage[fields[0]] = float(fields[2])
+    return usage
+
+
+def spn_usage(text):
+    usage = {}
+    for line in text.splitlines():
+        fields = line.strip().split(": ")
+        if len(fields) == 2 and "-spn-" in fields[0]:
+            usage[fields[0]] = float(fields[1])
+    return usage
+
+
+def test_multi_location_connection_counted_once(script, controller):
+    ok, text = script.run("-A", "config_saseconn", "-S", "Site 1", "-PL", "loc-0")
+    assert ok, text
+
+    ok, text = script.run("-A", "plan_capacity", "-S", "Site 2")
+    assert ok, text
+    used = existing(text)["region-0"]
+    assert used > 0
+    assert spn_usage(text) == {"region-0-spn-1": used}
+
+    # The connection also uses a PA Location in another aggregate region
+    connection = list(controller.tenant.connections.values())[0]
+    rn = connection["remote_network_groups"][0]
+    connection["prismaaccess_edge_location"] = ["loc-0", "loc-4"]
+    connection["remote_network_groups"] = [rn, dict(rn, name=rn["name"] + "-2", spn_name=["region-1-spn-1"])]
+
+    ok, text = script.run("-A", "plan_capacity", "-S", "Site 2")
+    assert ok, text
+    usage = existing(text)
+    assert usage["region-0"] == used / 2
+    assert usage["region-1"] == used / 2
+    assert sum(usage.values()) == used
+    assert spn_usage(text) == {"region-0-spn-1": used / 2, "region-1-spn-1": used / 2}
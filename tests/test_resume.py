@@ -0,0 +1,119 @@
+"""
+BatchJournal and --resume with --apply (user-020)
+"""
+import json
+import os
+import signal
+import time
+
+SITES = ["Site {}".format(count) for count in range(1, 7)]
+
+
+def connection_posts(controller):
+    return sum(endpoint["count"] for endpoint in controller.stats()["endpoints"]
+               if endpoint["method"] == "POST" and "prismasase_connections" in endpoint["endpoint"]
+               and "query" not in endpoint["endpoint"])
+
+
+def connected_sites(controller):
+    """
+    Site name -> number of SASE Connections
+    """
+    names = {site["id"]: site["name"] for site in controller.tenant.sites}
+    counts = {}
+    for connection in controller.tenant.connections.values():
+        counts[names[connection["site_id"]]] = counts.get(names[connection["site_id"]], 0) + 1
+    return counts
+
+
+def write_plan(script, sites, filename="plan.json"):
+    manifest = os.path.join(script.workdir, "manifest.csv")
+    with open(manifest, "w") as f:
+        f.write("site,circuits,pa_location\n")
+        for site in sites:
+            f.write("{},ALL,loc-1\n".format(site))
+
+    plan = os.path.join(script.workdir, filename)
+    ok, text = script.run("-A", "config_saseconn", "-M", manifest, "--plan", plan)
+    assert ok, text
+    with open(plan) as f:
+        assert len(json.load(f)["operations"]) == len(sites)
+    return plan
+
+
+def interrupt_apply(script, controller, plan, after):
+    """
+    Ctrl-C an --apply run (one worker, slow controller) once after sites have a connection
+    """
+    controller.latency = 0.2
+    proc = script.start("--apply", plan, "-W", "1")
+    deadline = time.time() + 60
+    while len(connected_sites(controller)) < after:
+        assert proc.poll() is None and time.time() < deadline, proc.stdout.read().decode("utf-8")
+        time.sleep(0.05)
+    proc.send_signal(signal.SIGINT)
+    text = proc.communicate(timeout=60)[0].decode("utf-8")
+    controller.latency = 0.0
+    assert "Run the same command with --resume to continue." in text, text
+    return text
+
+
+def test_interrupted_apply_resumed(script, controller):
+    plan = write_plan(script, SITES)
+
+    controller.reset_stats()
+    interrupt_apply(script, controller, plan, after=2)
+    applied = connected_sites(controller)
+    assert 2 <= len(applied) < len(SITES)
+
+    ok, text = script.run("--apply", plan, "--resume")
+    assert ok, text
+    assert "INFO: Resuming: {} site(s) already done, {} to process".format(len(applied),
+                                                                            len(SITES) - len(applied)) in text
+    # Every site is connected once: the sites done before the interruption were not sent again
+    assert connected_sites(controller) == {site: 1 for site in SITES}
+    assert connection_posts(controller) == len(SITES)
+
+    ok, text = script.run("--apply", plan, "--resume")
+    assert ok, text
+    assert "INFO: Resuming: {} site(s) already done, 0 to process".format(len(SITES)) in text
+    assert connection_posts(controller) == len(SITES)
+
+
+def test_changed_plan_starts_over(script, controller):
+    plan = write_plan(script, SITES)
+    interrupt_apply(script, controller, plan, after=2)
+    applied = connected_sites(controller)
+
+    # Re-planning skips the sites already connected, so the new plan has its own journal
+    replan = write_plan(script, [site for site in SITES if site not in applied], filename="replan.json")
+    controller.reset_stats()
+    ok, text = script.run("--apply", replan, "--resume")
+    assert ok, text
+    assert "WARN: No journal found for this run. Starting from the beginning." in text
+    assert connected_sites(controller) == {site: 1 for site in SITES}
+    assert connection_posts(controller) == len(SITES) - len(applied)
+
+
+def test_reapply_needs_force(script, controller):
+    plan = write_plan(script, SITES[:2])
+    ok, text = script.run("--apply", plan)
+    assert ok, text
+
+    controller.reset_stats()
+    ok, text = script.run("--apply", plan)
+    assert not ok
+    assert "was already applied (2 site(s) sent)" in text
+    assert connection_posts(controller) == 0
+
+    # --force sends the whole plan again
+    ok, text = script.run("--apply", plan, "--force")
+    assert "INFO: Applying 2 change(s)" in text
+    assert connection_posts(controller) == 2
+
+    # and starts a fresh journal, so the plan is recorded as applied again
+    controller.reset_stats()
+    ok, text = script.run("--apply", plan)
+    assert not ok
+    assert "was already applied" in text
+    assert connection_posts(controller) == 0
@@ -0,0 +1,100 @@
+"""
+Serve mode request handling (user-018)
+"""
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+TOKEN = "secret"
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+@pytest.fixture
+def server(script, controller):
+    port = free_port()
+    env = dict(os.environ, HOME=script.home, PRISMASASE_CONTROLLER=controller.url,
+               PRISMASASE_AUTH_URL="{}/auth/v1/oauth2/access_token".format(controller.url),
+               PYTHONDONTWRITEBYTECODE="1", SASE_SERVE_TOKEN=TOKEN)
+    proc = subprocess.Popen([sys.executable, "manage_sase_connection.py", "--serve", "--listen",
+                             "127.0.0.1:{}".format(port), "-RL", "0"],
+                            cwd=script.workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            break
+        except OSError:
+            assert proc.poll() is None and time.time() < deadline, "server did not start"
+            time.sleep(0.2)
+
+    yield port
+    proc.terminate()
+    proc.wait()
+
+
+def request(port, method, path, body=None, headers=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    try:
+        conn.putrequest(method, path)
+        for key, value in (headers or {}).items():
+            conn.putheader(key, value)
+        conn.endheaders()
+        if body is not None:
+            conn.send(body)
+        resp = conn.getresponse()
+        return resp.status, json.loads(resp.read().decode("utf-8"))
+    finally:
+        conn.close()
+
+
+def authorization():
+    return {"Authorization": "Bearer {}".format(TOKEN)}
+
+
+def test_unauthorized_body_not_read(server):
+    # Announces a body that never arrives: the 401 must not wait for it
+    status, document = request(server, "POST", "/config_saseconn", headers={"Content-Length": "100"})
+    assert status == 401
+    assert document["output"] == ["ERR: Missing or invalid bearer token"]
+
+
+@pytest.mark.parametrize("length", ["abc", "-1", "1.5"])
+def test_malformed_content_length(server, length):
+    status, document = request(server, "POST", "/config_saseconn",
+                               headers=dict(authorization(), **{"Content-Length": length}))
+    assert status == 400
+    assert document["output"] == ["ERR: Invalid Content-Length: {}".format(length)]
+
+
+def test_oversized_body(server):
+    status, document = request(server, "POST", "/config_saseconn",
+                               headers=dict(authorization(), **{"Content-Length": str(1024 * 1024 + 1)}))
+    assert status == 413
+    assert not document["status"]
+
+
+def test_error_output_without_exiting(server):
+    body = json.dumps({"site": "No Such Site", "pa_location": "loc-1"}).encode("utf-8")
+    status, document = request(server, "POST", "/config_saseconn", body=body,
+                               headers=dict(authorization(), **{"Content-Length": str(len(body)),
+                                                                "Content-Type": "application/json"}))
+    assert status == 422
+    assert any(line.startswith("ERR: Invalid Site Name") for line in document["output"]), document
+    assert "Exiting.." not in document["output"]
+
+    status, document = request(server, "GET", "/health", headers=authorization())
+    assert status == 200
+    assert document["status"]
@@ -0,0 +1,27 @@
+"""
+Site lookup by name (user-006)
+"""
+
+
+def test_site_created_after_cached_list(script, controller):
+    ok, text = script.run("-A", "inventory", "-S", "ALL_SPOKES")
+    assert ok, text
+
+    # A branch onboarded while the full site list is still fresh in the cache
+    controller.tenant.add_sites(1)
+    ok, text = script.run("-A", "config_saseconn", "-S", "Site 20", "-PL", "loc-0")
+    assert ok, text
+    assert "Invalid Site Name" not in text
+    assert "SASE Connection" in text
+
+    ok, text = script.run("-A", "inventory", "-S", "Site 1,Site 20")
+    assert ok, text
+    assert "Inventory of 2 of 2 site(s)" in text
+
+
+def test_unknown_site_rejected(script, controller):
+    ok, text = script.run("-A", "inventory", "-S", "ALL_SPOKES")
+    assert ok, text
+
+    ok, text = script.run("-A", "config_saseconn", "-S", "No Such Site", "-PL", "loc-0")
+    assert "ERR: Invalid Site Name: No Such Site" in text
@@ -0,0 +1,28 @@
+"""
+Fast paths stay light (user-019): the checks of benchmarks/startup_benchmark.py
+"""
+import os
+
+import pytest
+
+import startup_benchmark
+
+
+def script_env(script, controller):
+    return dict(os.environ, HOME=script.home, PRISMASASE_CONTROLLER=controller.url,
+                PRISMASASE_AUTH_URL="{}/auth/v1/oauth2/access_token".format(controller.url),
+                PYTHONDONTWRITEBYTECODE="1")
+
+
+@pytest.mark.parametrize("case", sorted(startup_benchmark.CASES))
+def test_no_heavy_imports(script, controller, case):
+    env = script_env(script, controller)
+    if case == "list_palocations_cached":
+        wall, status, text, modules = startup_benchmark.run(script.workdir, env, startup_benchmark.CASES[case])
+        assert status == 0 and "ERR:" not in text, text
+
+    controller.reset_stats()
+    wall, status, text, modules = startup_benchmark.run(script.workdir, env, startup_benchmark.CASES[case],
+                                                        importtime=True)
+    assert sorted(set(startup_benchmark.HEAVY_MODULES) & modules) == []
+    assert controller.stats()["calls"] == 0
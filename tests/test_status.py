@@ -0,0 +1,49 @@
+"""
+Connection status parsing for --wait and delete_saseconn (user-014)
+"""
+import time
+
+import manage_sase_connection
+
+
+def unrecognised(connection_id):
+    return {"id": connection_id, "health": "ok"}
+
+
+def test_parse_connection_status():
+    status = {"id": "1", "state": "Provisioning",
+              "remote_network_groups": [{"name": "rn", "ipsec_tunnels": [
+                  {"name": "t1", "wan_interface_id": "w1", "status": "UP"},
+                  {"name": "t2", "wan_interface_id": "w2", "status": "down"}]}]}
+    state, states = manage_sase_connection.parse_connection_status(status)
+    assert state == "provisioning"
+    assert states == {"t1": "up", "w1": "up", "t2": "down", "w2": "down"}
+
+    assert manage_sase_connection.parse_connection_status({"state": "active"}) == ("active", {})
+    assert manage_sase_connection.parse_connection_status({"status": "up"}) is None
+    assert manage_sase_connection.parse_connection_status(None) is None
+    status["remote_network_groups"][0]["ipsec_tunnels"][0] = {"name": "t1", "wan_interface_id": "w1", "state": "up"}
+    assert manage_sase_connection.parse_connection_status(status) is None
+
+
+def test_wait_fails_fast_on_unrecognised_payload(script, controller):
+    controller.tenant.connection_status = unrecognised
+    start = time.time()
+    ok, text = script.run("-A", "config_saseconn", "-S", "Site 1", "-PL", "loc-1", "--wait", "--wait_timeout", "60")
+    assert not ok
+    assert "Unrecognised SASE Connection status payload at Site Site 1" in text
+    assert "FAILED: Site 1" in text
+    assert time.time() - start < 30
+
+
+def test_delete_fails_fast_on_unrecognised_payload(script, controller):
+    ok, text = script.run("-A", "config_saseconn", "-S", "Site 1", "-PL", "loc-1")
+    assert ok, text
+
+    controller.tenant.connection_status = unrecognised
+    start = time.time()
+    ok, text = script.run("-A", "delete_saseconn", "-S", "Site 1")
+    assert not ok
+    assert "FAILED: Site 1: unrecognised status payload" in text
+    assert len(controller.tenant.connections) == 1
+    assert time.time() - start < 30